@@ -0,0 +1,189 @@
+"""
+This file contains a store for large data payloads (blobs), which are kept on disk instead of in memory,
+and streamed between nodes in fixed size chunks.
+
+A blob is named by the sha256 of its content, which is computed chunk by chunk while it is written,
+such that a receiver can verify a blob without ever holding all of it in memory.
+Sending reads the blob through an mmap, so the chunks handed to the socket are slices of the mapped file
+instead of copies, and receiving writes every chunk to the file as soon as it arrives.
+A transfer is a sequence of chunk frames of the form
+
+    +-------------+------------+------------+-------------------+------------------+
+    | transfer id |   offset   | total size | sha256 of content | chunk ...        |
+    |   4 bytes   |  8 bytes   |  8 bytes   |     32 bytes      |                  |
+    +-------------+------------+------------+-------------------+------------------+
+
+where the transfer id tells apart transfers which are in progress on the same connection at the same time.
+"""
+__author__ = 'michel'
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/hashlib.html
+import hashlib
+
+# https://docs.python.org/3/library/mmap.html
+# maps a file into memory, such that slices of it can be handed out without reading the file first
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+# -- python community libs -- #
+from typing import Dict, Iterator
+
+CHUNK_SIZE = 64 * 1024
+CHUNK_HEADER = struct.Struct('!IQQ32s')
+
+
+class BlobError(ValueError):
+    pass
+
+
+class Blob:
+    """a reference to a blob, which is what is sent in messages instead of the content itself"""
+    __slots__ = ('digest', 'size')
+
+    def __init__(self, digest: bytes, size: int):
+        self.digest = digest
+        self.size = size
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Blob) and self.digest == other.digest
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __str__(self) -> str:
+        return '<blob %s, %d bytes>' % (self.digest.hex()[:12], self.size)
+
+
+class BlobWriter:
+    """writes an incoming blob to a temporary file, while computing its checksum"""
+    def __init__(self, store: 'BlobStore', blob: Blob):
+        self.store = store
+        self.blob = blob
+        self.received = 0
+        self.checksum = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(dir=store.prepare(), suffix='.part')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk: memoryview):
+        self.file.write(chunk)
+        self.checksum.update(chunk)
+        self.received += len(chunk)
+        if self.received > self.blob.size:
+            self.abort()
+            raise BlobError('received more than the %d bytes of %s' % (self.blob.size, self.blob))
+
+    def is_complete(self) -> bool:
+        return self.received == self.blob.size
+
+    def finish(self) -> Blob:
+        self.file.close()
+        if self.checksum.digest() != self.blob.digest:
+            os.remove(self.path)
+            raise BlobError('checksum mismatch of %s' % self.blob)
+        # renaming is atomic, so a blob is either complete in the store or not there at all
+        os.replace(self.path, self.store.path_of(self.blob))
+        return self.blob
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BlobStore:
+    def __init__(self, directory: str = None):
+        # without a directory, a temporary one is created once the first blob is written, which close removes,
+        # such that the many nodes of a simulation which never see a blob do not leave directories behind
+        self.owned = directory is None
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def prepare(self) -> str:
+        """the directory blobs are written to, which is created now if it is a temporary one"""
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix='blobs-')
+        return self.directory
+
+    def path_of(self, blob: Blob) -> str:
+        return os.path.join(self.prepare(), blob.digest.hex())
+
+    def has(self, blob: Blob) -> bool:
+        return self.directory is not None and os.path.exists(self.path_of(blob))
+
+    def put(self, content: bytes) -> Blob:
+        blob = Blob(hashlib.sha256(content).digest(), len(content))
+        if not self.has(blob):
+            writer = BlobWriter(self, blob)
+            view = memoryview(content)
+            for offset in range(0, len(view), CHUNK_SIZE):
+                writer.write(view[offset:offset + CHUNK_SIZE])
+            writer.finish()
+        return blob
+
+    def read(self, blob: Blob) -> bytes:
+        with open(self.path_of(blob), 'rb') as f:
+            return f.read()
+
+    def chunks(self, blob: Blob) -> Iterator[memoryview]:
+        """the content of the blob in chunks, as slices of the mapped file"""
+        if blob.size == 0:
+            return
+        # every chunk is released before the next one is handed out, since the file can not be unmapped
+        # while a slice of it is still around, so the caller must not keep a reference to a chunk
+        with open(self.path_of(blob), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                for offset in range(0, blob.size, CHUNK_SIZE):
+                    with view[offset:offset + CHUNK_SIZE] as chunk:
+                        yield chunk
+
+    def remove(self, blob: Blob):
+        if self.has(blob):
+            os.remove(self.path_of(blob))
+
+    def close(self):
+        """removes the temporary directory with the blobs in it, where a directory which was given is kept"""
+        if self.owned and self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+class BlobReceiver:
+    """puts together the chunks arriving on one connection into blobs in the store"""
+    def __init__(self, store: BlobStore):
+        self.store = store
+        self.transfers = dict()  # type: Dict[int, BlobWriter]
+
+    def receive(self, payload: bytes):
+        """handles a chunk frame, and returns the blob when its last chunk has arrived"""
+        view = memoryview(payload)
+        transfer_id, offset, size, digest = CHUNK_HEADER.unpack_from(view, 0)
+        writer = self.transfers.get(transfer_id)
+        if writer is None:
+            writer = BlobWriter(self.store, Blob(digest, size))
+            self.transfers[transfer_id] = writer
+        if offset != writer.received:
+            self.abort(transfer_id)
+            raise BlobError('chunk at %d arrived while expecting %d' % (offset, writer.received))
+
+        try:
+            writer.write(view[CHUNK_HEADER.size:])
+        except BlobError:
+            # the writer has removed its file already, and the later chunks of the transfer are refused
+            del self.transfers[transfer_id]
+            raise
+        if writer.is_complete():
+            del self.transfers[transfer_id]
+            return writer.finish()
+        return None
+
+    def abort(self, transfer_id: int = None):
+        """aborts one transfer, or all of them when the connection has been closed"""
+        for tid in ([transfer_id] if transfer_id is not None else list(self.transfers)):
+            writer = self.transfers.pop(tid, None)
+            if writer is not None:
+                writer.abort()
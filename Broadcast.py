@@ -0,0 +1,97 @@
+"""
+This file contains a broadcast layer, which spreads a message from one server to all the servers by having them
+relay it, instead of the origin sending it to every other server itself, which costs the origin N-1 copies.
+Every server sends at most fanout copies of a message, whatever the number of servers, over one of the overlays
+- tree: the members, ordered by address and starting from the origin, form a tree where every server has fanout
+  children, and every server forwards the message to its own children. Every server gets the message exactly once,
+  after at most log_fanout(N) hops, eg. for 13 servers with a fanout of 3, where server 4 broadcasts
+
+                           4
+               ____________|____________
+              |            |            |
+              5            6            7
+           ___|___      ___|___      ___|___
+          |   |   |    |   |   |    |   |   |
+          8   9  10   11  12   0    1   2   3
+
+  The servers only agree on the tree as long as they agree on the membership, which gossip makes them do in the end
+- epidemic: every server forwards the message to fanout randomly chosen members the first time it gets it.
+  It does not depend on the servers agreeing on anything, but a share of about e^-(fanout) of the servers is missed
+- direct: the origin sends the message to every member, which is only kept for comparison, see BroadcastBenchmark.py
+Copies reaching a server which already got the message are dropped by the message id.
+A server which was missed, eg. because a message was lost or a relay was down, gets the data by the pull
+of the periodic digest exchange in SimpleServer.sync_data, which also replaces the older value of a key it holds,
+since the newest version of every key wins, see SimpleServer.merge.
+"""
+__author__ = 'michel'
+from Messages import ServerInfo
+from Gossip import Membership
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/random.html
+import random
+
+# https://docs.python.org/3/library/collections.html#collections.OrderedDict
+# a dictionary which remembers insertion order, such that the oldest message ids can be forgotten first
+from collections import OrderedDict
+
+# -- python community libs -- #
+from typing import Dict, List
+
+MODES = ['tree', 'epidemic', 'direct']
+
+
+class Broadcaster:
+    def __init__(self, membership: Membership, mode: str = 'tree', fanout: int = 3, remember: int = 4096,
+                 rng: random.Random = None):
+        if mode not in MODES:
+            raise ValueError('unknown broadcast mode %r' % mode)
+        self.membership = membership
+        self.me = membership.me
+        self.mode = mode
+        self.fanout = fanout  # the number of copies a server sends of every message
+        self.rng = rng or random.Random()
+        # the ids of the messages seen most recently, with the number of hops their first copy took to get here,
+        # where a copy arriving after its id is forgotten is taken as new
+        self.seen = OrderedDict()  # type: Dict[int, int]
+        self.remember = remember
+        self.duplicates = 0
+        # the members in address order and their positions in it, rebuilt when the members change
+        self.ordered = []  # type: List[ServerInfo]
+        self.positions = dict()  # type: Dict[ServerInfo, int]
+
+    def originate(self) -> int:
+        """the id of a new message broadcast by this server"""
+        msg_id = self.rng.getrandbits(64)
+        self.first_time(msg_id)
+        return msg_id
+
+    def first_time(self, msg_id: int, hops: int = 0) -> bool:
+        """whether this is the first copy of the message, which is the only one to be handled and relayed"""
+        if msg_id in self.seen:
+            self.duplicates += 1
+            return False
+        self.seen[msg_id] = hops
+        while len(self.seen) > self.remember:
+            self.seen.popitem(last=False)
+        return True
+
+    def targets(self, origin: ServerInfo, sender: ServerInfo) -> List[ServerInfo]:
+        """the members this server sends its copies of a message to"""
+        if self.mode == 'direct':
+            return [member for member in self.membership.members() if member != self.me] if origin == self.me else []
+        if self.mode == 'tree' and origin in self.membership:
+            return self.children(origin)
+        return self.membership.sample(self.fanout, {self.me, sender, origin})
+
+    def children(self, origin: ServerInfo) -> List[ServerInfo]:
+        """the children of this server, in the tree of the members rooted at the origin"""
+        if len(self.ordered) != len(self.membership):
+            self.ordered = sorted(self.membership.members(), key=lambda member: (member.ip, member.port))
+            self.positions = {member: i for i, member in enumerate(self.ordered)}
+        size = len(self.ordered)
+        root = self.positions[origin]
+        # the position of this server in the tree, when the ordered members are rotated to start at the origin
+        position = (self.positions[self.me] - root) % size
+        first = position * self.fanout + 1
+        return [self.ordered[(root + child) % size] for child in range(first, min(first + self.fanout, size))]
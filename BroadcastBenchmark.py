@@ -0,0 +1,108 @@
+"""
+This file contains a benchmark of the broadcast overlays of Broadcast.py, which starts clusters of SimpleServers
+over the in-memory LoopbackTransport, lets one of them publish a value, and measures
+- the share of servers the value reached, and the hops it took to reach the last of them
+- an estimate of the time until every server has the value, where every hop takes the latency plus the time
+  the busiest server takes to send its copies at the given bandwidth
+- the bytes sent by the origin, and by the busiest server and the average server (egress)
+- the number of copies which arrived at a server that already had the value
+for the tree and epidemic overlays, and for the origin sending the value directly to every server, eg.
+    python BroadcastBenchmark.py --sizes 10 100 500 --payload 10000 --loss 0.01
+
+The periodic digest sync is turned off, such that only the broadcast itself is measured,
+where a real cluster pulls the values that a broadcast missed with the next digest exchange.
+The time is estimated instead of measured, since all the servers share the one cpu of this process,
+so the wall clock time measures how long it takes to handle every copy one after the other.
+"""
+__author__ = 'michel'
+from Messages import *
+from SimpleAsyncServer import SimpleServer
+from Broadcast import MODES
+from Transport import LoopbackTransport, constant
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+import argparse
+import random
+
+
+def run(size: int, mode: str, fanout: int, payload: int, latency: float, bandwidth: float, loss: float, seed: int,
+        loop) -> dict:
+    random.seed(seed)
+    # the value is encoded on every hop, such that the bytes sent are counted
+    transport = LoopbackTransport(loop, constant(latency), loss, seed=seed, serialize=True)
+    infos = [ServerInfo('10.0.%d.%d' % (i // 256, i % 256), 5000) for i in range(size)]
+    # every server knows every other server from the start, and neither gossips nor syncs during the run
+    servers = [SimpleServer(info, infos, loop, dict(), sync_interval=3600, gossip_interval=3600, send_delay=0,
+                            transport=transport, broadcast=mode, broadcast_fanout=fanout)
+               for info in infos]
+    # lets the first digests and gossip, which are sent when the servers start, go by before measuring
+    delivered = -1
+    while transport.delivered != delivered:
+        delivered = transport.delivered
+        loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+    for server in servers:
+        server.metrics.bytes_out.pop('BroadcastMessage', None)
+
+    origin = servers[size // 2]
+    started = loop.time()
+    origin.publish({'news': 'x' * payload})
+    delivered = transport.delivered
+    # waits for the copies to stop arriving, which for a broadcast missing some servers is after the last hop
+    while loop.time() - started < 30.0:
+        loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+        if all('news' in server.data for server in servers):
+            break
+        if loop.time() - started > 0.5 and transport.delivered == delivered:
+            break
+        delivered = transport.delivered
+    # the last copies, which are dropped as duplicates, are in flight for a little while longer
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+
+    sent = [server.metrics.bytes_out.get('BroadcastMessage', 0) for server in servers]
+    # the hops the first copy of the message took to reach every server, the origin having it after none
+    msg_id = next(reversed(origin.broadcaster.seen))
+    hops = max(server.broadcaster.seen.get(msg_id, 0) for server in servers)
+    result = {
+        'nodes': size,
+        'mode': mode,
+        'reached': sum(1 for server in servers if 'news' in server.data) / size,
+        'hops': hops,
+        # on every hop a server sends all of its copies before the last of them is on its way
+        'estimate_ms': hops * (latency + max(sent) / bandwidth) * 1000,
+        'origin_bytes': origin.metrics.bytes_out.get('BroadcastMessage', 0),
+        'max_node_bytes': max(sent),
+        'mean_node_bytes': sum(sent) / size,
+        'duplicates': sum(server.broadcaster.duplicates for server in servers),
+    }
+    for server in servers:
+        server.kill()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='benchmarks broadcasting a value to clusters of SimpleServers')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--fanout', type=int, default=3)
+    parser.add_argument('--payload', type=int, default=10000, help='bytes of the value broadcast')
+    parser.add_argument('--latency', type=float, default=0.001, help='seconds every message takes to arrive')
+    parser.add_argument('--bandwidth', type=float, default=125e6, help='bytes per second a server sends')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability that a message is lost')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    print('%6s %9s %8s %5s %12s %14s %16s %16s %11s' % (
+        'nodes', 'mode', 'reached', 'hops', 'estimate ms', 'origin bytes', 'max node bytes', 'mean node bytes',
+        'duplicates'))
+    for size in args.sizes:
+        for mode in args.modes:
+            result = run(size, mode, args.fanout, args.payload, args.latency, args.bandwidth, args.loss, args.seed,
+                         loop)
+            print('%6d %9s %8.3f %5d %12.2f %14d %16d %16.0f %11d' % (
+                size, mode, result['reached'], result['hops'], result['estimate_ms'], result['origin_bytes'],
+                result['max_node_bytes'], result['mean_node_bytes'], result['duplicates']))
+    loop.close()
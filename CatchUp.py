@@ -0,0 +1,129 @@
+"""
+This file contains the parts of the catch-up protocol, by which a replica which has fallen behind the other members
+of its bottom level group, eg. because it has just joined, was restarted, or missed a write whose data is gone,
+gets the data it lacks from one of them, instead of only getting a key once it is written again.
+
+Every member numbers the entries of its commit log of a partition in the order it committed them.
+The replica advertises the index of the member's log it caught up to the last time, and the member sends
+- the entries of its commit log after that index, when the log still reaches back that far,
+  which is the common case for a replica which only missed a few writes
+- a snapshot of the whole partition otherwise, eg. for a new replica, whose data is encoded as the records of
+  the write-ahead log and compressed with zlib as one stream, see WriteAheadLog.py
+Both are pulled one page at a time, where every page is a request answered on the same connection,
+such that the replica sets the pace, and a transfer which is cut off is started over with the next closest member.
+The member tells the index of its log when the transfer started, which the next catch-up from it starts after.
+
+    replica                               closest member
+       |--- CatchUpRequest(index, 0) ----->|    decides between log entries and a snapshot
+       |<-- CatchUpResponse(0) ------------|
+       |--- CatchUpRequest(index, 1) ----->|
+       |<-- CatchUpResponse(1, index, done)|
+
+The member takes the bytes of every page out of a token bucket before sending it, which bounds the rate of all
+the transfers it serves together, such that the rounds of the clients are not starved by a replica catching up.
+"""
+__author__ = 'michel'
+from DataRepMessages import Data
+from DataRepCodec import CodecError
+from WriteAheadLog import encode_record, decode_records
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/zlib.html#zlib.compressobj
+# a compressor which keeps its state between calls, such that a snapshot is compressed as one stream
+import zlib
+
+# -- python community libs -- #
+from typing import Iterator, List, Tuple
+
+
+class TokenBucket:
+    """hands out rate bytes per second, and up to burst bytes at once after having been idle"""
+    def __init__(self, rate: float, burst: float, loop):
+        self.rate = rate  # 0 for no limit
+        self.burst = burst
+        self.loop = loop
+        self.tokens = burst
+        self.updated = loop.time()
+
+    @asyncio.coroutine
+    def take(self, amount: int):
+        """
+        waits until amount bytes may be sent. An amount larger than the bucket is taken as a debt,
+        which the next takers wait for, such that a large page is not stuck forever
+        """
+        if self.rate <= 0:
+            return
+        now = self.loop.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            yield from asyncio.sleep(-self.tokens / self.rate, loop=self.loop)
+
+
+def entry_pages(entries: List[Data], page_size: int) -> Iterator[Tuple[List[Data], bool]]:
+    """the entries in pages of about page_size bytes of content, and whether the page is the last one"""
+    page = []
+    size = 0
+    for data in entries:
+        if size >= page_size:
+            yield page, False
+            page = []
+            size = 0
+        page.append(data)
+        size += len(data.content)
+    yield page, True
+
+
+def snapshot_pages(store: List[Data], page_size: int,
+                   level: int = 1) -> Iterator[Tuple[bytes, List[Data], bool]]:
+    """
+    the data as one compressed stream, in pages of about page_size bytes, where every page comes with the data
+    which has gone into the compressor since the page before, and whether it is the last one.
+    The compressor holds back some of its input, so the data of a page is only sure to be decodable from
+    the pages up to and including the next one, which is why any blobs of it are to be sent ahead of the page
+    """
+    compressor = zlib.compressobj(level)
+    parts = []
+    size = 0
+    fed = []
+    for data in store:
+        chunk = compressor.compress(encode_record(data))
+        fed.append(data)
+        if len(chunk) > 0:
+            parts.append(chunk)
+            size += len(chunk)
+            if size >= page_size:
+                yield b''.join(parts), fed, False
+                parts = []
+                size = 0
+                fed = []
+    parts.append(compressor.flush())
+    yield b''.join(parts), fed, True
+
+
+class SnapshotReader:
+    """decompresses the pages of a snapshot, and decodes the records in them as soon as they are complete"""
+    def __init__(self):
+        self.decompressor = zlib.decompressobj()
+        self.pending = b''  # the start of a record which continues in the next page
+        self.records = 0
+
+    def feed(self, page: bytes) -> List[Data]:
+        """the records completed by the page, raises CodecError when the stream can not be decompressed"""
+        try:
+            self.pending += self.decompressor.decompress(page)
+        except zlib.error as e:
+            # the replica goes on with the next member, as for any other malformed message
+            raise CodecError('the snapshot is corrupted: %s' % e)
+        records, end = decode_records(memoryview(self.pending))
+        self.pending = self.pending[end:]
+        self.records += len(records)
+        return records
+
+    def finished(self) -> bool:
+        """whether the whole stream has been decoded, which is not the case when it was corrupted"""
+        return self.decompressor.eof and len(self.pending) == 0
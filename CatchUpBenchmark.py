@@ -0,0 +1,122 @@
+"""
+This file contains a benchmark of how long a replica takes to rejoin its group, for a group of three DataRepNodes
+on localhost, where two of them hold the state and the third one catches up with them, see CatchUp.py
+- snapshot: the replica is new and holds nothing, so it gets a compressed snapshot of the whole state
+- entries: the replica was down for the last --missed writes, so it only gets those from the commit log
+While the replica catches up, a client keeps writing to the group, and the latency of its writes is compared
+with the latency when nobody is catching up, which shows how much the transfer slows down the rounds,
+and how much the rate limit of the transfers helps.
+
+run it with
+    python CatchUpBenchmark.py --megabytes 1024 --rate 64
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+from DataRepServer import DataRepNode
+from DataRepClient import DataRepClient
+from Metrics import Histogram
+import Topology
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/argparse.html
+import argparse
+import os
+
+# -- python community libs -- #
+from typing import List, Tuple
+
+MEGABYTE = 1024 * 1024
+
+
+def make_state(megabytes: int, value_size: int) -> List[Data]:
+    """values of random hex digits, which compress to about half their size, one millisecond of versions apart"""
+    first = now_ns()
+    return [Data(os.urandom(value_size // 2).hex(), first + i * 1000000, key='key %d' % i)
+            for i in range(megabytes * MEGABYTE // value_size)]
+
+
+@asyncio.coroutine
+def write_while(client: DataRepClient, catching_up: asyncio.Future, latencies: Histogram, loop, concurrency: int = 8):
+    """keeps writing until the catch-up is done"""
+    @asyncio.coroutine
+    def worker(n: int):
+        i = 0
+        while not catching_up.done():
+            started = loop.time()
+            yield from client.write('foreground %d' % i, key='foreground %d' % n)
+            latencies.record(loop.time() - started)
+            i += 1
+    yield from asyncio.gather(*[worker(n) for n in range(concurrency)], loop=loop)
+
+
+def run(state: List[Data], held: int, logged: int, rate: float, loop,
+        base_port: int = 23100) -> Tuple[float, int, Histogram, Histogram]:
+    """
+    returns the seconds the replica took to catch up, the bytes of the pages it got,
+    and the latencies of the writes while it did and before it started
+    """
+    servers = [ServerInfo('127.0.0.1', base_port + i) for i in range(3)]
+    structures = Topology.network_structures(servers)
+    nodes = [DataRepNode(server, structure, loop, None, send_delay=0, catch_up_rate=rate * MEGABYTE,
+                         commit_log_size=logged + 65536, heartbeat_interval=5.0)
+             for server, structure in zip(servers, structures)]
+    # the nodes holding the state share the same data objects, such that the state only takes up memory once
+    for node in nodes[:2]:
+        node.apply(state[:-logged] if logged > 0 else state, logged=False)
+        if logged > 0:
+            node.apply(state[-logged:])
+    nodes[2].apply(state[:held], logged=False)
+    if held > 0:
+        # the replica caught up from both of them when they held what it holds, see DataRepNode.cursors
+        for node in nodes[:2]:
+            nodes[2].cursors[('', node.info)] = (node.log_id, held)
+
+    client = DataRepClient(servers[:2], loop)
+    before = Histogram()
+    loop.run_until_complete(write_while(client, asyncio.async(asyncio.sleep(1.0, loop=loop), loop=loop), before, loop))
+
+    during = Histogram()
+    started = loop.time()
+    catching_up = nodes[2].catch_up()
+    loop.run_until_complete(asyncio.gather(catching_up, write_while(client, catching_up, during, loop), loop=loop))
+    seconds = loop.time() - started
+    if not all(catching_up.result()) or len(nodes[2].store) < len(state):
+        print('the replica did not catch up, it holds %d of %d keys' % (len(nodes[2].store), len(state)))
+
+    received = nodes[2].metrics.bytes_in.get('CatchUpResponse', 0) + nodes[2].metrics.bytes_in.get('BlobChunk', 0)
+    client.close()
+    for node in nodes:
+        node.kill()
+    # lets the closed connections finish up before the next run
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    return seconds, received, during, before
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='measures how long a replica takes to rejoin its group')
+    parser.add_argument('--megabytes', type=int, default=256, help='megabytes of values held by the group')
+    parser.add_argument('--value-size', type=int, default=1000, help='bytes of every value')
+    parser.add_argument('--rate', type=float, default=64.0, help='megabytes per second a node sends transfers at')
+    parser.add_argument('--missed', type=int, default=10000, help='number of writes the lagging replica missed')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    state = make_state(args.megabytes, args.value_size)
+    logged = args.missed
+    runs = [('snapshot', 0, 0, 0.0), ('snapshot', 0, 0, args.rate),
+            ('entries', len(state) - args.missed, logged, 0.0), ('entries', len(state) - args.missed, logged, args.rate)]
+
+    print('%d keys, %d MB of values' % (len(state), args.megabytes))
+    print('%9s %10s %10s %10s %10s %14s %14s' % ('mode', 'limit MB/s', 'seconds', 'MB/s', 'wire MB',
+                                                 'write p50 ms', 'write p99 ms'))
+    for mode, held, logged_entries, rate in runs:
+        seconds, received, during, before = run(state, held, logged_entries, rate, loop)
+        print('%9s %10s %10.2f %10.1f %10.1f %6.1f (%5.1f) %6.1f (%5.1f)' % (
+            mode, '%.0f' % rate if rate > 0 else 'off', seconds, (len(state) - held) * args.value_size / MEGABYTE / seconds,
+            received / MEGABYTE, during.percentile(0.5) * 1000, before.percentile(0.5) * 1000,
+            during.percentile(0.99) * 1000, before.percentile(0.99) * 1000))
+    print('the write latencies in parentheses are from before the replica started catching up')
+    loop.close()
@@ -0,0 +1,66 @@
+"""
+This file contains a micro benchmark comparing the binary codec in DataRepCodec.py with pickle.
+For every message type and a range of payload sizes it measures encode and decode throughput,
+and the number of bytes which ends up on the wire.
+
+run it with
+    python CodecBenchmark.py [--iterations number of iterations]
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+import DataRepCodec
+
+# -- python core libs -- #
+# http://www.diveintopython3.net/serializing.html
+import pickle
+
+# https://docs.python.org/3/library/timeit.html
+import timeit
+
+# https://docs.python.org/3/library/argparse.html
+import argparse
+
+# -- python community libs -- #
+from typing import Callable
+
+
+def throughput(fn: Callable, iterations: int) -> float:
+    """returns the number of calls per second, taking the best of a few repeats to leave out noise"""
+    best = min(timeit.repeat(fn, number=iterations, repeat=3))
+    return iterations / best
+
+
+def benchmark(msg, iterations: int):
+    tag, encoded = DataRepCodec.encode(msg)
+    pickled = pickle.dumps(msg)
+
+    return {
+        'pickle': (throughput(lambda: pickle.dumps(msg), iterations),
+                   throughput(lambda: pickle.loads(pickled), iterations),
+                   len(pickled)),
+        'codec': (throughput(lambda: DataRepCodec.encode(msg), iterations),
+                  throughput(lambda: DataRepCodec.decode(tag, encoded), iterations),
+                  len(encoded)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='compares the encode and decode throughput of the codec with pickle')
+    parser.add_argument('--iterations', type=int, default=20000, help='number of encodes and decodes per measurement')
+    iterations = parser.parse_args().iterations
+    sender = ServerInfo('127.0.0.1', 5001)
+
+    messages = [
+        ('QuorumResponse', QuorumResponse(sender, True, 1, 7)),
+        ('WriteDataRequest', WriteDataRequest(sender, 42, 1, 7)),
+    ]
+    for size in [16, 1024, 64 * 1024]:
+        data = Data(content='x' * size, version_number=42)
+        messages.append(('QuorumRequest %dB' % size, QuorumRequest(sender, [DataRef.of(data)], 1, 7)))
+        messages.append(('WriteDataRequest %dB' % size, WriteDataRequest(sender, 42, 1, 7, batch=[data])))
+        messages.append(('ClientDataMessage %dB' % size, ClientDataMessage(sender, data)))
+
+    print('%-26s %-7s %14s %14s %10s' % ('message', 'codec', 'encode/s', 'decode/s', 'bytes'))
+    for name, msg in messages:
+        for codec, (encodes, decodes, size) in sorted(benchmark(msg, iterations).items()):
+            print('%-26s %-7s %14.0f %14.0f %10d' % (name, codec, encodes, decodes, size))
@@ -0,0 +1,124 @@
+"""
+This file contains a pool of long lived connections to other servers.
+Instead of doing a tcp handshake for every single message, a server asks the pool for a connection to the recipient,
+and the pool either hands back an already open connection or lazily opens a new one.
+Connections which has not been used for a while are closed, and the pool never holds more than a given number
+of connections, closing the least recently used one when it has to make room for a new.
+The connections are opened over a transport, which is tcp unless another one is given, see Transport.py.
+"""
+__author__ = 'michel'
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/collections.html#collections.OrderedDict
+# a dictionary which remembers insertion order, such that it can be used as a 'least recently used' list
+from collections import OrderedDict
+
+# -- python community libs -- #
+from typing import Dict, Any, Callable
+
+from Framing import FramedConnection, Frame
+from Transport import TcpTransport
+
+
+class ConnectionPool:
+    def __init__(self, loop, handler: Callable, max_connections: int = 64, idle_timeout: float = 30.0,
+                 transport=None, local=None):
+        self.loop = loop
+        self.transport = transport or TcpTransport(loop)
+        self.local = local  # the address of the server owning the pool, which the connections are opened from
+        # frames which the recipients sends back on our connections, other than responses, are given to the handler
+        self.handler = handler
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        # recipient -> connection, ordered from least to most recently used
+        self.connections = OrderedDict()  # type: Dict[Any, FramedConnection]
+        # one lock per recipient, such that two concurrent sends doesn't open two connections,
+        # which is dropped together with the connection
+        self.locks = dict()  # type: Dict[Any, asyncio.Lock]
+        self.evict_handle = loop.call_later(idle_timeout, self.evict_idle)
+        self.closed = False
+
+    @asyncio.coroutine
+    def get_connection(self, recipient) -> FramedConnection:
+        if self.closed:
+            raise ConnectionError('the connection pool has been closed')
+        conn = self.connections.get(recipient)
+        if conn is not None and conn.is_closed():
+            self.drop(recipient)
+            conn = None
+
+        if conn is None:
+            # make room for the new connection by closing the least recently used ones
+            while len(self.connections) >= self.max_connections:
+                self.drop(next(iter(self.connections)))
+
+            conn = yield from self.transport.connect(self.local, recipient, self.handler)
+            self.connections[recipient] = conn
+
+        self.connections.move_to_end(recipient)
+        conn.last_used = self.loop.time()
+        return conn
+
+    def open_connection(self, recipient) -> FramedConnection:
+        """the connection to the recipient if one is already open, without waiting for one to be opened"""
+        conn = self.connections.get(recipient)
+        if conn is None or conn.is_closed():
+            return None
+        self.connections.move_to_end(recipient)
+        return conn
+
+    @asyncio.coroutine
+    def connection_to(self, recipient) -> FramedConnection:
+        lock = self.locks.get(recipient)
+        if lock is None:
+            lock = self.locks[recipient] = asyncio.Lock(loop=self.loop)
+        with (yield from lock):
+            return (yield from self.get_connection(recipient))
+
+    @asyncio.coroutine
+    def send(self, recipient, tag: int, payload: bytes):
+        conn = yield from self.connection_to(recipient)
+        try:
+            yield from conn.send(tag, payload)
+        except ConnectionError:
+            # the pooled connection died since it was last used,
+            # so we reconnect once and try again before giving up
+            self.drop(recipient)
+            conn = yield from self.connection_to(recipient)
+            yield from conn.send(tag, payload)
+
+    @asyncio.coroutine
+    def request(self, recipient, tag: int, payload: bytes, timeout: float = None) -> Frame:
+        conn = yield from self.connection_to(recipient)
+        return (yield from conn.request(tag, payload, timeout))
+
+    def drop(self, recipient):
+        conn = self.connections.pop(recipient, None)
+        if conn is not None:
+            conn.close()
+        self.forget_lock(recipient)
+
+    def forget_lock(self, recipient):
+        # a lock which is held belongs to a connection being opened, which has to stay the only one
+        lock = self.locks.get(recipient)
+        if lock is not None and not lock.locked():
+            del self.locks[recipient]
+
+    def evict_idle(self):
+        deadline = self.loop.time() - self.idle_timeout
+        for recipient, conn in list(self.connections.items()):
+            if (conn.last_used < deadline and not conn.pending) or conn.is_closed():
+                self.drop(recipient)
+        # the recipients which could not be reached have a lock but no connection
+        for recipient in [recipient for recipient in self.locks if recipient not in self.connections]:
+            self.forget_lock(recipient)
+        self.evict_handle = self.loop.call_later(self.idle_timeout / 2, self.evict_idle)
+
+    def close(self):
+        self.closed = True
+        self.evict_handle.cancel()
+        for recipient in list(self.connections):
+            self.drop(recipient)
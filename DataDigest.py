@@ -0,0 +1,81 @@
+"""
+This file contains a summary of a key/value dataset, which lets two servers find out where their datasets differ
+without sending the datasets to each other.
+
+The keys are spread over a fixed number of buckets, and every bucket has a hash which is the xor of
+the hashes of the (key, value) pairs in it. The xor of all bucket hashes is the root hash of the dataset.
+- two datasets are equal when their root hashes are equal, which is the common case and costs nothing to check
+- otherwise only the buckets with different hashes has to be sent
+Since xor is its own inverse, an insert, update or delete changes a bucket hash and the root hash in constant time,
+instead of having to rehash the whole bucket.
+"""
+__author__ = 'michel'
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/hashlib.html
+# the builtin hash of strings differs between processes, so a stable hash is needed when comparing across servers
+import hashlib
+
+# https://docs.python.org/3/library/zlib.html#zlib.crc32
+import zlib
+
+# -- python community libs -- #
+from typing import Dict, List, Set, Any
+
+
+def item_hash(key: str, value: Any) -> int:
+    digest = hashlib.sha1(repr((key, value)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class DataDigest:
+    def __init__(self, buckets: int = 1024):
+        self.root = 0
+        self.buckets = [0] * buckets
+        # the keys of every bucket, such that the contents of a bucket can be found without scanning the dataset
+        self.bucket_keys = [set() for i in range(buckets)]  # type: List[Set[str]]
+
+    def bucket_of(self, key: str) -> int:
+        return zlib.crc32(key.encode('utf-8')) % len(self.buckets)
+
+    def toggle(self, bucket: int, key: str, value: Any):
+        h = item_hash(key, value)
+        self.buckets[bucket] ^= h
+        self.root ^= h
+
+    def put(self, key: str, value: Any, old_value: Any = None, replaced: bool = False):
+        """
+        updates the digest with a pair which has been inserted into the dataset,
+        where replaced tells whether the key was already in the dataset with old_value
+        """
+        bucket = self.bucket_of(key)
+        if replaced:
+            self.toggle(bucket, key, old_value)
+        self.toggle(bucket, key, value)
+        self.bucket_keys[bucket].add(key)
+
+    def remove(self, key: str, value: Any):
+        bucket = self.bucket_of(key)
+        self.toggle(bucket, key, value)
+        self.bucket_keys[bucket].discard(key)
+
+    def differing_buckets(self, root: int, buckets: List[int]) -> List[int]:
+        """returns the buckets which differ from the ones of another digest"""
+        if len(buckets) != len(self.buckets):
+            raise ValueError('digests with %d and %d buckets can not be compared' % (len(buckets), len(self.buckets)))
+        if root == self.root:
+            return []
+        return [i for i, (mine, other) in enumerate(zip(self.buckets, buckets)) if mine != other]
+
+    def keys_in(self, buckets: List[int]) -> Set[str]:
+        keys = set()
+        for bucket in buckets:
+            keys |= self.bucket_keys[bucket]
+        return keys
+
+    @staticmethod
+    def of(data: Dict[str, Any], buckets: int = 1024) -> 'DataDigest':
+        digest = DataDigest(buckets)
+        for key, value in data.items():
+            digest.put(key, value)
+        return digest
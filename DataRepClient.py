@@ -0,0 +1,180 @@
+"""
+This file contains a client for a tree of DataRepNodes, which writes and reads data through a few entry nodes, eg.
+
+    client = DataRepClient([ServerInfo('127.0.0.1', 5001), ServerInfo('127.0.0.1', 5002)], loop)
+    accepted = yield from client.write('hello', key='greeting')
+    data = yield from client.read('greeting')
+
+Every write and read is sent as a request over a long lived connection to an entry node, and the node answers
+on the same connection once the quorum is done, where the answer is matched with the request by its correlation id,
+see Framing.py. So the client does not listen on an address of its own, and works behind a NAT, and many requests
+are in flight on one connection at a time (pipelining), instead of one connection per request.
+    client                     entry node
+       |---- write #1 ------------>|
+       |---- write #2 ------------>|
+       |---- read  #3 ------------>|
+       |<--- answer #2 ------------|    the answers come in the order the quorums finish
+       |<--- answer #1 ------------|
+       |<--- answer #3 ------------|
+
+Every request goes to the entry node with the fewest requests in flight, such that a slow node gets less of the load,
+and a node which can not be reached is left out for a while, and the request is sent to the next one instead.
+The number of requests in flight is bounded, such that a client sending faster than the tree commits waits
+instead of piling up requests.
+
+Contents larger than a chunk which are read are streamed ahead of the answer into a blob store of the client,
+in blob_directory or a temporary directory, see BlobStore.py and content_of.
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+from ConnectionPool import ConnectionPool
+from Framing import FramedConnection, Frame
+from BlobStore import BlobStore, BlobReceiver
+from Metrics import log
+import DataRepCodec
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+import itertools
+import json
+
+# -- python community libs -- #
+from typing import Dict, List, Optional, Tuple
+
+
+class NoEntryNode(ConnectionError):
+    """none of the entry nodes could be reached"""
+    pass
+
+
+class DataRepClient:
+    def __init__(self, nodes: List[ServerInfo], loop, info: ServerInfo = None, timeout: float = 30.0,
+                 max_in_flight: int = 1024, retry_after: float = 5.0, transport=None, blob_directory: str = None):
+        if len(nodes) == 0:
+            raise ValueError('a client needs at least one entry node')
+        self.nodes = list(nodes)
+        self.positions = dict((node, i) for i, node in enumerate(nodes))  # type: Dict[ServerInfo, int]
+        self.loop = loop
+        # the address the messages are sent from, which the nodes only use to tell the clients apart in their logs
+        self.info = info or ServerInfo('0.0.0.0', 0)
+        self.timeout = timeout  # seconds a request waits for its answer
+        self.in_flight = dict((node, 0) for node in nodes)  # type: Dict[ServerInfo, int]
+        self.slots = asyncio.Semaphore(max_in_flight, loop=loop)
+        # node -> the time until which the node is left out, after it could not be reached
+        self.down_until = dict()  # type: Dict[ServerInfo, float]
+        self.retry_after = retry_after
+        # one long lived connection per entry node, which every request to the node is pipelined over
+        self.pool = ConnectionPool(loop, self.handle_frame, max_connections=len(nodes), transport=transport,
+                                   local=self.info)
+        self.blob_directory = blob_directory
+        self.blobs = None  # type: BlobStore  # only created once the first blob arrives
+        self.receivers = dict()  # type: Dict[FramedConnection, BlobReceiver]
+        self.turns = itertools.count()
+        self.last_version = 0
+
+    def handle_frame(self, conn: FramedConnection, frame: Frame):
+        # the answers are matched with their requests by the connection, so only the blobs ahead of them come here
+        if frame.tag == BLOB_CHUNK_TAG:
+            if self.blobs is None:
+                self.blobs = BlobStore(self.blob_directory)
+            receiver = self.receivers.get(conn)
+            if receiver is None:
+                receiver = self.receivers[conn] = BlobReceiver(self.blobs)
+                conn.add_close_callback(self.connection_closed)
+            receiver.receive(frame.payload)
+
+    def pick(self, tried: List[ServerInfo]) -> Optional[ServerInfo]:
+        """the entry node with the fewest requests in flight, taking turns between the ones with as few"""
+        now = self.loop.time()
+        candidates = [node for node in self.nodes if node not in tried and self.down_until.get(node, 0.0) <= now]
+        if len(candidates) == 0:
+            # when every node seems to be down, the ones not tried yet are given another chance
+            candidates = [node for node in self.nodes if node not in tried]
+        if len(candidates) == 0:
+            return None
+        turn = next(self.turns)
+        return min(candidates,
+                   key=lambda node: (self.in_flight[node], (self.positions[node] - turn) % len(self.nodes)))
+
+    def encode(self, msg: Message) -> Tuple[int, bytes]:
+        # a simulated transport hands the message itself over, see Transport.py
+        if self.pool.transport.serializes:
+            return DataRepCodec.encode(msg)
+        return MESSAGE_TAGS[type(msg)], msg
+
+    def decode(self, frame: Frame) -> Message:
+        return DataRepCodec.decode(frame.tag, frame.payload) if self.pool.transport.serializes else frame.payload
+
+    @asyncio.coroutine
+    def request(self, msg: Message) -> Message:
+        """
+        sends the message to an entry node and returns its answer, trying the next node if one can not be reached.
+        A request which is not answered within the timeout fails with asyncio.TimeoutError, and is not sent again,
+        since it may still be committed
+        """
+        tag, payload = self.encode(msg)
+        tried = []  # type: List[ServerInfo]
+        with (yield from self.slots):
+            while True:
+                node = self.pick(tried)
+                if node is None:
+                    raise NoEntryNode('none of the %d entry nodes could be reached' % len(self.nodes))
+                tried.append(node)
+                self.in_flight[node] += 1
+                try:
+                    frame = yield from self.pool.request(node, tag, payload, timeout=self.timeout)
+                except (ConnectionError, OSError) as e:
+                    # a write is safe to send again, since it carries its own version, which is only stored once
+                    log.info("%s could not reach %s: %r", self.info, node, e)
+                    self.down_until[node] = self.loop.time() + self.retry_after
+                    self.pool.drop(node)
+                    continue
+                finally:
+                    self.in_flight[node] -= 1
+                self.down_until.pop(node, None)
+                return self.decode(frame)
+
+    @asyncio.coroutine
+    def write(self, content: str, key: str = '', version: int = None) -> bool:
+        """
+        writes the content under the key, and returns whether a quorum accepted it.
+        The version is the time of the write unless one is given, where the newest version of a key wins
+        """
+        if version is None:
+            # writes sent right after each other may get the same time, but the later one should still win
+            version = self.last_version = max(now_ns(), self.last_version + 1)
+        answer = yield from self.request(ClientDataMessage(self.info, Data(content, version, key=key)))
+        return answer.accepted
+
+    @asyncio.coroutine
+    def read(self, key: str = '') -> Optional[Data]:
+        """the newest data of the key a quorum knows of, None if nothing has been written to it"""
+        answer = yield from self.request(ClientReadMessage(self.info, key))
+        return answer.data
+
+    def content_of(self, data: Data) -> str:
+        """the content of data which has been read, which is in the blob store of the client for large contents"""
+        if data.blob is None:
+            return data.content
+        return self.blobs.read(data.blob).decode('utf-8')
+
+    @asyncio.coroutine
+    def stats(self, node: ServerInfo) -> dict:
+        """the metrics of one of the nodes, see Metrics.py"""
+        frame = yield from self.pool.request(node, *self.encode(StatsRequest(self.info)), timeout=self.timeout)
+        return json.loads(self.decode(frame).stats)
+
+    def connection_closed(self, conn: FramedConnection):
+        # a blob cut off by the connection closing never completes, and a reconnect starts a new receiver
+        receiver = self.receivers.pop(conn, None)
+        if receiver is not None:
+            receiver.abort()
+
+    def close(self):
+        self.pool.close()
+        for receiver in self.receivers.values():
+            receiver.abort()
+        if self.blobs is not None:
+            self.blobs.close()
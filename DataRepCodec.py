@@ -0,0 +1,320 @@
+"""
+This file contains a compact binary codec for the messages in DataRepMessages.py, which replaces pickle on the wire.
+Pickle is slow, bloated and unpickling bytes from the network lets the sender run arbitrary code,
+whereas this codec only ever creates the message classes listed in the schemas below.
+
+Every message is encoded as a fixed layout header followed by its variable length fields
+
+    +------------------+----------------+----------------------+------------------------+
+    | sender (node id) | timestamp (ns) | fixed fields ...     | variable fields ...    |
+    |     8 bytes      |    8 bytes     | eg. level, accept    | eg. data               |
+    +------------------+----------------+----------------------+------------------------+
+
+where the header and the fixed fields of a message type are packed with a single precompiled struct.
+Peers are encoded as node ids, which are their ipv4 address and port packed into one integer,
+such that no node has to agree with any other node on an id table before they can talk.
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+from Registry import server_of, known_servers
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/struct.html
+# packing and unpacking of binary values
+import struct
+
+# https://docs.python.org/3/library/socket.html#socket.inet_aton
+# conversion between ipv4 addresses in dotted notation and their 4 byte representation
+import socket
+
+# -- python community libs -- #
+from typing import List, Tuple, Dict, Any
+
+# version number, key length, content length and whether the data has a blob,
+# in front of the utf-8 encoded key and content
+DATA_HEADER = struct.Struct('!qHI?')
+
+# length in front of a utf-8 encoded string
+STR_LENGTH = struct.Struct('!H')
+
+# sha256 and size of a blob, which follows the content of a data that has one
+BLOB_REF = struct.Struct('!32sQ')
+
+# version number, sha256 of the content and key length of a data ref, in front of the utf-8 encoded key
+DATA_REF = struct.Struct('!q32sH')
+
+# number of elements in front of a list
+COUNT = struct.Struct('!I')
+
+# whether an optional value is present
+PRESENT = struct.Struct('!?')
+
+# struct format of every fixed size field type
+FIXED_FIELD_FORMATS = {
+    'node': 'Q',  # a ServerInfo encoded as node id
+    'time': 'q',  # integer nanoseconds
+    'bool': '?',
+    'u8': 'B',
+    'u16': 'H',
+    'u32': 'I',
+    'u64': 'Q',
+    'i64': 'q',
+}
+
+
+class CodecError(ValueError):
+    pass
+
+
+# a cluster only has so many nodes, so converting between node ids and ServerInfo is only done once per node.
+# The node id of a server is found by the id the registry gave it, and a server by its node id in a dict,
+# since node ids are spread over the whole range of addresses, see Registry.py
+_node_ids = []  # type: List[int]
+_server_infos = dict()  # type: Dict[int, ServerInfo]
+
+
+def node_id(info: ServerInfo) -> int:
+    if info.node >= len(_node_ids):
+        # the servers the registry has handed out since the last time, which includes this one
+        for server in map(server_of, range(len(_node_ids), known_servers())):
+            _node_ids.append(int.from_bytes(socket.inet_aton(server.ip), 'big') << 16 | server.port)
+    return _node_ids[info.node]
+
+
+def server_info(node: int) -> ServerInfo:
+    info = _server_infos.get(node)
+    if info is None:
+        info = ServerInfo(socket.inet_ntoa((node >> 16).to_bytes(4, 'big')), node & 0xFFFF)
+        _server_infos[node] = info
+    return info
+
+
+def encode_str(value: str, parts: List[bytes]):
+    encoded = value.encode('utf-8')
+    parts.append(STR_LENGTH.pack(len(encoded)))
+    parts.append(encoded)
+
+
+def decode_str(buf: memoryview, offset: int) -> Tuple[str, int]:
+    length, = STR_LENGTH.unpack_from(buf, offset)
+    start = offset + STR_LENGTH.size
+    end = start + length
+    if end > len(buf):
+        raise CodecError('string is truncated')
+    return str(buf[start:end], 'utf-8'), end
+
+
+def encode_text(value: str, parts: List[bytes]):
+    """like a string, but with room for more than 64k bytes"""
+    encoded = value.encode('utf-8')
+    parts.append(COUNT.pack(len(encoded)))
+    parts.append(encoded)
+
+
+def decode_text(buf: memoryview, offset: int) -> Tuple[str, int]:
+    length, = COUNT.unpack_from(buf, offset)
+    start = offset + COUNT.size
+    end = start + length
+    if end > len(buf):
+        raise CodecError('text is truncated')
+    return str(buf[start:end], 'utf-8'), end
+
+
+def encode_bytes(value: bytes, parts: List[bytes]):
+    parts.append(COUNT.pack(len(value)))
+    parts.append(value)
+
+
+def decode_bytes(buf: memoryview, offset: int) -> Tuple[bytes, int]:
+    length, = COUNT.unpack_from(buf, offset)
+    start = offset + COUNT.size
+    end = start + length
+    if end > len(buf):
+        raise CodecError('bytes are truncated')
+    return bytes(buf[start:end]), end
+
+
+def encode_data(data: Data, parts: List[bytes]):
+    key = data.key.encode('utf-8')
+    content = data.content.encode('utf-8')
+    parts.append(DATA_HEADER.pack(data.version_number, len(key), len(content), data.blob is not None))
+    parts.append(key)
+    parts.append(content)
+    if data.blob is not None:
+        parts.append(BLOB_REF.pack(data.blob.digest, data.blob.size))
+
+
+def decode_data(buf: memoryview, offset: int) -> Tuple[Data, int]:
+    """decodes the data starting at offset, and returns it together with the offset of the first byte after it"""
+    version_number, key_length, length, has_blob = DATA_HEADER.unpack_from(buf, offset)
+    key_start = offset + DATA_HEADER.size
+    start = key_start + key_length
+    end = start + length
+    if end > len(buf):
+        raise CodecError('data content is truncated')
+    data = Data.__new__(Data)
+    data.version_number = version_number
+    data.key = str(buf[key_start:start], 'utf-8')
+    data.content = str(buf[start:end], 'utf-8')
+    data.blob = None
+    if has_blob:
+        digest, size = BLOB_REF.unpack_from(buf, end)
+        data.blob = Blob(digest, size)
+        end += BLOB_REF.size
+    return data, end
+
+
+def encode_optional_data(data: Data, parts: List[bytes]):
+    parts.append(PRESENT.pack(data is not None))
+    if data is not None:
+        encode_data(data, parts)
+
+
+def decode_optional_data(buf: memoryview, offset: int) -> Tuple[Data, int]:
+    present, = PRESENT.unpack_from(buf, offset)
+    offset += PRESENT.size
+    if not present:
+        return None, offset
+    return decode_data(buf, offset)
+
+
+def encode_data_list(batch: List[Data], parts: List[bytes]):
+    parts.append(COUNT.pack(len(batch)))
+    for data in batch:
+        encode_data(data, parts)
+
+
+def decode_data_list(buf: memoryview, offset: int) -> Tuple[List[Data], int]:
+    length, = COUNT.unpack_from(buf, offset)
+    offset += COUNT.size
+    batch = []
+    for i in range(length):
+        data, offset = decode_data(buf, offset)
+        batch.append(data)
+    return batch, offset
+
+
+def encode_ref_list(refs: List[DataRef], parts: List[bytes]):
+    parts.append(COUNT.pack(len(refs)))
+    for ref in refs:
+        key = ref.key.encode('utf-8')
+        parts.append(DATA_REF.pack(ref.version_number, ref.digest, len(key)))
+        parts.append(key)
+
+
+def decode_ref_list(buf: memoryview, offset: int) -> Tuple[List[DataRef], int]:
+    length, = COUNT.unpack_from(buf, offset)
+    offset += COUNT.size
+    refs = []
+    for i in range(length):
+        version_number, digest, key_length = DATA_REF.unpack_from(buf, offset)
+        start = offset + DATA_REF.size
+        offset = start + key_length
+        if offset > len(buf):
+            raise CodecError('data ref key is truncated')
+        refs.append(DataRef(str(buf[start:offset], 'utf-8'), version_number, digest))
+    return refs, offset
+
+
+# encoders and decoders of every variable length field type,
+# an encoder appends the encoded parts to a list, such that a large payload is only copied once when they are joined
+VARIABLE_FIELD_CODECS = {
+    'str': (encode_str, decode_str),
+    'text': (encode_text, decode_text),
+    'bytes': (encode_bytes, decode_bytes),
+    'data': (encode_data, decode_data),
+    'optional_data': (encode_optional_data, decode_optional_data),
+    'data_list': (encode_data_list, decode_data_list),
+    'ref_list': (encode_ref_list, decode_ref_list),
+}
+
+
+class Schema:
+    """
+    Describes how one message class is laid out on the wire, given as a list of (attribute name, field type).
+    Fixed size fields are packed together with the header in the order given,
+    the variable length fields follow in the order given.
+    """
+    def __init__(self, cls, fields: List[Tuple[str, str]]):
+        self.cls = cls
+        self.has_header = issubclass(cls, Message)
+        self.fixed = [(name, kind) for name, kind in fields if kind in FIXED_FIELD_FORMATS]
+        self.variable = [(name, VARIABLE_FIELD_CODECS[kind]) for name, kind in fields
+                         if kind in VARIABLE_FIELD_CODECS]
+
+        header = [('sender', 'node'), ('timestamp', 'time')] if self.has_header else []
+        self.fixed = header + self.fixed
+        self.fixed_names = [name for name, _ in self.fixed]
+        self.node_indexes = [i for i, (_, kind) in enumerate(self.fixed) if kind == 'node']
+        self.struct = struct.Struct('!' + ''.join(FIXED_FIELD_FORMATS[kind] for _, kind in self.fixed))
+
+    def encode(self, msg) -> bytes:
+        values = [getattr(msg, name) for name in self.fixed_names]
+        for i in self.node_indexes:
+            values[i] = node_id(values[i])
+        parts = [self.struct.pack(*values)]
+        for name, (encode, _) in self.variable:
+            encode(getattr(msg, name), parts)
+        return b''.join(parts)
+
+    def decode(self, payload: bytes):
+        buf = memoryview(payload)
+        try:
+            values = list(self.struct.unpack_from(buf, 0))
+            for i in self.node_indexes:
+                values[i] = server_info(values[i])
+            msg = self.cls.__new__(self.cls)
+            for name, value in zip(self.fixed_names, values):
+                setattr(msg, name, value)
+
+            offset = self.struct.size
+            for name, (_, decode) in self.variable:
+                value, offset = decode(buf, offset)
+                setattr(msg, name, value)
+        except (struct.error, UnicodeDecodeError) as e:
+            raise CodecError('malformed %s: %s' % (self.cls.__name__, e))
+
+        if offset != len(buf):
+            raise CodecError('%d trailing bytes after %s' % (len(buf) - offset, self.cls.__name__))
+        return msg
+
+
+SCHEMAS = {
+    TESTMSG: Schema(TESTMSG, []),
+    ClientDataMessage: Schema(ClientDataMessage, [('data', 'data')]),
+    ClientDataResponse: Schema(ClientDataResponse, [('version_number', 'i64'), ('accepted', 'bool')]),
+    QuorumRequest: Schema(QuorumRequest, [('write_id', 'u64'), ('level', 'u16'), ('refs', 'ref_list')]),
+    QuorumResponse: Schema(QuorumResponse, [('write_id', 'u64'), ('level', 'u16'), ('accept_changes', 'bool'),
+                                            ('holds_data', 'bool')]),
+    WriteDataRequest: Schema(WriteDataRequest, [('write_id', 'u64'), ('level', 'u16'), ('version_number', 'i64'),
+                                                ('log_id', 'u64'), ('seq', 'u64'), ('batch', 'data_list')]),
+    ClientReadMessage: Schema(ClientReadMessage, [('key', 'str')]),
+    ClientReadResponse: Schema(ClientReadResponse, [('data', 'optional_data')]),
+    QuorumReadRequest: Schema(QuorumReadRequest, [('read_id', 'u64'), ('level', 'u16'), ('key', 'str')]),
+    QuorumReadResponse: Schema(QuorumReadResponse, [('read_id', 'u64'), ('level', 'u16'), ('data', 'optional_data')]),
+    DataFetchRequest: Schema(DataFetchRequest, [('write_id', 'u64')]),
+    DataFetchResponse: Schema(DataFetchResponse, [('write_id', 'u64'), ('batch', 'data_list')]),
+    StatsRequest: Schema(StatsRequest, []),
+    StatsResponse: Schema(StatsResponse, [('stats', 'text')]),
+    Heartbeat: Schema(Heartbeat, []),
+    CatchUpRequest: Schema(CatchUpRequest, [('transfer_id', 'u64'), ('page', 'u32'), ('log_id', 'u64'),
+                                            ('index', 'u64'), ('partition', 'str')]),
+    CatchUpResponse: Schema(CatchUpResponse, [('transfer_id', 'u64'), ('page', 'u32'), ('log_id', 'u64'),
+                                              ('index', 'u64'), ('done', 'bool'), ('gone', 'bool'),
+                                              ('batch', 'data_list'), ('snapshot', 'bytes')]),
+}  # type: Dict[Any, Schema]
+
+SCHEMAS_BY_TAG = {MESSAGE_TAGS[cls]: schema for cls, schema in SCHEMAS.items()}
+
+
+def encode(msg) -> Tuple[int, bytes]:
+    """encodes a message and returns it together with the tag of its type"""
+    cls = type(msg)
+    return MESSAGE_TAGS[cls], SCHEMAS[cls].encode(msg)
+
+
+def decode(tag: int, payload: bytes):
+    schema = SCHEMAS_BY_TAG.get(tag)
+    if schema is None:
+        raise CodecError('unknown message tag %d' % tag)
+    return schema.decode(payload)
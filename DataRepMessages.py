@@ -4,75 +4,264 @@ messages, data files and server information
 """
 __author__ = 'michel'
 from functools import reduce
+import hashlib
 import time
+from typing import List
+from BlobStore import Blob
+# the one ServerInfo class shared with Messages.py, see Registry.py
+from Registry import ServerInfo
+
+
+def now_ns() -> int:
+    """current time as integer nanoseconds since epoch, which is how timestamps are sent on the wire"""
+    return int(time.time() * 1000000000)
 
 
 class Data:
-    def __init__(self, content: str, version_number: int):
+    __slots__ = ('version_number', 'content', 'blob', 'key')
+
+    def __init__(self, content: str, version_number: int, blob: Blob = None, key: str = ''):
         self.version_number = version_number
         self.content = content
+        # the key the data is stored under, which decides the partition it belongs to, see HashRing.py
+        self.key = key
+        # large contents are kept in the blob store and streamed separately, see BlobStore.py
+        self.blob = blob
 
     def __hash__(self) -> int:
         return reduce(lambda acc, x: acc * 17 + x.__hash__(),
-                      [self.content, self.version_number],
+                      [self.key, self.content, self.version_number],
                       71)
 
     def __str__(self) -> str:
-        return "(data.%d): %s" % \
-               (self.version_number, self.content)
+        return "(data%s.%d): %s" % \
+               (' ' + self.key if self.key else '', self.version_number,
+                self.content if self.blob is None else self.blob)
 
 
-class ServerInfo:
-    def __init__(self, ip: str, port: int):
-        self.ip = ip
-        self.port = port
+def content_digest(data: Data) -> bytes:
+    """sha256 of the content of the data, which for a blob is the digest it is already stored under"""
+    if data.blob is not None:
+        return data.blob.digest
+    return hashlib.sha256(data.content.encode('utf-8')).digest()
 
-    def __eq__(self, other) -> bool:
-        return (isinstance(other, ServerInfo)
-                and self.ip == other.ip
-                and self.port == other.port)
 
-    def __hash__(self) -> int:
-        return reduce(lambda acc, x: acc * 17 + x.__hash__(),
-                      [self.ip, self.port],
-                      71)
+class DataRef:
+    """refers to a version of the data of a key by the hash of its content, without carrying the content itself"""
+    __slots__ = ('key', 'version_number', 'digest')
+
+    def __init__(self, key: str, version_number: int, digest: bytes):
+        self.key = key
+        self.version_number = version_number
+        self.digest = digest
 
-    def __str__(self):
-        return self.ip + ':' + str(self.port)
+    def refers_to(self, data: Data) -> bool:
+        return (data is not None
+                and data.key == self.key
+                and data.version_number == self.version_number
+                and content_digest(data) == self.digest)
+
+    @staticmethod
+    def of(data: Data) -> 'DataRef':
+        return DataRef(data.key, data.version_number, content_digest(data))
 
 
 class TESTMSG:
-    pass
+    __slots__ = ()
 
 
 class Message:
+    __slots__ = ('sender', 'timestamp')
+
     def __init__(self, sender: ServerInfo):
         self.sender = sender
-        self.timestamp = time.gmtime()
+        self.timestamp = now_ns()
 
 
 class ClientDataMessage(Message):
+    __slots__ = ('data',)
+
     def __init__(self, sender, data: Data):
         super().__init__(sender)
         self.data = data
 
 
+class ClientDataResponse(Message):
+    __slots__ = ('version_number', 'accepted')
+
+    def __init__(self, sender: ServerInfo, version_number: int, accepted: bool):
+        super().__init__(sender)
+        self.version_number = version_number  # version of the data which the client asked to write
+        self.accepted = accepted
+
+
 class QuorumRequest(Message):
-    def __init__(self, sender: ServerInfo, data: Data, level):
+    __slots__ = ('level', 'refs', 'write_id')
+
+    def __init__(self, sender: ServerInfo, refs: List[DataRef], level, write_id: int):
         super().__init__(sender)
         self.level = level
-        self.data = data
+        # the client writes which are committed together in this round, whose contents only follow on the commit
+        self.refs = refs
+        self.write_id = write_id  # identifies the write round which the message belongs to
 
 
 class QuorumResponse(Message):
-    def __init__(self, sender: ServerInfo, accept_changes: bool, level):
+    __slots__ = ('level', 'accept_changes', 'write_id', 'holds_data')
+
+    def __init__(self, sender: ServerInfo, accept_changes: bool, level, write_id: int, holds_data: bool = False):
         super().__init__(sender)
         self.level = level
         self.accept_changes = accept_changes
+        self.write_id = write_id
+        # whether the sender already holds the data of the round, such that it is left out of its write request
+        self.holds_data = holds_data
 
 
 class WriteDataRequest(Message):
-    def __init__(self, sender, version_number: int, level):
+    __slots__ = ('level', 'version_number', 'write_id', 'log_id', 'seq', 'batch')
+
+    def __init__(self, sender, version_number: int, level, write_id: int, log_id: int = 0, seq: int = 0,
+                 batch: List[Data] = ()):
         super().__init__(sender)
         self.level = level
         self.version_number = version_number
+        self.write_id = write_id
+        # the sender numbers the write requests it sends to its group at every level, counting from 1 in every run,
+        # which it tells apart by the id of its commit log, such that the members notice the ones they missed
+        self.log_id = log_id
+        self.seq = seq
+        # left out for the members which already hold the data, the others can fetch it if it is missing anyway
+        self.batch = list(batch)
+
+
+class DataFetchRequest(Message):
+    __slots__ = ('write_id',)
+
+    def __init__(self, sender: ServerInfo, write_id: int):
+        super().__init__(sender)
+        self.write_id = write_id  # the write whose data is missing
+
+
+class DataFetchResponse(Message):
+    __slots__ = ('write_id', 'batch')
+
+    def __init__(self, sender: ServerInfo, write_id: int, batch: List[Data]):
+        super().__init__(sender)
+        self.write_id = write_id
+        self.batch = batch  # empty when the sender no longer has the data of the write
+
+
+class ClientReadMessage(Message):
+    __slots__ = ('key',)
+
+    def __init__(self, sender: ServerInfo, key: str = ''):
+        super().__init__(sender)
+        self.key = key
+
+
+class ClientReadResponse(Message):
+    __slots__ = ('data',)
+
+    def __init__(self, sender: ServerInfo, data: Data):
+        super().__init__(sender)
+        self.data = data  # the newest data a quorum knows of, None if nothing has ever been written
+
+
+class QuorumReadRequest(Message):
+    __slots__ = ('level', 'read_id', 'key')
+
+    def __init__(self, sender: ServerInfo, level, read_id: int, key: str = ''):
+        super().__init__(sender)
+        self.level = level
+        self.read_id = read_id  # identifies the read round which the message belongs to
+        self.key = key
+
+
+class QuorumReadResponse(Message):
+    __slots__ = ('level', 'read_id', 'data')
+
+    def __init__(self, sender: ServerInfo, level, read_id: int, data: Data):
+        super().__init__(sender)
+        self.level = level
+        self.read_id = read_id
+        self.data = data  # the newest data held below the sender
+
+
+class StatsRequest(Message):
+    """asks a node for its metrics, which it replies to on the same connection, see Metrics.py"""
+    __slots__ = ()
+
+
+class StatsResponse(Message):
+    __slots__ = ('stats',)
+
+    def __init__(self, sender: ServerInfo, stats: str):
+        super().__init__(sender)
+        self.stats = stats  # the metrics of the node as json
+
+
+class Heartbeat(Message):
+    """sent to a peer which has not been sent anything else for a while, see FailureDetector.py"""
+    __slots__ = ()
+
+
+class CatchUpRequest(Message):
+    """
+    asks a member of a group for the data of the partition committed after an entry of its commit log,
+    one page at a time, see CatchUp.py
+    """
+    __slots__ = ('partition', 'log_id', 'index', 'transfer_id', 'page')
+
+    def __init__(self, sender: ServerInfo, partition: str, log_id: int, index: int, transfer_id: int, page: int):
+        super().__init__(sender)
+        self.partition = partition
+        # the commit log of the member and the index of its newest entry the sender holds, 0 for both when
+        # the sender has not caught up from the member before, or the member has restarted since
+        self.log_id = log_id
+        self.index = index
+        self.transfer_id = transfer_id  # drawn by the sender, and the same for every page of one transfer
+        self.page = page  # a transfer is started by asking for page 0
+
+
+class CatchUpResponse(Message):
+    __slots__ = ('transfer_id', 'page', 'log_id', 'index', 'batch', 'snapshot', 'done', 'gone')
+
+    def __init__(self, sender: ServerInfo, transfer_id: int, page: int, log_id: int = 0, index: int = 0,
+                 batch: List[Data] = (), snapshot: bytes = b'', done: bool = False, gone: bool = False):
+        super().__init__(sender)
+        self.transfer_id = transfer_id
+        self.page = page
+        # the commit log of the sender and the index of its newest entry when the transfer started,
+        # which the next catch-up from the sender starts after
+        self.log_id = log_id
+        self.index = index
+        self.batch = list(batch)  # log entries, or nothing when a snapshot is sent
+        self.snapshot = snapshot  # the next part of the compressed snapshot, or nothing when log entries are sent
+        self.done = done  # whether this is the last page
+        self.gone = gone  # the sender does not know the transfer, eg. because it was restarted, so it has to start over
+
+
+# tag of the frames carrying chunks of a blob, which are written to the blob store instead of decoded as messages
+BLOB_CHUNK_TAG = 100
+
+# tags identifying the message type of a frame on the wire, see Framing.py
+MESSAGE_TAGS = {
+    TESTMSG: 1,
+    ClientDataMessage: 2,
+    QuorumRequest: 3,
+    QuorumResponse: 4,
+    WriteDataRequest: 5,
+    ClientDataResponse: 6,
+    ClientReadMessage: 7,
+    ClientReadResponse: 8,
+    QuorumReadRequest: 9,
+    QuorumReadResponse: 10,
+    DataFetchRequest: 11,
+    DataFetchResponse: 12,
+    StatsRequest: 13,
+    StatsResponse: 14,
+    Heartbeat: 15,
+    CatchUpRequest: 16,
+    CatchUpResponse: 17,
+}
@@ -10,40 +10,293 @@ A data replication node, which is part of a network structure.
   |  |  | |  |  |   |  |  |    |  |  |   |  |  |   |  |  |  |  |  |   |  |  |   |  |  |
   0  1  2 3  4  5   6  7  8    9 10 11  12 13 14  15 16 17 18 19 20  21 22 23  24 25 26  <- actual data replication nodes
 """
-# TODO: Timeout, reject and read
 __author__ = 'michel'
 from DataRepMessages import *
+import DataRepCodec
+from ConnectionPool import ConnectionPool
+from Framing import FramedConnection, Frame, FLAG_REQUEST, payload_size
+from Transport import TcpTransport
+from BlobStore import BlobStore, BlobReceiver, Blob, CHUNK_SIZE, CHUNK_HEADER
+from WriteAheadLog import WriteAheadLog
+from Metrics import Metrics, log, start_logging, stop_logging
+from SendQueues import SendQueues, CONTROL, DATA
+from HashRing import HashRing
+from Registry import members_of
+from FailureDetector import FailureDetector
+from CatchUp import TokenBucket, SnapshotReader, entry_pages, snapshot_pages
+import Topology
 
 # -- python core libs -- #
 # https://docs.python.org/3/library/asyncio.html
 import asyncio
 
-# http://www.diveintopython3.net/serializing.html
-# decode and encode objects to and from bytes
-import pickle
+# https://docs.python.org/3/library/abc.html
+# the quorum round every kind of round is built on, which can not be used on its own
+from abc import ABC, abstractmethod
+
+# https://docs.python.org/3/library/random.html
+# used for drawing unique write ids
+import random
+import itertools
+import json
+import os
+
+# https://docs.python.org/3/library/collections.html#collections.OrderedDict
+from collections import OrderedDict, deque
+
+# https://docs.python.org/3/library/time.html#time.process_time
+import time
 
 # -- python community libs -- #
 # pip install mypy-lang
 # http://mypy.readthedocs.org/en/latest/introduction.html
 # library that adds optional types which helps on readability and intellisense autocompletion
-from typing import Dict, List, Union
+from typing import AbstractSet, Dict, Iterator, List, Optional, Set, Tuple, Union
 
 # pip install toolz
 # http://toolz.readthedocs.org/en/latest/
 # library that adds common functions, primarely for list and dictionary manipulation
-from toolz.curried import pipe, filter, map
-from toolz import curry, partition_all, count
+from toolz.curried import pipe, filter
+from toolz import curry, count
+
+
+class QuorumLevel:
+    """the state of one level of a quorum round, kept by the node assembling the quorum of its group at that level"""
+    def __init__(self):
+        self.votes = dict()  # type: Dict[ServerInfo, bool]
+        self.rejections = set()  # members which rejected, or could not be reached
+        # the members which have been sent the request, and the tasks sending it
+        self.sends = dict()  # type: Dict[ServerInfo, asyncio.Task]
+        self.spares = []  # type: List[ServerInfo]  # members which are only asked if the first ones are too slow
+        self.holding = set()  # members which already hold the data of the round, and are not sent it again
+        self.timers = []  # the hedge and deadline timers of the level
+        self.started = 0.0
+
+    def cancel(self):
+        """stops the timers and the sends which are still in progress, once the level is over"""
+        for timer in self.timers:
+            timer.cancel()
+        self.timers = []
+        for task in self.sends.values():
+            task.cancel()
+
+    def reached(self, member: ServerInfo) -> bool:
+        """whether the request was delivered to the member"""
+        task = self.sends.get(member)
+        return task is not None and task.done() and not task.cancelled() and task.exception() is None
+
+
+class WriteStream:
+    """the numbered write requests of a sender to one of its groups, as far as a member of the group has heard"""
+    __slots__ = ('log_id', 'highest', 'heard', 'last')
+
+    def __init__(self, log_id: int):
+        self.log_id = log_id
+        self.highest = 0  # the highest number heard of
+        self.heard = 0  # the number of requests heard, which is short of the highest number when some were missed
+        self.last = 0.0  # when the last request was heard
+
+
+class ClientRequest:
+    """
+    a message a client sent as a request, which is answered on the connection it came on, with the same
+    correlation id, instead of on a connection of our own to the address of the client, see DataRepClient.py
+    """
+    __slots__ = ('conn', 'frame', 'sender')
+
+    def __init__(self, conn: FramedConnection, frame: Frame, sender: ServerInfo):
+        self.conn = conn
+        self.frame = frame
+        self.sender = sender
+
+    def __str__(self):
+        return str(self.sender)
+
+
+# the client a reply goes to, which is either its address, or its request when it is waiting on the connection
+Client = Union[ServerInfo, ClientRequest]
+
+
+class QuorumRound(ABC):
+    """
+    The state a node keeps about one quorum round, from the quorum request reaches it until the round is over.
+    A node can take part in many rounds at the same time, which are told apart by their round id.
+    """
+    def __init__(self, round_id: int, structure: List[List[ServerInfo]], started: float):
+        self.round_id = round_id
+        # the network structure of the node when the round started, which the round keeps using until it is over,
+        # such that the structure of the node can be replaced while rounds are in progress
+        self.structure = structure
+        # the members of every level as a set, such that a vote is checked against its level in constant time
+        self.members = members_of(structure)
+        self.is_top_node = False
+        self.quorum_requester_info = None  # the guy who requested quorum
+        self.entry_level = 0  # the highest level at which this node assembles a quorum in this round
+        self.started = started
+        # the votes and outstanding requests per level of the network structure
+        self.levels = [QuorumLevel() for i in range(len(structure))]
+
+    def count_quorum(self, lvl: int) -> int:
+        return count([q for q in self.levels[lvl].votes.values() if q])
+
+    def cancel(self):
+        for level in self.levels:
+            level.cancel()
+
+    @abstractmethod
+    def quorum_request(self, sender: ServerInfo, lvl: int) -> Message:
+        """the request sent to the members of the given level, asking for their votes"""
+
+    @abstractmethod
+    def quorum_response(self, sender: ServerInfo, lvl: int, accept: bool = True) -> Message:
+        """the vote sent back to the member which asked for it at the given level"""
+
+
+class WriteRound(QuorumRound):
+    """
+    a write keeps its round from the quorum request reaches the node until the data has been written.
+    The votes only carry refs to the data, and the data itself follows with the write request once the quorum
+    has been reached, such that it crosses the network once per replica, and only for rounds which commit
+    """
+    def __init__(self, write_id: int, refs: List[DataRef], structure: List[List[ServerInfo]], started: float,
+                 batch: List[Data] = None):
+        super().__init__(write_id, structure, started)
+        self.refs = refs
+        self.batch = batch  # the data to be written, None until it has arrived
+        # the clients who requested the writes in the batch, only known by the top node
+        self.clients = []  # type: List[Tuple[Client, Data]]
+        # whether we have accepted the write, after which the round waits for the write request to commit it
+        self.voted = False
+
+    def quorum_request(self, sender: ServerInfo, lvl: int) -> Message:
+        return QuorumRequest(sender=sender, refs=self.refs, level=lvl, write_id=self.round_id)
+
+    def quorum_response(self, sender: ServerInfo, lvl: int, accept: bool = True) -> Message:
+        return QuorumResponse(sender=sender, accept_changes=accept, level=lvl, write_id=self.round_id,
+                              holds_data=self.batch is not None)
+
+
+class ReadRound(QuorumRound):
+    """a read keeps its round until a quorum below the node has reported the newest data it holds"""
+    def __init__(self, read_id: int, key: str, data: Data, structure: List[List[ServerInfo]], started: float):
+        super().__init__(read_id, structure, started)
+        self.key = key  # the key being read
+        self.data = data  # the newest data reported so far, starting with the one held by this node
+        self.client_request_info = None  # type: Client  # the client who requested the read, only known by the top node
+
+    def add_data(self, data: Data):
+        if data is not None and (self.data is None or data.version_number > self.data.version_number):
+            self.data = data
+
+    def quorum_request(self, sender: ServerInfo, lvl: int) -> Message:
+        return QuorumReadRequest(sender=sender, level=lvl, read_id=self.round_id, key=self.key)
+
+    def quorum_response(self, sender: ServerInfo, lvl: int, accept: bool = True) -> Message:
+        # a read has no way of rejecting, the requester will time out instead
+        return QuorumReadResponse(sender=sender, level=lvl, read_id=self.round_id, data=self.data)
 
 
 class DataRepNode:
     def __init__(self, info: ServerInfo,
                  network_structure:  List[List[ServerInfo]],
-                 loop, data: Data):
+                 loop, data: Data, round_timeout: float = 60.0, send_delay: float = 2.0,
+                 batch_window: float = 0.005, max_batch_size: int = 64,
+                 stale_reads: bool = False, stale_read_window: float = 1.0, blob_directory: str = None,
+                 data_directory: str = None, sync_policy: str = 'group',
+                 level_timeout: float = 10.0, hedge_delay: float = 0.05, hedge_factor: float = 3.0,
+                 ring: HashRing = None, queue_messages: int = 1024, queue_bytes: int = 16 * 1024 * 1024,
+                 transport=None, heartbeat_interval: float = 0.5, phi_threshold: float = 8.0,
+                 stand_ins: Dict[ServerInfo, List[ServerInfo]] = None, catch_up: bool = False,
+                 catch_up_rate: float = 64 * 1024 * 1024, catch_up_page: int = 256 * 1024,
+                 commit_log_size: int = 65536):
         super().__init__()
-        self.client_request_info = None
-        self.quorum_requester_info = None  # the guy who requested quorum
-        self.is_top_node = False
-        self.temp_data = None  # field to contain data until it can be written
+        # with a hash ring, every key belongs to one bottom level group, which replicates it with a quorum tree
+        # of its own, such that writes to keys of different groups commit in parallel, see HashRing.py.
+        # Without one, every node replicates every key through the whole tree
+        self.ring = ring
+        self.store = dict()  # type: Dict[str, Data]  # the replicated data of every key
+        if data is not None:
+            self.store[data.key] = data
+        # every level of a round must reach its quorum within level_timeout seconds per level below and including it,
+        # otherwise the round fails instead of waiting on a dead peer.
+        # A level first only asks as many members as needed for a majority, and asks the spare members as well
+        # when the first ones have not answered after hedge_factor times their usual response time,
+        # or hedge_delay seconds for members which have not answered before
+        self.level_timeout = level_timeout
+        self.hedge_delay = hedge_delay
+        self.hedge_factor = hedge_factor
+        self.peer_latency = dict()  # type: Dict[Tuple[ServerInfo, int], float]
+        # with a data directory, saved data goes through a write-ahead log and is recovered from it on restart,
+        # and writes are only acknowledged once they are on disk, see WriteAheadLog.py for the sync policies
+        self.wal = None
+        if data_directory is not None:
+            self.wal = WriteAheadLog(os.path.join(data_directory, 'wal'), loop, sync_policy)
+            for key, recovered in self.wal.recover().items():
+                if key not in self.store or recovered.version_number >= self.store[key].version_number:
+                    self.store[key] = recovered
+            blob_directory = blob_directory or os.path.join(data_directory, 'blobs')
+        # every partition keeps a log of the data it committed most recently, from which a replica that has fallen
+        # behind gets the entries it missed. Every entry gets the next index of its partition, in the order we
+        # committed them, and a replica asks for the entries after the newest index it got from us the last time.
+        # Versions can not be used for this, since a write committed after our newest one may have an older version.
+        # The log only holds every entry after the floor of the partition, the newest index dropped off it or held
+        # without being logged, eg. the data recovered from disk, and a replica which is further behind than that,
+        # or has not caught up from us before, gets a snapshot of the partition instead, see CatchUp.py.
+        # The id of the log is drawn anew on every start, such that indexes of an earlier run are not taken for ours
+        self.log_id = random.getrandbits(64) or 1
+        self.commit_logs = dict()  # type: Dict[str, deque]  # of (index, data)
+        self.commit_indexes = dict()  # type: Dict[str, int]  # the index of the newest entry of every partition
+        self.commit_log_size = commit_log_size
+        self.log_floors = dict()  # type: Dict[str, int]
+        # (partition, member) -> the log id and index of the member which we caught up to the last time
+        self.cursors = dict()  # type: Dict[Tuple[str, ServerInfo], Tuple[int, int]]
+        # a write request may be lost without us having been asked for our vote, since a level only asks a majority,
+        # so we count the numbered write requests from every sender to notice the ones which never arrive
+        self.write_seqs = dict()  # type: Dict[Tuple[str, int], int]  # (partition, level) -> the last number we sent
+        self.write_streams = dict()  # type: Dict[Tuple[ServerInfo, str, int], WriteStream]
+        # every node starts with the same data, but the data recovered from disk is our own
+        for held in self.store.values():
+            if held is not data:
+                self.note_unlogged(held)
+        # the transfers served to replicas catching up, by transfer id, with the index of our log they started at,
+        # and when their last page was asked for
+        self.transfers = dict()  # type: Dict[int, Tuple[Iterator, int, float]]
+        self.transfer_bucket = TokenBucket(catch_up_rate, 4 * catch_up_page, loop)
+        self.catch_up_page = catch_up_page
+        self.catching_up = dict()  # type: Dict[str, asyncio.Task]  # partition -> the catch-up in progress
+        self.handovers = set()  # type: Set[asyncio.Task]  # the pulls of keys which moved to us, see update_ring
+        # contents larger than a chunk are kept on disk and streamed in chunks ahead of the messages referring to them,
+        # such that no message ever holds a large content in memory
+        self.blobs = BlobStore(blob_directory)
+        self.receivers = dict()  # type: Dict[FramedConnection, BlobReceiver]
+        self.transfer_ids = itertools.count(1)
+        # the batches this node committed most recently, which the members below it can fetch if theirs went missing
+        self.recent_batches = OrderedDict()  # type: Dict[int, List[Data]]
+        self.recent_batch_limit = 256
+        # counters and histograms of the messages, quorums and commits, which are asked for with a StatsRequest
+        self.metrics = Metrics(loop)
+        self.cpu_time = 0.0  # seconds of cpu time spent handling incoming frames
+        # with stale reads allowed, the node which committed the latest write of a partition answers the reads of it
+        # from its own data for stale_read_window seconds, without asking a quorum.
+        # Nobody grants the node this window, and the other members go on voting for writes from other nodes
+        # meanwhile, so such a read can miss a write committed by another node without this node in its quorum,
+        # which is why it is off by default. The window is closed as soon as the node sees another write
+        self.stale_reads = stale_reads
+        self.stale_read_window = stale_read_window
+        self.fresh_until = dict()  # type: Dict[str, float]  # partition -> time its stale read window closes
+        # simulated network delay of every message, on top of the latencies of a simulated transport
+        self.send_delay = send_delay
+        # client writes are collected for at most batch_window seconds, or until there are max_batch_size of them,
+        # and then committed together in a single quorum round, one batch per partition
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.pending_writes = dict()  # type: Dict[str, List[Tuple[ServerInfo, Data]]]
+        self.batch_handles = dict()  # type: Dict[str, asyncio.Handle]
+        self.batch_started = dict()  # type: Dict[str, float]  # when the first pending write of a partition came
+        self.rounds = dict()  # type: Dict[int, QuorumRound]
+        self.round_timeout = round_timeout  # unfinished rounds older than this are forgotten
+        # write id -> the reads held back until the write, which we voted for but do not hold yet, reaches us
+        self.held_reads = dict()  # type: Dict[int, List[Tuple[FramedConnection, Frame]]]
         self.network_structure = network_structure
         """
         a network structure contains information about which groups the given node belongs to
@@ -59,60 +312,943 @@ class DataRepNode:
         |  |  | |  |  |   |  |  |
         a  b  c .  .  .   .  .  .
         """
-        self.level_quorum_count = self.create_empty_quorum_count(network_structure)
         self.loop = loop  # reference to the asyncio eventloop
         self.info = info  # address information for current node
-        self.data = data  # replicated data file
-        server_task = asyncio.start_server(
-            self.handle_msg, info.ip, info.port, loop=loop)
-        self.server = loop.run_until_complete(server_task)
+        # tcp, or an in-memory network when many nodes are simulated in one process, see Transport.py
+        self.transport = transport or TcpTransport(loop)
+        # long lived connections to the other nodes
+        self.pool = ConnectionPool(loop, self.handle_frame, transport=self.transport, local=info)
+        # every message goes through a bounded queue per recipient, where votes overtake data, see SendQueues.py
+        self.queues = SendQueues(self.pool, loop, queue_messages, queue_bytes)
+        # accepts the connections opened by other nodes and clients
+        self.server = loop.run_until_complete(self.transport.serve(info, self.handle_frame, self.connection_closed))
+        self.sweep_handle = loop.call_later(round_timeout, self.sweep_rounds)
+        # every message from a peer counts as a heartbeat, and a peer which has not been heard from for
+        # heartbeat_interval seconds is pinged with a Heartbeat, such that a peer that has gone quiet becomes suspected
+        # without a round having to time out on it first, see FailureDetector.py.
+        # Suspected members are asked last, and at the virtual levels the group of a suspected member is asked
+        # through one of its stand-ins instead, the other members of its bottom level group, see Topology.stand_ins
+        self.detector = FailureDetector(heartbeat_interval, phi_threshold)
+        self.stand_ins = stand_ins or dict()
+        self.peers = self.peers_in(network_structure)  # the nodes whose heartbeats are watched
+        self.pinging = set()  # type: Set[ServerInfo]  # the peers with a heartbeat on its way
+        # the first pings wait for the peers to start, and the nodes ping at different times instead of all at once
+        self.heartbeat_handle = loop.call_later(heartbeat_interval * (1 + random.random()), self.heartbeat)
+        if catch_up:
+            # eg. a node joining the tree, or restarting with the data it had when it stopped
+            loop.call_soon(self.catch_up)
 
     @staticmethod
-    def create_empty_quorum_count(network_structure):
-        return [dict() for i in range(len(network_structure))]
+    def majority(group: List[ServerInfo]) -> int:
+        return len(group) // 2 + 1
+
+    @property
+    def messages_sent(self) -> int:
+        return sum(self.metrics.messages_out.values())
+
+    @property
+    def bytes_sent(self) -> int:
+        """payload bytes of the messages and blob chunks sent"""
+        return sum(self.metrics.bytes_out.values())
+
+    def stats(self) -> dict:
+        return dict(self.metrics.to_dict(), node=str(self.info), rounds=len(self.rounds), keys=len(self.store),
+                    send_queues=self.queues.stats(), transfers=len(self.transfers),
+                    catching_up=sorted(self.catching_up),
+                    cpu_seconds=self.cpu_time,
+                    phi=self.detector.stats(self.loop.time()))
+
+    def encode(self, msg) -> Tuple[int, bytes]:
+        """encodes the message, counting it as sent, where the message is its own payload if the transport allows"""
+        started = time.perf_counter()
+        if self.transport.serializes:
+            tag, payload = DataRepCodec.encode(msg)
+        else:
+            tag, payload = MESSAGE_TAGS[type(msg)], msg
+        self.metrics.sent(type(msg).__name__, payload_size(payload), time.perf_counter() - started)
+        return tag, payload
+
+    def decode(self, frame: Frame) -> Message:
+        """decodes the message of the frame, counting it as received"""
+        started = time.perf_counter()
+        msg = DataRepCodec.decode(frame.tag, frame.payload) if self.transport.serializes else frame.payload
+        self.metrics.received(type(msg).__name__, payload_size(frame.payload), time.perf_counter() - started)
+        return msg
 
-    def send_message_to_many(self, servers: List[ServerInfo], msg: Message, ignores: List[ServerInfo]):
-        for server in filter(lambda s: s not in ignores, servers):
-            asyncio.async(self.send_message_to(server, msg))
+    def send_message_to_many(self, servers: List[ServerInfo], msg: Message,
+                             ignores: AbstractSet[ServerInfo]) -> Dict[ServerInfo, asyncio.Task]:
+        sends = {server: asyncio.async(self.send_message_to(server, msg))
+                 for server in filter(lambda s: s not in ignores, servers)}
+        for server, task in sends.items():
+            task.add_done_callback(curry(self.message_sent, server))
+        return sends
+
+    def message_sent(self, recipient: ServerInfo, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("%s could not reach %s: %r", self.info, recipient, task.exception())
 
     @asyncio.coroutine
     def send_message_to(self, recipient: ServerInfo, msg: Message):
         # asyncio.sleep suspends the function and allows the event loop to continue processing on the next scheduled
         # coroutine in the queue, until this one finishes its sleep
-        yield from asyncio.sleep(2)  # simulating send delay of 2 seconds
-        reader, writer = \
-            yield from asyncio.open_connection(
-                recipient.ip, recipient.port, loop=loop)
-        pipe(
-            msg,
-            pickle.dumps,
-            writer.write
-        )
+        if self.send_delay > 0:
+            yield from asyncio.sleep(self.send_delay)  # simulating send delay
+        yield from self.send_blobs_of(recipient, msg)
+        tag, payload = self.encode(msg)
+        yield from self.queues.send(recipient, tag, payload, self.lane_of(msg))
         # yield from asyncio.sleep(x)  # simulate slow transfer (eg. huge file or very low bandwidth)
-        writer.close()
 
-    def save_data(self):
-        print("%s saving data" % self.info)
-        self.data = self.temp_data
+    def peers_in(self, network_structure: List[List[ServerInfo]]) -> Set[ServerInfo]:
+        """the nodes this node asks for votes, or is asked by, in its own groups and its own partitions"""
+        peers = set()  # type: Set[ServerInfo]
+        for group in network_structure:
+            peers.update(group)
+        if self.ring is not None:
+            for members in self.ring.members.values():
+                if self.info in members:
+                    peers.update(members)
+        peers.discard(self.info)
+        return peers
+
+    def suspected(self, member: ServerInfo, now: float) -> bool:
+        return member != self.info and self.detector.suspected(member, now)
+
+    def heartbeat(self):
+        """pings every peer which has not been heard from for a heartbeat interval"""
+        now = self.loop.time()
+        for peer in self.peers:
+            # a peer which never answers is suspected once it has been silent long enough since the first ping
+            self.detector.watch(peer, now)
+            heard = self.detector.last_heard(peer)
+            if peer not in self.pinging and (heard is None or now - heard >= self.detector.interval):
+                self.pinging.add(peer)
+                asyncio.async(self.send_heartbeat(peer))
+        self.heartbeat_handle = self.loop.call_later(self.detector.interval, self.heartbeat)
 
-    # The 'main' method of the server
-    # Each time a message is received, this method is responsible for processing it
     @asyncio.coroutine
-    def handle_msg(self, reader, writer):
-        # reading the received bytes
-        msg_raw = yield from reader.read()
+    def send_heartbeat(self, peer: ServerInfo):
+        try:
+            # the answer comes back on the same connection, instead of through handle_frame
+            yield from self.pool.request(peer, *self.encode(Heartbeat(self.info)), timeout=self.level_timeout)
+            self.detector.heard(peer, self.loop.time())
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            # the silence of a peer which can not be reached counts against it from its first ping on
+            log.debug("%s could not ping %s: %r", self.info, peer, e)
+        finally:
+            self.pinging.discard(peer)
+
+    @staticmethod
+    def lane_of(msg: Message) -> int:
+        """messages carrying data wait behind the votes and requests which are on the critical path of a round"""
+        if isinstance(msg, (WriteDataRequest, DataFetchResponse)):
+            return DATA if len(msg.batch) > 0 else CONTROL
+        elif isinstance(msg, (ClientDataMessage, ClientReadResponse, QuorumReadResponse)):
+            return DATA if msg.data is not None else CONTROL
+        return CONTROL
+
+    @staticmethod
+    def blobs_of(msg: Message) -> List[Blob]:
+        if isinstance(msg, (WriteDataRequest, DataFetchResponse)):
+            datas = msg.batch
+        elif isinstance(msg, (ClientDataMessage, ClientReadResponse, QuorumReadResponse)):
+            datas = [msg.data]
+        else:
+            datas = []
+        return [data.blob for data in datas if data is not None and data.blob is not None]
 
+    @asyncio.coroutine
+    def send_blobs_of(self, recipient: ServerInfo, msg: Message):
+        """
+        streams the blobs referred to by the message, on the same connection as the message is sent on afterwards,
+        such that they have arrived by the time the message does
+        """
+        blobs = self.blobs_of(msg)
+        if len(blobs) == 0:
+            return
+        conn = yield from self.pool.connection_to(recipient)
+        yield from self.stream_blobs(conn, blobs)
+
+    @asyncio.coroutine
+    def stream_blobs(self, conn: FramedConnection, blobs: List[Blob]):
+        for blob in blobs:
+            transfer_id = next(self.transfer_ids) & 0xFFFFFFFF
+            offset = 0
+            for chunk in self.blobs.chunks(blob):
+                header = CHUNK_HEADER.pack(transfer_id, offset, blob.size, blob.digest)
+                conn.write_parts(BLOB_CHUNK_TAG, [header, chunk])
+                offset += len(chunk)
+                self.metrics.sent('BlobChunk', len(header) + len(chunk))
+                # waiting for every chunk to be sent keeps the amount of buffered data at about one chunk
+                yield from conn.drain()
+
+    def missing_blobs(self, batch: List[Data]) -> bool:
+        return any(data.blob is not None and not self.blobs.has(data.blob) for data in batch)
+
+    def held_batch(self, refs: List[DataRef]) -> Optional[List[Data]]:
+        """the data referred to, if this node already holds all of it, eg. because the write is a retry"""
+        batch = [self.store.get(ref.key) for ref in refs]
+        if all(ref.refers_to(data) for ref, data in zip(refs, batch)) and not self.missing_blobs(batch):
+            return batch
+        return None
+
+    def remember_batch(self, write_round: WriteRound):
+        self.recent_batches[write_round.round_id] = write_round.batch
+        while len(self.recent_batches) > self.recent_batch_limit:
+            self.recent_batches.popitem(last=False)
+
+    @asyncio.coroutine
+    def fetch_batch(self, parent: ServerInfo, write_id: int, write_round: Optional[WriteRound], lvl: int):
+        """
+        asks the parent for the data of a write whose request came without it, eg. because we said we held it,
+        but the round has been forgotten since, and commits the write once it has arrived
+        """
+        log.debug("%s fetches the data of write %x from %s", self.info, write_id, parent)
+        tag, payload = self.encode(DataFetchRequest(self.info, write_id))
+        try:
+            frame = yield from self.pool.request(parent, tag, payload, timeout=self.level_timeout)
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            log.warning("%s could not fetch write %x: %r", self.info, write_id, e)
+            return
+        msg = self.decode(frame)
+        if len(msg.batch) == 0 or self.missing_blobs(msg.batch):
+            # we have missed a write which can no longer be fetched, so we catch up on everything we may have missed
+            log.warning("%s could not fetch write %x, the data is gone", self.info, write_id)
+            if write_round is not None:
+                self.start_catch_up(self.partition_id(write_round.refs[0].key))
+            else:
+                self.catch_up()
+            return
+        if write_round is None:
+            partition = self.partition(msg.batch[0].key)
+            if partition is None:
+                return
+            write_round = WriteRound(write_id, [DataRef.of(data) for data in msg.batch], partition[1],
+                                     self.loop.time())
+            write_round.entry_level = lvl
+        write_round.batch = msg.batch
+        self.commit(write_round, lvl)
+
+    @asyncio.coroutine
+    def serve_fetch(self, conn: FramedConnection, frame: Frame, write_id: int):
+        batch = self.recent_batches.get(write_id, [])
+        # the blobs go ahead of the reply on the same connection, like they do ahead of a message
+        yield from self.stream_blobs(conn, [data.blob for data in batch if data.blob is not None])
+        conn.reply(frame, *self.encode(DataFetchResponse(self.info, write_id, batch)))
+
+    def partition(self, key: str) -> Optional[Tuple[str, List[List[ServerInfo]]]]:
+        """
+        the partition of the key and the network structure its quorums are assembled in,
+        or None when the key belongs to a group this node is not part of
+        """
+        if self.ring is None:
+            return '', self.network_structure
+        name = self.ring.partition_of(key)
+        if self.info not in self.ring.members[name]:
+            return None
+        # the group is the only level of the tree of its partition
+        return name, [self.ring.groups[name]]
+
+    def forward(self, key: str, msg: Message, client: Client):
+        """
+        sends a client message on to the group owning the key, which answers the client itself,
+        unless the client is waiting for the answer on its connection to us, in which case we pass the answer on
+        """
+        group = self.ring.group_of(key)
+        log.debug("%s forwards key %r to %s", self.info, key, group[0])
+        if isinstance(client, ClientRequest):
+            asyncio.async(self.forward_request(group, msg, client))
+        else:
+            asyncio.async(self.send_message_to(group[0], msg))
+
+    @asyncio.coroutine
+    def forward_request(self, group: List[ServerInfo], msg: Message, client: ClientRequest):
+        """asks the members of the group one by one, until one of them can be reached, and passes its answer on"""
+        if isinstance(msg, ClientDataMessage):
+            answer = ClientDataResponse(self.info, msg.data.version_number, False)
+        else:
+            answer = ClientReadResponse(self.info, None)
+        for member in group:
+            try:
+                frame = yield from self.pool.request(member, *self.encode(msg), timeout=self.round_timeout)
+            except (ConnectionError, OSError) as e:
+                log.warning("%s could not forward the request of %s to %s: %r", self.info, client, member, e)
+                continue
+            except asyncio.TimeoutError:
+                # the member may still commit the write, so it is not sent to another one
+                log.warning("%s got no answer from %s for the request of %s", self.info, member, client)
+                break
+            answer = self.decode(frame)
+            break
+        yield from self.send_message_to_client(client, answer)
+
+    def apply(self, batch: List[Data], logged: bool = True) -> List[Data]:
+        """puts the data of one partition in the store, and returns the data which was newer than what we held"""
+        saved = []
+        for data in batch:
+            # rounds may finish in another order than they were started, so an older version never replaces a newer
+            known = self.store.get(data.key)
+            if known is None or data.version_number >= known.version_number:
+                self.store[data.key] = data
+                saved.append(data)
+        if len(saved) > 0:
+            pid = self.partition_id(saved[0].key)
+            first = self.commit_indexes.get(pid, 0) + 1
+            self.commit_indexes[pid] = first + len(saved) - 1
+            if not logged:
+                self.log_floors[pid] = self.commit_indexes[pid]
+                return saved
+            commit_log = self.commit_logs.get(pid)
+            if commit_log is None:
+                commit_log = self.commit_logs[pid] = deque()
+            commit_log.extend(zip(itertools.count(first), saved))
+            while len(commit_log) > self.commit_log_size:
+                dropped, _ = commit_log.popleft()
+                self.log_floors[pid] = max(self.log_floors.get(pid, 0), dropped)
+        return saved
+
+    def note_unlogged(self, data: Data):
+        pid = self.partition_id(data.key)
+        self.commit_indexes[pid] = self.log_floors[pid] = self.commit_indexes.get(pid, 0) + 1
+
+    def save_data(self, batch: List[Data]) -> asyncio.Future:
+        """saves the data, and returns a future which is done once it is durable"""
+        log.debug("%s saving data", self.info)
+        saved = self.apply(batch)
+
+        if self.wal is None or len(saved) == 0:
+            durable = asyncio.Future(loop=self.loop)
+            durable.set_result(None)
+            return durable
+        durable = self.wal.append(saved)
+        if self.wal.needs_snapshot():
+            # the snapshot is written in a thread, so the rounds go on meanwhile
+            self.wal.snapshot(self.store)
+        return durable
+
+    def partition_id(self, key: str) -> str:
+        return '' if self.ring is None else self.ring.partition_of(key)
+
+    def held_partitions(self) -> List[str]:
+        if self.ring is None:
+            return ['']
+        return [name for name, members in self.ring.members.items() if self.info in members]
+
+    def replicas_of(self, pid: str) -> List[ServerInfo]:
+        """the bottom level group which replicates the partition"""
+        return self.network_structure[-1] if self.ring is None else self.ring.groups[pid]
+
+    def catch_up(self) -> asyncio.Future:
+        """catches up on every partition this node holds, and returns a future which is done once it has"""
+        return asyncio.gather(*[self.start_catch_up(pid) for pid in self.held_partitions()], loop=self.loop)
+
+    def start_catch_up(self, pid: str, source: ServerInfo = None) -> asyncio.Task:
+        """
+        starts catching up on the partition unless it already is, from the source if it can be reached,
+        and the task tells whether it caught up in the end
+        """
+        task = self.catching_up.get(pid)
+        if task is None:
+            task = self.catching_up[pid] = asyncio.async(self.catch_up_partition(pid, source), loop=self.loop)
+            task.add_done_callback(curry(self.caught_up, pid))
+        return task
+
+    def caught_up(self, pid: str, task: asyncio.Task):
+        self.catching_up.pop(pid, None)
+        if not task.cancelled() and task.exception() is not None:
+            log.warning("%s could not catch up on partition %r: %r", self.info, pid, task.exception())
+
+    def update_ring(self, ring: HashRing) -> asyncio.Future:
+        """
+        replaces the hash ring, eg. after a group has joined or left, and pulls the keys which now belong to
+        the partitions of this node from the groups which owned them in the old ring.
+        A member of an old group only knows which of its keys moved once it has the new ring as well,
+        so every node should be given it before the pulls start, and a node of a joining group is started
+        with the old ring. Returns a future which is done once every pull is, telling whether each one succeeded
+        """
+        old = self.ring
+        self.ring = ring
+        self.peers = self.peers_in(self.network_structure)
+        for peer in list(self.detector.histories):
+            if peer not in self.peers:
+                self.detector.forget(peer)
+        # the data we held of a partition may have been written by another group meanwhile
+        self.fresh_until.clear()
+        # the partitions are made up of other keys now, so the commit logs no longer tell what a replica lacks,
+        # and the next transfer of every partition starts with a snapshot
+        self.commit_logs.clear()
+        for pid in set(self.commit_indexes) | set(ring.groups):
+            self.commit_indexes[pid] = self.log_floors[pid] = self.commit_indexes.get(pid, 0) + 1
+        pulls = []
+        for pid in self.held_partitions():
+            for source in ring.sources_of(pid, old):
+                task = asyncio.async(self.catch_up_partition(pid, group=old.groups[source]), loop=self.loop)
+                self.handovers.add(task)
+                task.add_done_callback(self.handovers.discard)
+                pulls.append(task)
+        return asyncio.gather(*pulls, loop=self.loop)
+
+    @asyncio.coroutine
+    def catch_up_partition(self, pid: str, source: ServerInfo = None, group: List[ServerInfo] = None) -> bool:
+        """
+        pulls the data of the partition we lack from the closest member of its group which can be reached,
+        or of the given group, which held keys of the partition before they moved to us
+        """
+        started = self.loop.time()
+        group = group or self.replicas_of(pid)
+        members = yield from self.closest_members(group if source is None or source in group else group + [source])
+        # the members we have caught up from before only send what they committed since, the others a snapshot
+        members.sort(key=lambda member: (member != source, (pid, member) not in self.cursors))
+        for member in members:
+            try:
+                pages = yield from self.pull(member, pid)
+            except (ConnectionError, OSError, asyncio.TimeoutError, DataRepCodec.CodecError) as e:
+                log.warning("%s could not catch up on partition %r from %s: %r", self.info, pid, member, e)
+                continue
+            log.info("%s caught up on partition %r from %s in %d pages", self.info, pid, member, pages)
+            self.metrics.record('catch_up', self.loop.time() - started)
+            return True
+        return False
+
+    @asyncio.coroutine
+    def closest_members(self, group: List[ServerInfo]) -> List[ServerInfo]:
+        """the other members of the group which answer a ping, the fastest first"""
+        others = [member for member in group if member != self.info]
+        times = yield from asyncio.gather(*[self.round_trip(member) for member in others], loop=self.loop)
+        answered = [(seconds, member) for seconds, member in zip(times, others) if seconds is not None]
+        return [member for seconds, member in sorted(answered, key=lambda pair: pair[0])]
+
+    @asyncio.coroutine
+    def round_trip(self, member: ServerInfo) -> Optional[float]:
+        """the seconds a ping to the member takes, None if it does not answer"""
         try:
+            return (yield from asyncio.wait_for(self.ping(member), self.level_timeout, loop=self.loop))
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            return None
+
+    @asyncio.coroutine
+    def pull(self, member: ServerInfo, pid: str) -> int:
+        """
+        pulls the pages of the data of the partition the member committed since we caught up from it the last time,
+        one at a time
+        """
+        log_id, since = self.cursors.get((pid, member), (0, 0))
+        transfer_id = random.getrandbits(64)
+        reader = None  # type: SnapshotReader  # only created once a page of a snapshot arrives
+        page = 0
+        done = False
+        while not done:
+            request = CatchUpRequest(self.info, pid, log_id, since, transfer_id, page)
+            msg = self.decode((yield from self.pool.request(member, *self.encode(request), timeout=self.level_timeout)))
+            if msg.gone:
+                raise ConnectionError('%s no longer knows transfer %x' % (member, transfer_id))
+            batch = msg.batch
+            if len(msg.snapshot) > 0:
+                reader = reader or SnapshotReader()
+                # zlib lets go of the interpreter while it works, so the page is decompressed beside the event loop
+                batch = batch + (yield from self.loop.run_in_executor(None, reader.feed, msg.snapshot))
+            # the blobs of the page are streamed ahead of it on the same connection
+            if self.missing_blobs(batch):
+                raise ConnectionError('the blobs of page %d from %s went missing' % (page, member))
+            if reader is None:
+                self.save_data(batch)
+            else:
+                # the snapshot is written to the write-ahead log once it is complete, instead of a record at a time
+                self.apply(batch, logged=False)
+            page += 1
+            done = msg.done
+
+        if reader is not None:
+            if not reader.finished():
+                raise DataRepCodec.CodecError('the snapshot from %s is corrupted' % member)
+            if self.wal is not None:
+                # shielded, since the snapshot may be shared with one save_data asked for
+                yield from asyncio.shield(self.wal.snapshot(self.store), loop=self.loop)
+        # we now hold everything the member held when the transfer started
+        self.cursors[(pid, member)] = (msg.log_id, msg.index)
+        return page
+
+    def transfer_pages(self, pid: str, log_id: int,
+                       since: int) -> Iterator[Tuple[List[Data], bytes, List[Data], bool]]:
+        """
+        the pages of a transfer of the data of the partition committed after the index of our log, as the log entries
+        or the part of the snapshot in them, the data whose blobs go ahead of them, and whether it is the last page.
+        The data is picked here, such that the pages can be made outside of the event loop while the store changes
+        """
+        if log_id != self.log_id:
+            # the replica has not caught up from this run of ours, so only a log reaching back to the start will do
+            since = 0
+        if since >= self.log_floors.get(pid, 0):
+            entries = [data for index, data in self.commit_logs.get(pid, ()) if index > since]
+            log.info("%s sends %d log entries of partition %r", self.info, len(entries), pid)
+            return ((batch, b'', batch, last) for batch, last in entry_pages(entries, self.catch_up_page))
+        held = [data for key, data in self.store.items() if self.partition_id(key) == pid]
+        log.info("%s sends a snapshot of the %d keys of partition %r", self.info, len(held), pid)
+        return (([], snapshot, fed, last) for snapshot, fed, last in snapshot_pages(held, self.catch_up_page))
+
+    @asyncio.coroutine
+    def serve_catch_up(self, conn: FramedConnection, frame: Frame, msg: CatchUpRequest):
+        pages, index, _ = self.transfers.pop(msg.transfer_id, (None, 0, None))
+        if pages is None and msg.page == 0:
+            log.debug("%s starts transfer %x to %s", self.info, msg.transfer_id, msg.sender)
+            index = self.commit_indexes.get(msg.partition, 0)
+            pages = self.transfer_pages(msg.partition, msg.log_id, msg.index)
+        if pages is None:
+            conn.reply(frame, *self.encode(CatchUpResponse(self.info, msg.transfer_id, msg.page, gone=True)))
+            return
+        # most of a page of a snapshot is spent in zlib, which lets go of the interpreter while it works
+        batch, snapshot, sent, last = yield from self.loop.run_in_executor(None, next, pages)
+        blobs = [data.blob for data in sent if data.blob is not None]
+        # the transfers wait for their turn here, such that they only take so much of the bandwidth from the rounds
+        yield from self.transfer_bucket.take(len(snapshot) + sum(len(data.content) for data in batch) +
+                                             sum(blob.size for blob in blobs))
+        yield from self.stream_blobs(conn, blobs)
+        if conn.is_closed():
+            return
+        conn.reply(frame, *self.encode(CatchUpResponse(self.info, msg.transfer_id, msg.page, self.log_id, index,
+                                                       batch, snapshot, last)))
+        if not last:
+            self.transfers[msg.transfer_id] = (pages, index, self.loop.time())
+        yield from conn.drain()
+
+    def new_round(self, write_id: int, refs: List[DataRef], structure: List[List[ServerInfo]],
+                  batch: List[Data] = None) -> WriteRound:
+        write_round = WriteRound(write_id, refs, structure, self.loop.time(), batch)
+        self.rounds[write_id] = write_round
+        return write_round
+
+    def new_read_round(self, read_id: int, key: str, structure: List[List[ServerInfo]]) -> ReadRound:
+        read_round = ReadRound(read_id, key, self.store.get(key), structure, self.loop.time())
+        self.rounds[read_id] = read_round
+        return read_round
+
+    def enqueue_write(self, client: Client, data: Data):
+        if data.blob is None and len(data.content) > CHUNK_SIZE:
+            # a large content sent inline by the client is moved to the blob store, before it is replicated
+            data = Data(content="", version_number=data.version_number,
+                        blob=self.blobs.put(data.content.encode('utf-8')), key=data.key)
+        elif self.missing_blobs([data]):
+            log.warning("%s is missing the blob of a write from %s", self.info, client)
+            asyncio.async(self.send_message_to_client(
+                client, ClientDataResponse(self.info, data.version_number, False)))
+            return
+
+        # the writes of a batch all belong to the same partition, since it is committed by the quorum of one tree
+        pid = self.partition_id(data.key)
+        if pid not in self.pending_writes:
+            self.batch_started[pid] = self.loop.time()
+        pending = self.pending_writes.setdefault(pid, [])
+        pending.append((client, data))
+        if len(pending) >= self.max_batch_size:
+            self.flush_writes(pid)
+        elif pid not in self.batch_handles:
+            self.batch_handles[pid] = self.loop.call_later(self.batch_window, self.flush_writes, pid)
+
+    def flush_writes(self, pid: str):
+        """starts one quorum round for all the client writes to the partition collected so far"""
+        handle = self.batch_handles.pop(pid, None)
+        if handle is not None:
+            handle.cancel()
+
+        pending = self.pending_writes.pop(pid, [])
+        if len(pending) > 0:
+            _, structure = self.partition(pending[0][1].key)
+            # every round gets its own id, such that many rounds can be in progress at the same time
+            batch = [data for _, data in pending]
+            write_round = self.new_round(random.getrandbits(64), [DataRef.of(data) for data in batch], structure, batch)
+            write_round.started = self.batch_started.pop(pid, write_round.started)
+            write_round.clients = pending
+            write_round.is_top_node = True
+            self.request_quorum(write_round, 0)
+
+    def sweep_rounds(self):
+        """forgets the rounds which never finished, eg. because a message to or from them was lost"""
+        deadline = self.loop.time() - self.round_timeout
+        for round_id, quorum_round in list(self.rounds.items()):
+            if quorum_round.started < deadline:
+                log.warning("%s gives up on round %x", self.info, round_id)
+                self.end_round(quorum_round)
+                if isinstance(quorum_round, WriteRound) and quorum_round.voted:
+                    # the write may have been committed without us, so we catch up on what we may have missed
+                    self.start_catch_up(self.partition_id(quorum_round.refs[0].key))
+        # the requests of a sender may overtake each other, so the missing ones get a level timeout to show up
+        quiet = self.loop.time() - self.level_timeout
+        for (sender, pid, lvl), stream in self.write_streams.items():
+            if stream.heard < stream.highest and stream.last < quiet:
+                missed = stream.highest - stream.heard
+                log.warning("%s missed %d write requests from %s", self.info, missed, sender)
+                stream.heard = stream.highest
+                # the sender holds the writes, whereas the rest of our group may have missed them through us
+                self.start_catch_up(pid, sender)
+                # the groups we pass the writes on to have missed them as well, which they notice by the numbers
+                # we skip, and then catch up from us
+                for lower in range(lvl + 1, len(self.network_structure) if self.ring is None else 1):
+                    self.write_seqs[(pid, lower)] = self.write_seqs.get((pid, lower), 0) + missed
+        # a write whose data could not be fetched has left its rounds without being written
+        for write_id in [write_id for write_id in self.held_reads if write_id not in self.rounds]:
+            self.release_reads(write_id)
+        for transfer_id, (pages, index, asked) in list(self.transfers.items()):
+            if asked < deadline:
+                log.warning("%s gives up on transfer %x", self.info, transfer_id)
+                del self.transfers[transfer_id]
+        self.sweep_handle = self.loop.call_later(self.round_timeout / 2, self.sweep_rounds)
+
+    def request_quorum(self, quorum_round: QuorumRound, lvl: int):
+        """
+        assembles a quorum of the groups at the given level, with this node acting as leader of its own group.
+        At the bottom level the members are the replicas themselves and this node votes for itself right away,
+        at the virtual levels this node represents its own group by assembling a quorum in the level below it
+                             ______________________________0____________________________
+                            |                              |                            |
+                     _______0_________            _________9_________          ________18_________
+                    |       |         |          |         |         |        |         |         |
+                   ...     ...       ...        ...       ...       ...      ...       ...       ...
+        Only as many members as needed for a majority are asked at first, the ones which answered fastest before,
+        and the rest are kept as spares, which are asked as well when one of the first ones is slow or rejects
+        """
+        level = quorum_round.levels[lvl]
+        level.started = self.loop.time()
+        if lvl < len(quorum_round.structure) - 1:
+            self.stand_in_for_suspects(quorum_round, lvl)
+        # suspected members are left for the spares, such that the round does not wait on them to time out
+        others = sorted([s for s in quorum_round.structure[lvl] if s != self.info],
+                        key=lambda s: (self.suspected(s, level.started), self.peer_latency.get((s, lvl), 0.0)))
+        # our own vote is one of the majority
+        first = self.majority(quorum_round.structure[lvl]) - 1
+        level.spares = others[first:]
+        self.send_quorum_requests(quorum_round, lvl, others[:first])
+
+        if len(level.spares) > 0:
+            expected = max([self.peer_latency.get((s, lvl), self.hedge_delay) for s in others[:first]] or [0.0])
+            level.timers.append(self.loop.call_later(self.hedge_factor * expected, self.hedge, quorum_round, lvl))
+        # a level waits for the levels below it, so it gets their time as well
+        deadline = self.level_timeout * (len(quorum_round.structure) - lvl)
+        level.timers.append(self.loop.call_later(deadline, self.level_timed_out, quorum_round, lvl))
+
+        if lvl == len(quorum_round.structure) - 1:
+            # lowest virtual lvl has been reached.
+            # we count one vote representing ourselves
+            self.count_vote(quorum_round, lvl, self.info)
+        else:
+            # we are in one of the other virtual levels
+            # we count 0 votes so far and awaits responses
+            self.request_quorum(quorum_round, lvl + 1)
+
+    def stand_in_for_suspects(self, quorum_round: QuorumRound, lvl: int):
+        """
+        replaces the suspected members of a virtual level by a stand-in from the group they represent,
+        which assembles the quorum of the group in their place, eg. for node 1 when node 3 is suspected
+
+                 ______1______                     ______1______
+                |      |      |                   |      |      |
+              __1__  __3__  __6__      ->       __1__  __4__  __6__
+              0 1 2  3 4 5  6 7 8               0 1 2  3 4 5  6 7 8
+
+        Only the structure of the round is changed, such that the write reaches the stand-in as well
+        """
+        now = self.loop.time()
+        group = quorum_round.structure[lvl]
+        replaced = []
+        for member in group:
+            if self.suspected(member, now):
+                member = next((stand_in for stand_in in self.stand_ins.get(member, [])
+                               if stand_in not in group and not self.suspected(stand_in, now)), member)
+            replaced.append(member)
+        if replaced != group:
+            log.info("%s asks %s instead of %s in round %x", self.info,
+                     [str(s) for s in replaced if s not in group], [str(s) for s in group if s not in replaced],
+                     quorum_round.round_id)
+            quorum_round.structure = quorum_round.structure[:lvl] + [replaced] + quorum_round.structure[lvl + 1:]
+            quorum_round.members = members_of(quorum_round.structure)
+
+    def send_quorum_requests(self, quorum_round: QuorumRound, lvl: int, members: List[ServerInfo]):
+        level = quorum_round.levels[lvl]
+        sends = self.send_message_to_many(members, quorum_round.quorum_request(self.info, lvl), ignores=set())
+        for member, task in sends.items():
+            level.sends[member] = task
+            task.add_done_callback(curry(self.request_sent, quorum_round, lvl, member))
+
+    def request_sent(self, quorum_round: QuorumRound, lvl: int, member: ServerInfo, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            # a member which can not be reached counts as rejecting, such that a spare is asked right away
+            self.reject_vote(quorum_round, lvl, member)
+
+    def level_is_open(self, quorum_round: QuorumRound, lvl: int) -> bool:
+        """whether the round is still in progress and the level has not reached its quorum yet"""
+        return (self.rounds.get(quorum_round.round_id) is quorum_round
+                and quorum_round.count_quorum(lvl) < self.majority(quorum_round.structure[lvl]))
+
+    def hedge(self, quorum_round: QuorumRound, lvl: int):
+        """asks the spare members of the level, because the ones asked first are too slow"""
+        if not self.level_is_open(quorum_round, lvl):
+            return
+        level = quorum_round.levels[lvl]
+        waited = self.loop.time() - level.started
+        for member in level.sends:
+            if member not in level.votes and member not in level.rejections:
+                # the member is at least this slow, so it is not among the first ones asked next time
+                key = (member, lvl)
+                self.peer_latency[key] = max(self.peer_latency.get(key, 0.0), waited)
+
+        spares, level.spares = level.spares, []
+        if len(spares) > 0:
+            log.info("%s hedges round %x at level %d", self.info, quorum_round.round_id, lvl)
+            self.send_quorum_requests(quorum_round, lvl, spares)
+
+    def reject_vote(self, quorum_round: QuorumRound, lvl: int, voter: ServerInfo):
+        if not self.level_is_open(quorum_round, lvl):
+            return
+        level = quorum_round.levels[lvl]
+        level.rejections.add(voter)
+        group = quorum_round.structure[lvl]
+        if len(group) - len(level.rejections) < self.majority(group):
+            # not enough members are left to accept, so there is no point in waiting for the rest
+            self.fail_level(quorum_round, lvl)
+        else:
+            self.hedge(quorum_round, lvl)
+
+    def level_timed_out(self, quorum_round: QuorumRound, lvl: int):
+        if self.level_is_open(quorum_round, lvl):
+            self.fail_level(quorum_round, lvl)
+
+    def fail_level(self, quorum_round: QuorumRound, lvl: int):
+        if lvl > quorum_round.entry_level:
+            # the group we lead at this level can not accept, which counts as our rejection one level up,
+            # where the other groups may still make up a majority without us
+            quorum_round.levels[lvl].cancel()
+            self.reject_vote(quorum_round, lvl - 1, self.info)
+        else:
+            self.fail_round(quorum_round, lvl)
+
+    def end_round(self, quorum_round: QuorumRound):
+        quorum_round.cancel()
+        if self.rounds.get(quorum_round.round_id) is quorum_round:
+            del self.rounds[quorum_round.round_id]
+        self.release_reads(quorum_round.round_id)
+
+    def hold_read(self, conn: FramedConnection, frame: Frame, key: str) -> bool:
+        """
+        holds back a read of the key while we have voted for a newer version of it, which has not reached us yet.
+        The write may have been acknowledged to its client already, so answering from our data would let
+        the client read an older value than the one it wrote. Returns whether the read was held back
+        """
+        known = self.store.get(key)
+        for round_id, quorum_round in self.rounds.items():
+            if not isinstance(quorum_round, WriteRound) or not quorum_round.voted:
+                continue
+            if any(ref.key == key and (known is None or ref.version_number > known.version_number)
+                   for ref in quorum_round.refs):
+                self.held_reads.setdefault(round_id, []).append((conn, frame))
+                return True
+        return False
+
+    def release_reads(self, write_id: int):
+        """handles the reads held back by the write again, once it has been written or given up on"""
+        for conn, frame in self.held_reads.pop(write_id, []):
+            self.handle_frame(conn, frame)
+
+    def fail_round(self, quorum_round: QuorumRound, lvl: int):
+        log.warning("%s failed round %x at level %d", self.info, quorum_round.round_id, lvl)
+        self.end_round(quorum_round)
+        if not quorum_round.is_top_node:
+            if isinstance(quorum_round, WriteRound):
+                asyncio.async(self.send_message_to(
+                    quorum_round.quorum_requester_info,
+                    quorum_round.quorum_response(self.info, quorum_round.entry_level - 1, accept=False)))
+        elif isinstance(quorum_round, WriteRound):
+            for client, data in quorum_round.clients:
+                asyncio.async(self.send_message_to_client(
+                    client, ClientDataResponse(self.info, data.version_number, False)))
+        else:
+            asyncio.async(self.send_message_to_client(
+                quorum_round.client_request_info, ClientReadResponse(self.info, None)))
+
+    def count_vote(self, quorum_round: QuorumRound, lvl: int, voter: ServerInfo):
+        level = quorum_round.levels[lvl]
+        level.votes[voter] = True
+        if voter != self.info:
+            key = (voter, lvl)
+            latency = self.loop.time() - level.started
+            self.peer_latency[key] = latency if key not in self.peer_latency \
+                else 0.8 * self.peer_latency[key] + 0.2 * latency
+        quorum_count = quorum_round.count_quorum(lvl)
+        log.debug("%s - lvl: %d, count: %d", self.info, lvl, quorum_count)
+
+        # only the vote which completes the quorum moves the round along, later votes are just counted
+        if quorum_count != self.majority(quorum_round.structure[lvl]):
+            return
+        # the requests which are still on their way are no longer needed
+        level.cancel()
+        self.metrics.record('quorum_wait_level_%d' % lvl, self.loop.time() - level.started)
+
+        if lvl > quorum_round.entry_level:
+            # the group we lead at this level has accepted, which counts as our vote one level up
+            self.count_vote(quorum_round, lvl - 1, self.info)
+            return
+
+        if isinstance(quorum_round, ReadRound):
+            # a read is over once it has been answered, there is nothing more to do for it
+            self.end_round(quorum_round)
+
+        if not quorum_round.is_top_node:
+            if isinstance(quorum_round, WriteRound):
+                quorum_round.voted = True
+            pipe(
+                quorum_round.quorum_response(self.info, lvl - 1),
+                curry(self.send_message_to,
+                      quorum_round.quorum_requester_info),
+                asyncio.async
+            )
+        elif isinstance(quorum_round, WriteRound):
+            durable = self.write_data(quorum_round, 0)
+            self.end_round(quorum_round)
+            # we hold the latest data of the partition we know of, until we see another write to it
+            self.fresh_until[self.partition_id(quorum_round.batch[0].key)] = \
+                self.loop.time() + self.stale_read_window
+            asyncio.async(self.acknowledge(quorum_round, durable))
+        else:
+            self.metrics.record('read', self.loop.time() - quorum_round.started)
+            asyncio.async(self.send_message_to_client(
+                quorum_round.client_request_info, ClientReadResponse(self.info, quorum_round.data)))
+
+    @asyncio.coroutine
+    def acknowledge(self, write_round: WriteRound, durable: asyncio.Future):
+        # the clients are not told that their writes are committed before they are on our disk
+        yield from durable
+        # from the first write of the batch arrived, see flush_writes
+        self.metrics.record('commit', self.loop.time() - write_round.started)
+        # every client in the batch gets its own acknowledgement
+        for client, data in write_round.clients:
+            asyncio.async(self.send_message_to_client(
+                client, ClientDataResponse(self.info, data.version_number, True)))
+
+    def write_data(self, write_round: WriteRound, lvl: int) -> asyncio.Future:
+        """
+        saves the data and tells the rest of the groups at the given level, and below it, to do the same.
+        Returns the future of our own save, which is done once the data is durable
+        """
+        durable = None
+        if lvl == write_round.entry_level:
+            durable = self.save_data(write_round.batch)
+            self.remember_batch(write_round)
+
+        # every member of the group gets the next number, such that it notices the requests which never arrive
+        stream = (self.partition_id(write_round.refs[0].key), lvl)
+        seq = self.write_seqs[stream] = self.write_seqs.get(stream, 0) + 1
+        # the data is only left out for the members which told us they already hold it
+        level = write_round.levels[lvl]
+        holding = set(level.holding)
+        self.send_message_to_many(
+            servers=list(holding),
+            msg=WriteDataRequest(
+                sender=self.info,
+                version_number=write_round.batch[-1].version_number,
+                level=lvl,
+                write_id=write_round.round_id,
+                log_id=self.log_id,
+                seq=seq),
+            ignores={self.info})
+        self.send_message_to_many(
+            servers=write_round.structure[lvl],
+            msg=WriteDataRequest(
+                sender=self.info,
+                version_number=write_round.batch[-1].version_number,
+                level=lvl,
+                write_id=write_round.round_id,
+                log_id=self.log_id,
+                seq=seq,
+                batch=write_round.batch),
+            ignores=holding | {self.info})
+
+        if lvl < len(write_round.structure) - 1:
+            self.write_data(write_round, lvl + 1)
+        return durable
+
+    def heard_write(self, msg: WriteDataRequest, pid: str):
+        key = (msg.sender, pid, msg.level)
+        stream = self.write_streams.get(key)
+        if stream is None or stream.log_id != msg.log_id:
+            # the numbers start over when the sender is restarted. The requests before the first one we hear of count
+            # as missed, which is one catch-up too many when we joined after the sender started
+            stream = self.write_streams[key] = WriteStream(msg.log_id)
+        stream.highest = max(stream.highest, msg.seq)
+        # a request which arrives after it was given up on is not counted, such that it does not hide a later one
+        stream.heard = min(stream.heard + 1, stream.highest)
+        stream.last = self.loop.time()
+
+    def commit(self, write_round: WriteRound, lvl: int):
+        """writes the data of a round whose write request has reached this node at the given level"""
+        if lvl < len(write_round.structure):
+            self.write_data(write_round, lvl)
+        else:
+            self.save_data(write_round.batch)
+        self.release_reads(write_round.round_id)
+
+    def update_network_structure(self, network_structure: List[List[ServerInfo]],
+                                 stand_ins: Dict[ServerInfo, List[ServerInfo]] = None):
+        """
+        replaces the network structure, eg. after the membership has changed, see Topology.rebuild.
+        Rounds in progress finish with the structure they started with
+        """
+        self.network_structure = network_structure
+        if stand_ins is not None:
+            self.stand_ins = stand_ins
+        self.peers = self.peers_in(network_structure)
+        for peer in list(self.detector.histories):
+            if peer not in self.peers:
+                self.detector.forget(peer)
+
+    @asyncio.coroutine
+    def ping(self, recipient: ServerInfo) -> float:
+        """sends a TESTMSG and returns the number of seconds it took before the reply came back"""
+        started = self.loop.time()
+        yield from self.pool.request(recipient, *self.encode(TESTMSG()))
+        return self.loop.time() - started
+
+    def connection_closed(self, conn: FramedConnection):
+        # transfers which were cut off by the connection closing are thrown away
+        receiver = self.receivers.pop(conn, None)
+        if receiver is not None:
+            receiver.abort()
+
+    # The 'main' method of the server
+    # Each time a message is received, this method is responsible for processing it
+    def handle_frame(self, conn: FramedConnection, frame: Frame):
+        started = time.process_time()
+        try:
+            if frame.tag == BLOB_CHUNK_TAG:
+                # chunks are written to the blob store as they arrive, instead of being decoded as a message
+                receiver = self.receivers.get(conn)
+                if receiver is None:
+                    receiver = self.receivers[conn] = BlobReceiver(self.blobs)
+                blob = receiver.receive(frame.payload)
+                self.metrics.received('BlobChunk', len(frame.payload))
+                if blob is not None:
+                    log.debug("%s received %s", self.info, blob)
+                return
+
             # decodes the object from bytes
-            msg = pickle.loads(msg_raw)
+            msg = self.decode(frame)
+            if isinstance(msg, Message) and msg.sender in self.peers:
+                self.detector.heard(msg.sender, self.loop.time())
 
             if isinstance(msg, TESTMSG):
-                print("%s got TESTMSG" % self.info)
+                log.debug("%s got TESTMSG", self.info)
+
+                # writing back response on the same connection
+                if frame.flags == FLAG_REQUEST:
+                    conn.reply(frame, *self.encode(TESTMSG()))
+
+            elif isinstance(msg, Heartbeat):
+                # the ping has been counted by the failure detector already, so it is only answered
+                if frame.flags == FLAG_REQUEST:
+                    conn.reply(frame, *self.encode(Heartbeat(self.info)))
 
-                # writing back response
-                writer.write(pickle.dumps(TESTMSG))
-                yield from writer.drain()
-                writer.close()
+            elif isinstance(msg, StatsRequest):
+                stats = StatsResponse(self.info, json.dumps(self.stats()))
+                if frame.flags == FLAG_REQUEST:
+                    conn.reply(frame, *self.encode(stats))
+                else:
+                    asyncio.async(self.send_message_to_client(msg.sender, stats))
 
             elif isinstance(msg, ClientDataMessage):
                 """
@@ -126,78 +1262,57 @@ class DataRepNode:
                     |       |         |          |         |         |        |         |         |
                    ...     ...       ...        ...       ...       ...      ...       ...       ...
                 """
-                self.temp_data = msg.data
-                self.client_request_info = msg.sender
-                self.is_top_node = True
-
-                self.send_message_to_many(
-                    servers=self.network_structure[0],
-                    msg=QuorumRequest(self.info, msg.data, 0),
-                    ignores=[self.info])
-                self.level_quorum_count = self.create_empty_quorum_count(self.network_structure)
-                # the top node is also in some group at the lowest lvl
-                self.level_quorum_count[-1][self.info] = True
-
-                # send immediately to its own bottom group
-                # and act as leader of that group by setting level to second highest value
-                self.send_message_to_many(
-                    servers=self.network_structure[-1],
-                    msg=QuorumRequest(
-                        sender=self.info,
-                        data=msg.data,
-                        level=len(self.network_structure) - 1
-                    ),
-                    ignores=[self.info]
-                )
+                client = self.client_of(conn, frame, msg)
+                if self.partition(msg.data.key) is None:
+                    self.forward(msg.data.key, msg, client)
+                    return
+                # the write waits a little for other writes, such that they can share one quorum round
+                self.enqueue_write(client, msg.data)
 
             elif isinstance(msg, QuorumRequest):
                 """
                 Quorum request received at one of the virtual layers
                 If the node is in the lowest level then it should reply with a Quorum replay
-                else if the node is in the second lowest level then it should count one vote for itself
-                    and send quorum request to the other nodes in its group
-                    and wait for at least one of them to reply.
-                    When reply is received then it should send quorum response back to its parent.
-                else it should send the quorum request to the responsible node in the next level group
-                    and wait for enough quorum replies such that it has at least two.
-                    When a consensus of at least two has been reached, it sends quorum reply to its parent.
+                else it should act as leader of its own group in the next level,
+                    by sending quorum request to the other nodes in that group and counting one vote for itself
+                    and wait for enough quorum replies such that it has a majority.
+                    When a majority has been reached, it sends quorum reply to its parent.
                              ______________________________0____________________________
                             |                              |                            |
                      _______0_________            _________9_________          ________18_________      <- a node in a virtual level has received message
                     |       |         |          |         |         |        |         |         |
                    ...     ...       ...        ...       ...       ...      ...       ...       ...    <- or a node in the bottom layer has received message
                """
-                print("%s got quorum request from %s (LVL: %d)" % (self.info, msg.sender, msg.level))
+                log.debug("%s got quorum request from %s (LVL: %d)", self.info, msg.sender, msg.level)
                 current_lvl = msg.level + 1
-                if current_lvl < len(self.network_structure):
-                    self.quorum_requester_info = msg.sender
-
-                    self.send_message_to_many(
-                        servers=self.network_structure[current_lvl],
-                        msg=QuorumRequest(
-                            sender=self.info,
-                            data=msg.data,
-                            level=current_lvl),
-                        ignores=[self.info])
-
-                    if current_lvl == len(self.network_structure) - 1:
-                        # lowest virtual lvl has been reached.
-                        # we count one vote representing ourselves
-                        self.level_quorum_count[current_lvl][self.info] = True
-                    else:
-                        # we are in one of the other virtual levels
-                        # we count 0 votes so far and awaits responses
-                        self.level_quorum_count[current_lvl][msg.sender] = False
+                partition = self.partition(msg.refs[0].key)
+                if partition is None:
+                    log.warning("%s got quorum request for a partition it does not hold", self.info)
+                    return
+                pid, structure = partition
+                # someone else is writing, so our data of the partition may no longer be the latest
+                self.fresh_until.pop(pid, None)
+                if msg.write_id in self.rounds and current_lvl < len(self.rounds[msg.write_id].structure):
+                    # we already take part in this round as leader of our group, which is not done twice
+                    log.debug("%s already takes part in write %x", self.info, msg.write_id)
+                    return
+
+                # the round waits for the data to come with the write request, unless we already hold it
+                write_round = self.rounds.get(msg.write_id) or \
+                    self.new_round(msg.write_id, msg.refs, structure, self.held_batch(msg.refs))
+                if current_lvl < len(write_round.structure):
+                    write_round.quorum_requester_info = msg.sender
+                    write_round.entry_level = current_lvl
+                    self.request_quorum(write_round, current_lvl)
                 else:
                     # lowest bottom level has been reached
                     # we send quorum reply back
+                    write_round.entry_level = current_lvl
+                    write_round.voted = True
                     asyncio.async(
                         self.send_message_to(
                             recipient=msg.sender,
-                            msg=QuorumResponse(
-                                sender=self.info,
-                                accept_changes=True,
-                                level=current_lvl)))
+                            msg=write_round.quorum_response(self.info, msg.level)))
 
             elif isinstance(msg, QuorumResponse):
                 """
@@ -208,83 +1323,174 @@ class DataRepNode:
                     |       |         |          |         |         |        |         |         |
                    ...     ...       ...        ...       ...       ...      ...       ...       ...
                """
-                current_lvl = msg.level - 1
-                if msg.sender in self.network_structure[-1]:
-                    self.level_quorum_count[current_lvl][msg.sender] = True
-                    if self.count_quorum(current_lvl) >= 2:
-                        self.level_quorum_count[current_lvl - 1][self.info] = True
+                write_round = self.rounds.get(msg.write_id)
+                if write_round is None:
+                    # the round has already finished, so the response is not needed
+                    return
+                if msg.sender not in write_round.members[msg.level]:
+                    log.warning("%s got a vote from %s, which is not in level %d", self.info, msg.sender, msg.level)
+                    return
+                if msg.accept_changes:
+                    if msg.holds_data:
+                        write_round.levels[msg.level].holding.add(msg.sender)
+                    self.count_vote(write_round, msg.level, msg.sender)
                 else:
-                    self.level_quorum_count[current_lvl][msg.sender] = True
+                    self.reject_vote(write_round, msg.level, msg.sender)
 
-                print("%s - lvl: %d, count: %d" % (self.info, current_lvl, self.count_quorum(current_lvl)))
+            elif isinstance(msg, WriteDataRequest):
+                current_lvl = msg.level + 1
+                log.debug("%s got write request", self.info)
 
-                if self.count_quorum(current_lvl) >= 2:
+                write_round = self.rounds.pop(msg.write_id, None)
+                if self.missing_blobs(msg.batch):
+                    # the blobs of the batch should have arrived before the request, so the transfer has failed
+                    log.warning("%s got write request %x with missing blobs", self.info, msg.write_id)
+                    if self.partition(msg.batch[0].key) is not None:
+                        self.start_catch_up(self.partition_id(msg.batch[0].key))
+                    return
+                if write_round is None and len(msg.batch) > 0:
+                    partition = self.partition(msg.batch[0].key)
+                    if partition is None:
+                        log.warning("%s got write request for a partition it does not hold", self.info)
+                        return
+                    # we were not asked during the quorum, or have forgotten the round
+                    write_round = WriteRound(msg.write_id, [DataRef.of(data) for data in msg.batch], partition[1],
+                                             self.loop.time())
+                    write_round.entry_level = current_lvl
+                if write_round is not None:
+                    write_round.cancel()
+                    if len(msg.batch) > 0:
+                        write_round.batch = msg.batch
+                    self.heard_write(msg, self.partition_id(write_round.refs[0].key))
+                if write_round is None or write_round.batch is None:
+                    # the data was left out, but we do not hold it (anymore), so we get it from the sender
+                    asyncio.async(self.fetch_batch(msg.sender, msg.write_id, write_round, current_lvl))
+                    return
+                self.commit(write_round, current_lvl)
 
-                    if current_lvl == 0:
-                        self.save_data()
+            elif isinstance(msg, DataFetchRequest):
+                # a member below us is missing the data of a write we committed
+                asyncio.async(self.serve_fetch(conn, frame, msg.write_id))
 
-                        self.send_message_to_many(
-                            servers=self.network_structure[0],
-                            msg=WriteDataRequest(
-                                sender=self.info,
-                                version_number=0,
-                                level=0),
-                            ignores=[self.info])
-                    elif not self.is_top_node:
+            elif isinstance(msg, CatchUpRequest):
+                # a member of our group has fallen behind, and pulls the data it lacks
+                if frame.flags == FLAG_REQUEST:
+                    asyncio.async(self.serve_catch_up(conn, frame, msg))
 
-                        pipe(
-                            QuorumResponse(
-                                sender=self.info,
-                                accept_changes=True,
-                                level=current_lvl),
-                            curry(self.send_message_to,
-                                  self.quorum_requester_info),
-                            asyncio.async
-                        )
+            elif isinstance(msg, ClientReadMessage):
+                """
+                client reads from some node..
+                if stale reads are allowed and the node committed the last write it saw of the partition,
+                it answers right away from its own data,
+                otherwise it assembles a read quorum the same way as for writes,
+                where every level reports the newest version it has seen back up the tree
+                """
+                client = self.client_of(conn, frame, msg)
+                partition = self.partition(msg.key)
+                if partition is None:
+                    self.forward(msg.key, msg, client)
+                    return
+                pid, structure = partition
+                if self.hold_read(conn, frame, msg.key):
+                    return
+                if self.stale_reads and self.loop.time() < self.fresh_until.get(pid, 0.0):
+                    asyncio.async(self.send_message_to_client(
+                        client, ClientReadResponse(self.info, self.store.get(msg.key))))
+                else:
+                    read_round = self.new_read_round(random.getrandbits(64), msg.key, structure)
+                    read_round.client_request_info = client
+                    read_round.is_top_node = True
+                    self.request_quorum(read_round, 0)
 
-            elif isinstance(msg, WriteDataRequest):
+            elif isinstance(msg, QuorumReadRequest):
                 current_lvl = msg.level + 1
-                print("%s got write request" % self.info)
-
-                self.save_data()
+                partition = self.partition(msg.key)
+                if partition is None:
+                    log.warning("%s got read request for a partition it does not hold", self.info)
+                    return
+                _, structure = partition
+                if self.hold_read(conn, frame, msg.key):
+                    return
+                if current_lvl < len(structure):
+                    if msg.read_id in self.rounds:
+                        log.debug("%s already takes part in read %x", self.info, msg.read_id)
+                        return
+                    read_round = self.new_read_round(msg.read_id, msg.key, structure)
+                    read_round.quorum_requester_info = msg.sender
+                    read_round.entry_level = current_lvl
+                    self.request_quorum(read_round, current_lvl)
+                else:
+                    # lowest bottom level has been reached, so we report our own data
+                    asyncio.async(
+                        self.send_message_to(
+                            recipient=msg.sender,
+                            msg=QuorumReadResponse(
+                                sender=self.info,
+                                level=msg.level,
+                                read_id=msg.read_id,
+                                data=self.store.get(msg.key))))
 
-                if current_lvl < len(self.level_quorum_count):
-                    self.send_message_to_many(
-                        servers=self.network_structure[current_lvl],
-                        msg=WriteDataRequest(self.info, 0, current_lvl),
-                        ignores=[self.info])
+            elif isinstance(msg, QuorumReadResponse):
+                read_round = self.rounds.get(msg.read_id)
+                if read_round is None:
+                    # the read has already been answered
+                    return
+                if msg.sender not in read_round.members[msg.level]:
+                    log.warning("%s got a vote from %s, which is not in level %d", self.info, msg.sender, msg.level)
+                    return
+                read_round.add_data(msg.data)
+                self.count_vote(read_round, msg.level, msg.sender)
 
             else:
-                print('%s received not supported message type!' % self.info)
-                print(msg)
+                log.warning('%s received not supported message type %s', self.info, type(msg).__name__)
 
         except Exception as e:
-            print("exception: %r" % e)
-
-    def count_quorum(self, lvl: int) -> int:
-        return count([q for q in self.level_quorum_count[lvl].values() if q])
+            log.warning("%s exception: %r", self.info, e)
+        finally:
+            self.cpu_time += time.process_time() - started
 
     def kill(self):
+        self.sweep_handle.cancel()
+        self.heartbeat_handle.cancel()
+        for task in list(self.catching_up.values()) + list(self.handovers):
+            task.cancel()
+        self.metrics.close()
+        for quorum_round in self.rounds.values():
+            quorum_round.cancel()
+        for handle in self.batch_handles.values():
+            handle.cancel()
+        self.queues.close()
+        self.pool.close()
+        if self.wal is not None:
+            self.wal.close()
+        self.blobs.close()
         self.server.close()
         self.loop.run_until_complete(self.server.wait_closed())
 
+    @staticmethod
+    def client_of(conn: FramedConnection, frame: Frame, msg: Message) -> Client:
+        return ClientRequest(conn, frame, msg.sender) if frame.flags == FLAG_REQUEST else msg.sender
+
     @asyncio.coroutine
-    def send_message_to_client(self, message):
-        if self.client_request_info is not None:
-            print("%s sending reply to client")
-            reader, writer = yield from asyncio.open_connection(
-                host=self.client_request_info.ip,
-                port=self.client_request_info.port,
-                loop=self.loop)
-            writer.write(pickle.dumps(message))
-            writer.close()
-        else:
-            raise Exception("%s has no client info" % self.info)
+    def send_message_to_client(self, client: Client, message):
+        log.debug("%s sending reply to client", self.info)
+        if isinstance(client, ClientRequest):
+            if client.conn.is_closed():
+                log.debug("%s can not answer %s, who has gone", self.info, client)
+                return
+            # the blobs go ahead of the reply on the same connection, like they do ahead of a message
+            yield from self.stream_blobs(client.conn, self.blobs_of(message))
+            client.conn.reply(client.frame, *self.encode(message))
+            return
+        yield from self.send_blobs_of(client, message)
+        tag, payload = self.encode(message)
+        yield from self.queues.send(client, tag, payload, self.lane_of(message))
 
 
 if __name__ == "__main__":
     # the backbone of async is its event loop which is responsible for running the tasks you give it
     loop = asyncio.get_event_loop()
+    start_logging()
 
     servers = []
     for i in range(1, 10):
@@ -298,30 +1504,11 @@ if __name__ == "__main__":
     #          __0__    __3__    __6__
     #         |  |  |  |  |  |  |  |  |
     #         0  1  2  3  4  5  6  7  8
-
-    #       [[4,9,18],[4,0,6],[4,3,5]]
-    #              ______________________________0____________________________
-    #             |                              |                            |
-    #      _______0_________            _________9_________          ________18_________
-    #     |       |         |          |         |         |        |         |         |
-    #   __0__   __4__     __6__      __9__     _12__     _15__    _18__     _21__     _24__
-    #  |  |  | |  |  |   |  |  |    |  |  |   |  |  |   |  |  |  |  |  |   |  |  |   |  |  |
-    #  0  1  2 3  4  5   6  7  8    9 10 11  12 13 14  15 16 17 18 19 20  21 22 23  24 25 26
-
-    # use index as virtual group identifier?
+    # see Topology.py for how the structures are built for other numbers of servers and fanouts
     started_servers = []
-    netgroups = partition_all(3, servers)
-    first_level = [g[0] for g in netgroups]
-
-    for i in range(9):
-        if i < 3:
-            net_group = [first_level, servers[:3]]
-        elif i < 6:
-            net_group = [first_level, servers[3:6]]
-        else:
-            net_group = [first_level, servers[6:]]
-
-        node = DataRepNode(servers[i], net_group, loop, initial_data)
+    structures = Topology.network_structures(servers, fanout=3)
+    for server, net_group in zip(servers, structures):
+        node = DataRepNode(server, net_group, loop, initial_data, stand_ins=Topology.stand_ins(structures))
         started_servers.append(node)
 
     try:
@@ -332,5 +1519,6 @@ if __name__ == "__main__":
         for s in started_servers:
             s.kill()
         loop.close()
+        stop_logging()
         print('over and out')
 
@@ -0,0 +1,124 @@
+"""
+This file contains a phi accrual failure detector, which tells how likely it is that a peer has failed,
+instead of a yes or no after a fixed timeout, see Hayashibara et al., The phi accrual failure detector (2004).
+
+Every message from a peer counts as a heartbeat, so a peer which takes part in the rounds is never pinged,
+and a node only pings a peer it has not heard from for a heartbeat interval, which answers with a heartbeat.
+The detector keeps the intervals between the heartbeats of every peer, and from their mean and standard deviation
+tells how unlikely it is that the next one still comes, given how long it has been since the last one
+    phi = -log10(P(the next heartbeat comes later than now))
+such that phi 1 means a 10% chance of a mistake when suspecting the peer, phi 2 a 1% chance, phi 8 a 10^-8 chance.
+A peer whose phi is above the threshold is suspected, which it is until it is heard from again.
+A peer is watched from the first time we try to reach it, as if it had been heard from then, such that a peer
+which is already down when we start, and so is never heard from, is suspected as well.
+
+Messages come in bursts during the rounds, and an interval of a millisecond tells nothing about when the next
+message comes once the rounds are over, so intervals shorter than min_interval are not counted.
+"""
+__author__ = 'michel'
+
+# -- python core libs -- #
+import math
+
+# https://docs.python.org/3/library/collections.html#collections.deque
+# the latest intervals of a peer, where the oldest one is dropped when a new one comes in
+from collections import deque
+
+# -- python community libs -- #
+from typing import Any, Dict, List
+
+
+class HeartbeatHistory:
+    def __init__(self, window: int, first_interval: float, now: float):
+        self.intervals = deque(maxlen=window)
+        self.total = 0.0
+        self.squares = 0.0
+        self.last = now  # when the peer was last heard from, or first watched
+        self.sampled = now  # the start of the interval being measured
+        self.answered = False  # whether the peer has been heard from at all
+        # a peer heard from only once has no intervals yet, so the expected interval stands in for them
+        self.add(first_interval * 0.75)
+        self.add(first_interval * 1.25)
+
+    def add(self, interval: float):
+        if len(self.intervals) == self.intervals.maxlen:
+            oldest = self.intervals[0]
+            self.total -= oldest
+            self.squares -= oldest * oldest
+        self.intervals.append(interval)
+        self.total += interval
+        self.squares += interval * interval
+
+    def mean(self) -> float:
+        return self.total / len(self.intervals)
+
+    def std_dev(self) -> float:
+        mean = self.mean()
+        return math.sqrt(max(0.0, self.squares / len(self.intervals) - mean * mean))
+
+
+class FailureDetector:
+    def __init__(self, interval: float = 0.5, threshold: float = 8.0, window: int = 100,
+                 min_std_dev: float = None, acceptable_pause: float = None):
+        self.interval = interval  # the seconds between the heartbeats a peer sends when it has nothing else to send
+        self.threshold = threshold
+        self.window = window  # number of intervals kept per peer
+        self.min_interval = interval / 2
+        # a peer with very regular heartbeats would be suspected right after the first late one
+        self.min_std_dev = min_std_dev if min_std_dev is not None else interval / 4
+        # eg. a pause of the garbage collector or a busy event loop, which should not make the peer suspected
+        self.acceptable_pause = acceptable_pause if acceptable_pause is not None else interval
+        self.histories = dict()  # type: Dict[Any, HeartbeatHistory]
+
+    def watch(self, peer, now: float):
+        """we are about to try to reach the peer, from when on its silence counts against it"""
+        if peer not in self.histories:
+            self.histories[peer] = HeartbeatHistory(self.window, self.interval, now)
+
+    def heard(self, peer, now: float):
+        """a message, or a heartbeat, came from the peer"""
+        history = self.histories.get(peer)
+        if history is None:
+            history = self.histories[peer] = HeartbeatHistory(self.window, self.interval, now)
+        if not history.answered:
+            # how long the peer took to come up tells nothing about its heartbeats
+            history.answered = True
+            history.last = history.sampled = now
+            return
+        history.last = now
+        if now - history.sampled >= self.min_interval:
+            history.add(now - history.sampled)
+            history.sampled = now
+
+    def phi(self, peer, now: float) -> float:
+        """the suspicion level of the peer, 0 for a peer neither heard from nor watched"""
+        history = self.histories.get(peer)
+        if history is None:
+            return 0.0
+        elapsed = now - history.last
+        mean = history.mean() + self.acceptable_pause
+        std_dev = max(history.std_dev(), self.min_std_dev)
+        # a logistic approximation of the cumulative normal distribution, which is accurate to within 0.1%
+        # beyond 20 standard deviations the answer does not change, but exp would overflow
+        y = min(20.0, max(-20.0, (elapsed - mean) / std_dev))
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if elapsed > mean:
+            return -math.log10(e / (1.0 + e))
+        return -math.log10(1.0 - 1.0 / (1.0 + e))
+
+    def last_heard(self, peer) -> float:
+        """when the peer was last heard from, or None if it never was"""
+        history = self.histories.get(peer)
+        return history.last if history is not None and history.answered else None
+
+    def suspected(self, peer, now: float) -> bool:
+        return self.phi(peer, now) > self.threshold
+
+    def forget(self, peer):
+        self.histories.pop(peer, None)
+
+    def suspects(self, now: float) -> List[Any]:
+        return [peer for peer in self.histories if self.suspected(peer, now)]
+
+    def stats(self, now: float) -> dict:
+        return {str(peer): round(self.phi(peer, now), 2) for peer in self.histories}
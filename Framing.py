@@ -0,0 +1,182 @@
+"""
+This file contains the wire protocol which is spoken on every connection between servers.
+A connection stays open and carries a stream of frames in both directions, where every frame is of the form
+
+    +----------------+-----+-------+----------------+-------------------+
+    | payload length | tag | flags | correlation id | payload ...       |
+    |    4 bytes     |  1  |   1   |    4 bytes     | 'length' bytes    |
+    +----------------+-----+-------+----------------+-------------------+
+
+- the tag tells which type of message the payload contains, such that it can be dispatched without decoding it first
+- a frame flagged as request expects a frame flagged as response with the same correlation id to come back
+  on the same connection, which lets many requests be in flight on one connection at the same time
+"""
+__author__ = 'michel'
+from Metrics import log
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/struct.html
+# packing and unpacking of binary values
+import struct
+
+# https://docs.python.org/3/library/itertools.html#itertools.count
+import itertools
+
+# -- python community libs -- #
+from typing import Dict, List, Callable
+
+FRAME_HEADER = struct.Struct('!IBBI')
+
+# frame flags
+FLAG_NONE = 0  # one way message, no reply is expected
+FLAG_REQUEST = 1  # the sender awaits a response with the same correlation id
+FLAG_RESPONSE = 2  # response to the request with the same correlation id
+
+
+def payload_size(payload) -> int:
+    """the size of a payload, where a message object handed over by a transport which does not serialize has none"""
+    return len(payload) if isinstance(payload, (bytes, bytearray, memoryview)) else 0
+
+
+class Frame:
+    __slots__ = ('tag', 'flags', 'correlation_id', 'payload')
+
+    def __init__(self, tag: int, payload: bytes, flags: int = FLAG_NONE, correlation_id: int = 0):
+        self.tag = tag
+        self.flags = flags
+        self.correlation_id = correlation_id
+        self.payload = payload
+
+    def encode(self) -> bytes:
+        return FRAME_HEADER.pack(len(self.payload), self.tag, self.flags, self.correlation_id) + self.payload
+
+
+@asyncio.coroutine
+def read_frame(reader) -> Frame:
+    """
+    reads the next frame from the stream
+    returns None when the other end has closed the connection
+    """
+    try:
+        header = yield from reader.readexactly(FRAME_HEADER.size)
+        length, tag, flags, correlation_id = FRAME_HEADER.unpack(header)
+        payload = yield from reader.readexactly(length)
+        return Frame(tag, payload, flags, correlation_id)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+
+class FramedConnection:
+    """
+    A connection which both ends can use for sending messages, and for sending requests and awaiting their responses.
+    Incoming responses are matched with the pending request of the same correlation id,
+    every other incoming frame is given to the handler, which is called as handler(connection, frame)
+    """
+    def __init__(self, reader, writer, loop, handler: Callable):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.handler = handler
+        self.last_used = loop.time()
+        self.correlation_ids = itertools.count(1)
+        self.pending = dict()  # type: Dict[int, asyncio.Future]
+        # concurrent drains on the same writer are not allowed, so they take turns
+        self.drain_lock = asyncio.Lock(loop=loop)
+        # called with the connection once it has closed, from whichever end
+        self.close_callbacks = []  # type: List[Callable]
+        # a connection without a reader is given its frames by the transport, see Transport.py
+        self.reader_task = asyncio.async(self.read_frames(), loop=loop) if reader is not None else None
+
+    @asyncio.coroutine
+    def read_frames(self):
+        while True:
+            frame = yield from read_frame(self.reader)
+            if frame is None:
+                break
+            self.receive(frame)
+        self.close()
+
+    def receive(self, frame: Frame):
+        self.last_used = self.loop.time()
+        if frame.flags == FLAG_RESPONSE:
+            future = self.pending.pop(frame.correlation_id, None)
+            if future is not None and not future.done():
+                future.set_result(frame)
+        else:
+            try:
+                self.handler(self, frame)
+            except Exception as e:
+                log.warning("exception while handling frame: %r", e)
+
+    def write(self, frame: Frame):
+        self.last_used = self.loop.time()
+        # the whole frame is written in one go, such that frames written by different coroutines never interleave
+        self.writer.write(frame.encode())
+
+    def write_parts(self, tag: int, parts: List[bytes]):
+        """writes a frame whose payload is made of several parts, without copying them into one buffer first"""
+        self.last_used = self.loop.time()
+        self.writer.write(FRAME_HEADER.pack(sum(len(part) for part in parts), tag, FLAG_NONE, 0))
+        for part in parts:
+            self.writer.write(part)
+
+    @asyncio.coroutine
+    def send(self, tag: int, payload: bytes):
+        self.write(Frame(tag, payload))
+        yield from self.drain()
+
+    @asyncio.coroutine
+    def request(self, tag: int, payload: bytes, timeout: float = None) -> Frame:
+        correlation_id = next(self.correlation_ids) & 0xFFFFFFFF
+        future = asyncio.Future(loop=self.loop)
+        self.pending[correlation_id] = future
+        try:
+            self.write(Frame(tag, payload, FLAG_REQUEST, correlation_id))
+            yield from self.drain()
+            return (yield from asyncio.wait_for(future, timeout, loop=self.loop))
+        finally:
+            self.pending.pop(correlation_id, None)
+
+    def reply(self, request: Frame, tag: int, payload: bytes):
+        self.write(Frame(tag, payload, FLAG_RESPONSE, request.correlation_id))
+
+    @asyncio.coroutine
+    def drain(self):
+        with (yield from self.drain_lock):
+            yield from self.writer.drain()
+
+    def buffered(self) -> int:
+        """the number of bytes written which the transport has not yet handed to the socket"""
+        return self.writer.transport.get_write_buffer_size()
+
+    def is_closed(self) -> bool:
+        return self.writer.transport.is_closing()
+
+    def close(self):
+        self.writer.close()
+        self.fail_pending()
+        if self.reader_task is not asyncio.Task.current_task(loop=self.loop):
+            self.reader_task.cancel()
+        self.run_close_callbacks()
+
+    def add_close_callback(self, callback: Callable):
+        if self.is_closed():
+            callback(self)
+        else:
+            self.close_callbacks.append(callback)
+
+    def run_close_callbacks(self):
+        # a connection can be closed by both its reader and its owner, but the callbacks run once
+        callbacks, self.close_callbacks = self.close_callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def fail_pending(self):
+        """fails the requests still waiting for a response, which will never come"""
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError('connection closed'))
+        self.pending.clear()
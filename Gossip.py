@@ -0,0 +1,127 @@
+"""
+This file contains a membership table which is spread between servers by gossip, instead of every server
+sending its full list of servers to every other server whenever it sees a new one.
+
+Every member has an incarnation number, which is bumped by the member itself when it rejoins,
+such that a newer entry always wins over an older one.
+When a server learns about a new member, or a newer incarnation of a member, the entry becomes a rumor.
+Every gossip round, a server sends its rumors to a few randomly chosen members, and a rumor is only
+repeated for a number of rounds proportional to log(N), after which the server stops spreading it.
+Since every server which hears a rumor spreads it further, the number of servers knowing it grows exponentially,
+and all servers know it after O(log N) rounds, while every server only sends a bounded number of messages per round.
+Every message carries at most max_delta rumors, the freshest ones first, which are the ones with the most rounds left,
+and the others wait for a later round (the piggyback limit of SWIM). Without it, every message during a mass join
+carries most of the membership, and the bytes it takes for everyone to know everyone grow with N^2.
+"""
+__author__ = 'michel'
+from Messages import ServerInfo
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/random.html
+import random
+import math
+
+# https://docs.python.org/3/library/heapq.html#heapq.nlargest
+# picks the freshest rumors without sorting all of them
+import heapq
+
+# -- python community libs -- #
+from typing import AbstractSet, Dict, List, Tuple
+
+# a membership entry as sent on the wire
+Entry = Tuple[ServerInfo, int]
+
+
+class Membership:
+    def __init__(self, me: ServerInfo, members: List[ServerInfo] = (), fanout: int = 3,
+                 retransmit_multiplier: int = 2, rng: random.Random = None, max_delta: int = 64):
+        self.me = me
+        self.fanout = fanout  # number of members gossiped to every round
+        self.max_delta = max_delta  # number of rumors gossiped every round
+        self.retransmit_multiplier = retransmit_multiplier
+        self.rng = rng or random.Random()
+        self.incarnations = {me: 0}  # type: Dict[ServerInfo, int]
+        # the members in the order they joined, which random members are picked from without copying the table
+        self.ordered = [me]  # type: List[ServerInfo]
+        # member -> number of rounds left where the entry is gossiped
+        self.rumors = dict()  # type: Dict[ServerInfo, int]
+        for member in members:
+            self.add(member)
+        # the others should hear about us too
+        self.rumors[me] = self.retransmit_limit()
+
+    def __contains__(self, info: ServerInfo) -> bool:
+        return info in self.incarnations
+
+    def __len__(self) -> int:
+        return len(self.incarnations)
+
+    def members(self) -> List[ServerInfo]:
+        return list(self.incarnations)
+
+    def retransmit_limit(self) -> int:
+        return self.retransmit_multiplier * max(1, math.ceil(math.log2(len(self.incarnations) + 1)))
+
+    def add(self, info: ServerInfo, incarnation: int = 0) -> bool:
+        """adds the member if the entry is newer than what we know, returns whether it was"""
+        known = self.incarnations.get(info)
+        if known is not None and known >= incarnation:
+            return False
+        if known is None:
+            self.ordered.append(info)
+        self.incarnations[info] = incarnation
+        self.rumors[info] = self.retransmit_limit()
+        return True
+
+    def merge(self, entries: List[Entry]) -> List[ServerInfo]:
+        """merges the entries of a gossip message, and returns the members which were new or newer"""
+        news = []
+        for info, incarnation in entries:
+            if self.add(info, incarnation):
+                news.append(info)
+            elif info in self.rumors and self.incarnations[info] == incarnation:
+                # hearing our own rumor back means others spread it too, so we spread it for fewer rounds
+                self.rumors[info] -= 1
+                if self.rumors[info] <= 0:
+                    del self.rumors[info]
+        return news
+
+    def rejoin(self):
+        """bumps our own incarnation, such that the others replace whatever they know about us"""
+        self.add(self.me, self.incarnations[self.me] + 1)
+
+    def sample(self, k: int, excluding: AbstractSet[ServerInfo]) -> List[ServerInfo]:
+        """
+        k randomly chosen members, none of them excluded, or all of them if there are not that many.
+        Picks are drawn until k different ones are found, which takes about k draws when the table is much larger
+        than k, instead of copying the whole table first
+        """
+        candidates = len(self.ordered) - sum(1 for info in excluding if info in self.incarnations)
+        if candidates <= 2 * k:
+            others = [info for info in self.ordered if info not in excluding]
+            return self.rng.sample(others, min(k, len(others)))
+        chosen = []  # type: List[ServerInfo]
+        while len(chosen) < k:
+            info = self.ordered[self.rng.randrange(len(self.ordered))]
+            if info not in excluding and info not in chosen:
+                chosen.append(info)
+        return chosen
+
+    def targets(self) -> List[ServerInfo]:
+        """the randomly chosen members to gossip to in this round"""
+        return self.sample(self.fanout, {self.me})
+
+    def next_delta(self) -> List[Entry]:
+        """the freshest rumors to gossip in this round, every rumor is only gossiped a limited number of rounds"""
+        delta = []
+        for info, rounds_left in heapq.nlargest(self.max_delta, self.rumors.items(), key=lambda rumor: rumor[1]):
+            delta.append((info, self.incarnations[info]))
+            if rounds_left <= 1:
+                del self.rumors[info]
+            else:
+                self.rumors[info] = rounds_left - 1
+        return delta
+
+    def snapshot(self) -> List[Entry]:
+        """every entry, which is only sent to a member that has just joined"""
+        return list(self.incarnations.items())
@@ -0,0 +1,73 @@
+"""
+This file contains a benchmark of gossip membership, which starts a few hundred in-process members that
+only know a single seed member, the same way the servers in SimpleAsyncServer.py start out,
+and measures the number of gossip rounds and bytes exchanged until every member knows every other member.
+Members exchange messages in lock step rounds, without sockets, such that the numbers only depend on the protocol.
+
+run it with
+    python GossipBenchmark.py [fanout]
+"""
+__author__ = 'michel'
+from Messages import *
+from Gossip import Membership
+from Framing import FRAME_HEADER
+
+# -- python core libs -- #
+# http://www.diveintopython3.net/serializing.html
+import pickle
+import random
+import time
+
+# https://docs.python.org/3/library/argparse.html
+import argparse
+
+# -- python community libs -- #
+from typing import List, Tuple
+
+
+def wire_size(msg: Message) -> int:
+    return FRAME_HEADER.size + len(pickle.dumps(msg))
+
+
+def simulate(size: int, fanout: int, seed: int = 42) -> Tuple[int, int, int]:
+    """returns the number of rounds, messages and bytes it took before every member knew all members"""
+    rng = random.Random(seed)
+    infos = [ServerInfo('10.0.%d.%d' % (i // 256, i % 256), 5000) for i in range(size)]
+    nodes = {info: Membership(info, infos[:1], fanout, rng=rng) for info in infos}
+
+    rounds = messages = total_bytes = 0
+    inflight = []  # type: List[Tuple[ServerInfo, MembershipDelta]]
+    while any(len(node) < size for node in nodes.values()):
+        rounds += 1
+        outgoing = []
+        for info, node in nodes.items():
+            delta = node.next_delta()
+            if len(delta) > 0:
+                outgoing += [(target, MembershipDelta(delta, info)) for target in node.targets()]
+
+        # messages sent in the previous round are received in this one, the same way as SimpleServer handles them
+        for recipient, msg in inflight:
+            node = nodes[recipient]
+            if msg.sender not in node:
+                node.add(msg.sender)
+                outgoing.append((msg.sender, MembershipDelta(node.snapshot(), recipient)))
+            node.merge(msg.entries)
+
+        messages += len(outgoing)
+        total_bytes += sum(wire_size(msg) for _, msg in outgoing)
+        inflight = outgoing
+    return rounds, messages, total_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='measures the rounds and bytes it takes gossip to spread the '
+                                                 'membership to every member')
+    parser.add_argument('fanout', type=int, nargs='?', default=3, help='number of members every delta is sent to')
+    fanout = parser.parse_args().fanout
+
+    print('%6s %8s %10s %12s %14s %10s' % ('nodes', 'rounds', 'messages', 'bytes', 'bytes/node', 'seconds'))
+    for size in [100, 200, 300, 400, 500]:
+        started = time.process_time()
+        rounds, messages, total_bytes = simulate(size, fanout)
+        print('%6d %8d %10d %12d %14d %10.2f' % (size, rounds, messages, total_bytes, total_bytes // size,
+                                                 time.process_time() - started))
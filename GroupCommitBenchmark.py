@@ -0,0 +1,110 @@
+"""
+This file contains a benchmark of group commit, measuring how many client writes per second a tree of
+DataRepNodes commits for different batch windows, on the 9 and 27 node trees.
+The simulated send delay is turned off, such that the numbers show the cost of the protocol itself.
+
+run it with
+    python GroupCommitBenchmark.py --writes 2000
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+from DataRepServer import DataRepNode
+from Framing import FramedConnection, Frame
+import DataRepCodec
+import Topology
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/argparse.html
+import argparse
+
+
+class AckCounter:
+    """listens for the acknowledgements sent back to the client, and resolves done when all of them has arrived"""
+    def __init__(self, expected: int, loop):
+        self.expected = expected
+        self.received = 0
+        self.loop = loop
+        self.done = asyncio.Future(loop=loop)
+        self.connections = []
+
+    @asyncio.coroutine
+    def handle_msg(self, reader, writer):
+        conn = FramedConnection(reader, writer, self.loop, self.handle_frame)
+        self.connections.append(conn)
+        yield from asyncio.wait([conn.reader_task], loop=self.loop)
+
+    def handle_frame(self, conn: FramedConnection, frame: Frame):
+        if isinstance(DataRepCodec.decode(frame.tag, frame.payload), ClientDataResponse):
+            self.received += 1
+            if self.received == self.expected and not self.done.done():
+                self.done.set_result(self.loop.time())
+
+
+@asyncio.coroutine
+def send_writes(servers: List[ServerInfo], client: ServerInfo, writes: int, loop):
+    """sends the writes round robin over one connection to every node, without waiting for acknowledgements"""
+    connections = []
+    for server in servers:
+        reader, writer = yield from asyncio.open_connection(server.ip, server.port, loop=loop)
+        connections.append(writer)
+
+    for i in range(writes):
+        msg = ClientDataMessage(client, Data(content='write %d' % i, version_number=i))
+        connections[i % len(connections)].write(Frame(*DataRepCodec.encode(msg)).encode())
+    for writer in connections:
+        yield from writer.drain()
+    return connections
+
+
+def run(size: int, batch_window: float, max_batch_size: int, writes: int, loop, base_port: int = 7000) -> float:
+    """returns the number of committed writes per second"""
+    servers = [ServerInfo('127.0.0.1', base_port + i) for i in range(size)]
+    client = ServerInfo('127.0.0.1', base_port - 1)
+    acks = AckCounter(writes, loop)
+    listener = loop.run_until_complete(
+        asyncio.start_server(acks.handle_msg, client.ip, client.port, loop=loop))
+
+    nodes = [DataRepNode(server, structure, loop, Data('lorem', 0),
+                         send_delay=0, batch_window=batch_window, max_batch_size=max_batch_size)
+             for server, structure in zip(servers, Topology.network_structures(servers))]
+
+    started = loop.time()
+    connections = loop.run_until_complete(send_writes(servers, client, writes, loop))
+    finished = loop.run_until_complete(acks.done)
+
+    for writer in connections:
+        writer.close()
+    for node in nodes:
+        node.kill()
+    for conn in acks.connections:
+        conn.close()
+    listener.close()
+    loop.run_until_complete(listener.wait_closed())
+    # lets the closed connections finish up before the next run
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    return writes / (finished - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='measures how many writes per second group commit gets through')
+    parser.add_argument('--writes', type=int, default=2000, help='number of client writes per run')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[9, 27])
+    args = parser.parse_args()
+    writes = args.writes
+    loop = asyncio.get_event_loop()
+
+    print('%6s %14s %12s' % ('nodes', 'batch window', 'writes/s'))
+    for size in args.sizes:
+        # a batch size of one turns group commit off, which is the baseline to compare against
+        throughput = run(size, 0.0, 1, writes, loop)
+        print('%6d %14s %12.0f' % (size, 'off', throughput))
+
+        for batch_window in [0.0, 0.001, 0.005, 0.02, 0.05]:
+            # the batch size is not limited, such that the batch window alone decides how many writes share a round
+            throughput = run(size, batch_window, writes, writes, loop)
+            print('%6d %13.3fs %12.0f' % (size, batch_window, throughput))
+
+    loop.close()
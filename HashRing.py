@@ -0,0 +1,134 @@
+"""
+This file contains a consistent hash ring, which assigns keys to the bottom level groups of a tree of data
+replication nodes, such that every group only replicates its own share of the keys (its partition).
+
+Every group is placed on the ring at a number of points (virtual nodes), given by hashing its name,
+and a key belongs to the group owning the first point after the hash of the key.
+- with many virtual nodes per group, every group gets close to the same share of the keys
+- when a group is added, it only takes over the keys right before its own points, which is about 1/N of the keys,
+  and every other key stays where it was
+The nodes do not change the ring by themselves. When a group joins or leaves, every node is given the new ring,
+and pulls the keys which it now owns from the groups owning them in the old ring, see DataRepNode.update_ring
+                 g1      g2
+              .    *    *    .
+            *                  *  g3
+           .       ring of      .
+            *     2^64 hashes  *  g1
+              .    *    *    .
+                 g3      g2
+"""
+__author__ = 'michel'
+from DataRepMessages import ServerInfo
+from Registry import members_of
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/bisect.html
+# binary search in the sorted list of points on the ring
+import bisect
+
+# https://docs.python.org/3/library/hashlib.html
+# the builtin hash of strings differs between processes, so a stable hash is needed for every node to agree
+import hashlib
+import sys
+
+# -- python community libs -- #
+from typing import Dict, FrozenSet, List
+
+RING_SIZE = 2 ** 64  # the hashes are the first 8 bytes of a sha1
+
+
+def ring_hash(value: str) -> int:
+    digest = hashlib.sha1(value.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def group_name(group: List[ServerInfo]) -> str:
+    """the name of a bottom level group, which is the first server of it, the same one representing it above"""
+    return str(group[0])
+
+
+class HashRing:
+    def __init__(self, vnodes: int = 64):
+        self.vnodes = vnodes  # number of points per group
+        self.points = []  # type: List[int]  # sorted
+        self.owners = dict()  # type: Dict[int, str]  # point -> name of the group
+        self.groups = dict()  # type: Dict[str, List[ServerInfo]]
+        self.members = dict()  # type: Dict[str, FrozenSet[ServerInfo]]  # the servers of every group as a set
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.groups
+
+    def add(self, group: List[ServerInfo]):
+        name = group_name(group)
+        self.groups[name] = group
+        self.members[name] = members_of([group])[0]
+        for i in range(self.vnodes):
+            point = ring_hash('%s#%d' % (name, i))
+            if point not in self.owners:
+                bisect.insort(self.points, point)
+            self.owners[point] = name
+
+    def remove(self, name: str):
+        self.groups.pop(name, None)
+        self.members.pop(name, None)
+        for point in [p for p, owner in self.owners.items() if owner == name]:
+            del self.owners[point]
+            del self.points[bisect.bisect_left(self.points, point)]
+
+    def partition_of(self, key: str) -> str:
+        """the name of the group owning the key"""
+        if len(self.points) == 0:
+            raise ValueError('the hash ring has no groups')
+        i = bisect.bisect(self.points, ring_hash(key)) % len(self.points)
+        return self.owners[self.points[i]]
+
+    def sources_of(self, name: str, old: 'HashRing') -> List[str]:
+        """the names of the other groups which owned some of the keys of the group in the old ring"""
+        if old is None or len(old.points) == 0:
+            return []
+        sources = set()
+        for i, point in enumerate(self.points):
+            if self.owners[point] != name:
+                continue
+            # the point owns the hashes from the point before it up to itself, which may wrap around the ring,
+            # and in the old ring they were owned by the points within that arc, and the first one after it
+            start = self.points[i - 1]
+            arc = (point - start) % RING_SIZE or RING_SIZE
+            j = bisect.bisect(old.points, start)
+            for _ in range(len(old.points)):
+                old_point = old.points[j % len(old.points)]
+                sources.add(old.owners[old_point])
+                if not 0 < (old_point - start) % RING_SIZE < arc:
+                    break
+                j += 1
+        sources.discard(name)
+        return sorted(sources)
+
+    def group_of(self, key: str) -> List[ServerInfo]:
+        return self.groups[self.partition_of(key)]
+
+    @staticmethod
+    def of(groups: List[List[ServerInfo]], vnodes: int = 64) -> 'HashRing':
+        ring = HashRing(vnodes)
+        for group in groups:
+            ring.add(group)
+        return ring
+
+
+if __name__ == "__main__":
+    # shows the share of keys which move when a group is added, which should be about 1 / (number of groups)
+    vnodes = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    keys = ['key %d' % i for i in range(100000)]
+    print('%8s %12s %12s %16s' % ('groups', 'moved', '1/groups', 'largest share'))
+    for size in [4, 8, 16, 32, 64]:
+        groups = [[ServerInfo('10.0.0.%d' % g, 5000)] for g in range(size + 1)]
+        ring = HashRing.of(groups[:size], vnodes)
+        before = [ring.partition_of(key) for key in keys]
+        ring.add(groups[size])
+        after = [ring.partition_of(key) for key in keys]
+        moved = sum(1 for old, new in zip(before, after) if old != new) / len(keys)
+        largest = max(after.count(name) for name in ring.groups) / len(keys)
+        print('%8d %12.4f %12.4f %16.4f' % (size + 1, moved, 1 / (size + 1), largest))
@@ -0,0 +1,251 @@
+"""
+This file contains a launcher which spreads the nodes of a system over a number of worker processes,
+where every worker process runs its own event loop with its share of the nodes, such that all cores are used,
+and a node which is busy pickling or printing only stalls the nodes in its own process.
+
+The state of a node is only ever touched by the one process running it, but the port clients talk to
+can be served by several processes. With frontends turned on, every node gets a public port next to its own,
+which every frontend process listens on with SO_REUSEPORT, such that the kernel spreads the client connections
+over them. A frontend decodes the client messages, which are thereby checked before they reach the node,
+and forwards them to the node over a connection of its own for every client connection.
+A request is answered on the connection it came in on, so the frontend sends the response of the node
+back to the client under the correlation id of the client, together with any blobs the node streams ahead of it.
+A message which is not a request is answered by the node directly, at the address the message gives.
+
+    clients --> public port (frontend processes, reuse_port) --> node port (the worker process running the node)
+
+run it with
+    python Launcher.py --kind datarep --nodes 27 --workers 4 --frontends 2
+"""
+__author__ = 'michel'
+from Framing import FramedConnection, Frame, FLAG_REQUEST
+from Transport import TcpTransport
+import DataRepCodec
+import DataRepMessages
+import Messages
+import Topology
+from Metrics import log, start_logging, stop_logging
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/multiprocessing.html
+# processes instead of threads, since only one thread at a time runs python code within a process
+import multiprocessing
+import argparse
+import os
+
+# -- python community libs -- #
+from typing import Any, Dict, List, Tuple
+
+# pip install toolz
+# http://toolz.readthedocs.org/en/latest/
+from toolz import curry
+
+"""
+The config given to every process is a dict of the form
+    {
+        'kind': 'datarep' or 'simple',
+        'addresses': [(ip, port), ...],  # the address of every node in the system
+        'fanout': 3,  # fanout of the network structures of datarep nodes, None to let Topology choose
+        'options': {...},  # keyword arguments given to every node, eg. {'send_delay': 0}
+        'frontend_offset': 1000,  # public port of a node = its port + frontend_offset
+        'quiet': True,  # whether the log of the nodes is thrown away
+    }
+which only contains plain values, such that it can be sent to the processes as it is.
+"""
+Config = Dict[str, Any]
+
+
+def start_nodes(config: Config, indices: List[int], loop) -> List[Any]:
+    kind = config['kind']
+    options = config.get('options', {})
+    if kind == 'datarep':
+        from DataRepServer import DataRepNode
+        servers = [DataRepMessages.ServerInfo(ip, port) for ip, port in config['addresses']]
+        # every process builds the same structures from the same addresses, so they agree without talking
+        structures = Topology.network_structures(servers, config.get('fanout', 3))
+        stand_ins = Topology.stand_ins(structures)
+        return [DataRepNode(servers[i], structures[i], loop, DataRepMessages.Data('lorem', 0), stand_ins=stand_ins,
+                            **options)
+                for i in indices]
+    elif kind == 'simple':
+        from SimpleAsyncServer import SimpleServer
+        servers = [Messages.ServerInfo(ip, port) for ip, port in config['addresses']]
+        # the servers only know the first server from the beginning, and finds the rest by gossip
+        return [SimpleServer(servers[i], servers[:1] if i > 0 else [], loop, dict(), **options)
+                for i in indices]
+    raise ValueError('unknown kind of node %r' % kind)
+
+
+def run_worker(config: Config, indices: List[int], ready, stop):
+    """the main function of a worker process, which runs the given nodes until stop is set"""
+    if not config.get('quiet', True):
+        start_logging()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    nodes = start_nodes(config, indices, loop)
+    ready.put(os.getpid())
+    run_until_stopped(loop, stop)
+    for node in nodes:
+        node.kill()
+    # lets the sends which were cut off by the kill finish up before the loop is closed
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    loop.close()
+    stop_logging()
+
+
+def run_until_stopped(loop, stop, poll_interval: float = 0.1):
+    @asyncio.coroutine
+    def wait_for_stop():
+        while not stop.is_set():
+            yield from asyncio.sleep(poll_interval, loop=loop)
+    try:
+        loop.run_until_complete(wait_for_stop())
+    except KeyboardInterrupt:
+        pass
+
+
+class ClientFrontend:
+    """accepts client connections on the public ports of the nodes, and forwards the client messages to the nodes"""
+    def __init__(self, addresses: List[Tuple[str, int]], frontend_offset: int, loop):
+        self.loop = loop
+        self.transport = TcpTransport(loop)
+        # client connection -> the connection to the node its messages are forwarded over
+        self.connections = dict()  # type: Dict[FramedConnection, FramedConnection]
+        self.servers = []
+        self.forwarded = 0
+        for ip, port in addresses:
+            node = DataRepMessages.ServerInfo(ip, port)
+            # several processes can listen on the same port with reuse_port, and the kernel spreads the connections
+            server_task = asyncio.start_server(
+                curry(self.handle_msg, node), ip, port + frontend_offset, loop=loop, reuse_port=True)
+            self.servers.append(loop.run_until_complete(server_task))
+
+    @asyncio.coroutine
+    def handle_msg(self, node, reader, writer):
+        # the blobs the node streams ahead of a response do not tell which request they belong to, so every client
+        # gets its own connection to the node, where everything other than the responses goes back to the client
+        try:
+            upstream = yield from self.transport.connect(None, node, lambda c, frame: conn.write(frame))
+        except (ConnectionError, OSError) as e:
+            log.warning("frontend could not reach %s: %r", node, e)
+            writer.close()
+            return
+        conn = FramedConnection(reader, writer, self.loop, lambda c, frame: self.forward(upstream, c, frame))
+        self.connections[conn] = upstream
+        yield from asyncio.wait([conn.reader_task], loop=self.loop)
+        self.connections.pop(conn, None)
+        upstream.close()
+
+    def forward(self, upstream: FramedConnection, conn: FramedConnection, frame: Frame):
+        # decoding throws on anything which is not a valid message, which then never reaches the node
+        DataRepCodec.decode(frame.tag, frame.payload)
+        self.forwarded += 1
+        if frame.flags == FLAG_REQUEST:
+            asyncio.async(self.relay(upstream, conn, frame), loop=self.loop)
+        else:
+            asyncio.async(upstream.send(frame.tag, frame.payload), loop=self.loop)
+
+    @asyncio.coroutine
+    def relay(self, upstream: FramedConnection, conn: FramedConnection, request: Frame):
+        """sends the request on to the node, and its response back to the client under the id the client gave it"""
+        try:
+            response = yield from upstream.request(request.tag, request.payload)
+        except (ConnectionError, OSError) as e:
+            # the client is cut off as well, such that it tries another node instead of waiting for its timeout
+            log.info("frontend lost the connection to the node: %r", e)
+            conn.close()
+            return
+        if not conn.is_closed():
+            conn.reply(request, response.tag, response.payload)
+
+    def kill(self):
+        for server in self.servers:
+            server.close()
+        for conn, upstream in list(self.connections.items()):
+            conn.close()
+            upstream.close()
+
+
+def run_frontend(config: Config, ready, stop):
+    """the main function of a frontend process"""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    frontend = ClientFrontend(config['addresses'], config.get('frontend_offset', 1000), loop)
+    ready.put(os.getpid())
+    run_until_stopped(loop, stop)
+    frontend.kill()
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    loop.close()
+
+
+class Launcher:
+    def __init__(self, config: Config, workers: int, frontends: int = 0):
+        self.config = config
+        # neighbouring nodes share a process, such that most groups at the bottom of a tree do
+        self.shares = [share for share in Topology.split(list(range(len(config['addresses']))), workers)
+                       if len(share) > 0]
+        self.frontends = frontends
+        self.ready = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.processes = []  # type: List[multiprocessing.Process]
+
+    def start(self, timeout: float = 30.0):
+        """starts the processes, and returns once all of them are serving"""
+        for indices in self.shares:
+            self.processes.append(multiprocessing.Process(
+                target=run_worker, args=(self.config, indices, self.ready, self.stop_event)))
+        if self.config['kind'] == 'datarep':
+            for i in range(self.frontends):
+                self.processes.append(multiprocessing.Process(
+                    target=run_frontend, args=(self.config, self.ready, self.stop_event)))
+
+        for process in self.processes:
+            process.start()
+        for process in self.processes:
+            self.ready.get(timeout=timeout)
+
+    def public_address(self, i: int) -> Tuple[str, int]:
+        """the address clients should use for node i"""
+        ip, port = self.config['addresses'][i]
+        if self.frontends > 0:
+            return ip, port + self.config.get('frontend_offset', 1000)
+        return ip, port
+
+    def stop(self, timeout: float = 10.0):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='runs the nodes of a system spread over a number of processes')
+    parser.add_argument('--kind', choices=['datarep', 'simple'], default='datarep')
+    parser.add_argument('--nodes', type=int, default=9)
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--frontends', type=int, default=0, help='processes serving the public ports of the nodes')
+    parser.add_argument('--base-port', type=int, default=5001)
+    parser.add_argument('--fanout', type=int, default=3)
+    args = parser.parse_args()
+
+    launcher = Launcher({
+        'kind': args.kind,
+        'addresses': [('127.0.0.1', args.base_port + i) for i in range(args.nodes)],
+        'fanout': args.fanout,
+        'options': {},
+        'quiet': False,
+    }, args.workers, args.frontends)
+    launcher.start()
+    print('%d nodes running in %d processes' % (args.nodes, len(launcher.processes)))
+    try:
+        launcher.stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        launcher.stop()
+        print('over and out')
@@ -0,0 +1,159 @@
+"""
+This file contains a load generator built on DataRepClient, which sends writes and reads to the entry nodes
+of a running tree for a while, and reports the throughput and the latency percentiles it achieved, eg.
+    python LoadGenerator.py --nodes 127.0.0.1:5001 127.0.0.1:5002 --concurrency 64 --duration 10 --reads 0.2
+    python LoadGenerator.py --local 27 --rate 2000 --keys 100 --payload 1000 --json load.json
+
+With --concurrency the load is a closed loop, where every worker sends its next request once the last one
+is answered, which measures the throughput the tree sustains.
+With --rate the requests are sent at a fixed rate whether or not the earlier ones are answered (an open loop),
+which measures the latency at a given load, without the latency of slow requests holding the load back.
+With --local the tree is started in this process first, over sockets on localhost, such that no launcher is needed.
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+from DataRepClient import DataRepClient
+from DataRepServer import DataRepNode
+from Metrics import Histogram
+import Topology
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/argparse.html
+import argparse
+import json
+import random
+import sys
+
+# -- python community libs -- #
+from typing import Dict, List
+
+
+class Load:
+    """the requests sent, and the latencies of the ones answered, by kind"""
+    def __init__(self, client: DataRepClient, reads: float, keys: int, payload: int, loop):
+        self.client = client
+        self.reads = reads  # the share of the requests which are reads
+        self.keys = keys
+        self.payload = payload
+        self.loop = loop
+        self.latencies = {'write': Histogram(), 'read': Histogram()}  # type: Dict[str, Histogram]
+        self.rejected = 0
+        self.errors = 0
+        self.sequence = 0
+
+    @asyncio.coroutine
+    def one(self):
+        """sends one write or read, and records how long it took to be answered"""
+        self.sequence += 1
+        key = 'key %d' % random.randrange(self.keys) if self.keys > 1 else ''
+        kind = 'read' if random.random() < self.reads else 'write'
+        started = self.loop.time()
+        try:
+            if kind == 'read':
+                yield from self.client.read(key)
+            elif not (yield from self.client.write(('write %d ' % self.sequence).ljust(self.payload, 'x'), key)):
+                self.rejected += 1
+                return
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            self.errors += 1
+            return
+        self.latencies[kind].record(self.loop.time() - started)
+
+    @asyncio.coroutine
+    def closed_loop(self, concurrency: int, duration: float):
+        deadline = self.loop.time() + duration
+
+        @asyncio.coroutine
+        def worker():
+            while self.loop.time() < deadline:
+                yield from self.one()
+        yield from asyncio.gather(*[worker() for i in range(concurrency)], loop=self.loop)
+
+    @asyncio.coroutine
+    def open_loop(self, rate: float, duration: float):
+        started = self.loop.time()
+        requests = []
+        for i in range(int(rate * duration)):
+            due = started + i / rate
+            if due > self.loop.time():
+                yield from asyncio.sleep(due - self.loop.time(), loop=self.loop)
+            requests.append(asyncio.async(self.one(), loop=self.loop))
+        yield from asyncio.gather(*requests, loop=self.loop)
+
+
+def parse_address(address: str) -> ServerInfo:
+    ip, port = address.rsplit(':', 1)
+    return ServerInfo(ip, int(port))
+
+
+def start_local(size: int, fanout: int, base_port: int, loop) -> List[DataRepNode]:
+    servers = [ServerInfo('127.0.0.1', base_port + i) for i in range(size)]
+    structures = Topology.network_structures(servers, fanout)
+    stand_ins = Topology.stand_ins(structures)
+    return [DataRepNode(server, structure, loop, Data('lorem', 0), send_delay=0, stand_ins=stand_ins)
+            for server, structure in zip(servers, structures)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='sends writes and reads to a tree of DataRepNodes, and reports '
+                                                 'the throughput and latency')
+    parser.add_argument('--nodes', nargs='+', default=[], help='ip:port of the entry nodes')
+    parser.add_argument('--local', type=int, default=0, help='number of nodes of a tree to start in this process')
+    parser.add_argument('--fanout', type=int, default=3, help='fanout of the local tree')
+    parser.add_argument('--base-port', type=int, default=21000, help='port of the first node of the local tree')
+    parser.add_argument('--entries', type=int, default=3, help='number of nodes of the local tree used as entries')
+    parser.add_argument('--concurrency', type=int, default=64, help='number of requests in flight (closed loop)')
+    parser.add_argument('--rate', type=float, default=0.0, help='requests per second (open loop), 0 for closed loop')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds to send requests for')
+    parser.add_argument('--reads', type=float, default=0.0, help='share of the requests which are reads')
+    parser.add_argument('--keys', type=int, default=1, help='number of keys the requests are spread over')
+    parser.add_argument('--payload', type=int, default=0, help='bytes of content of every write')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds a request waits for its answer')
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    nodes = start_local(args.local, args.fanout, args.base_port, loop) if args.local > 0 else []
+    entries = [parse_address(address) for address in args.nodes] or [node.info for node in nodes[:args.entries]]
+    if len(entries) == 0:
+        parser.error('either --nodes or --local is needed')
+
+    client = DataRepClient(entries, loop, timeout=args.timeout, max_in_flight=max(args.concurrency, 1024))
+    load = Load(client, args.reads, args.keys, args.payload, loop)
+    started = loop.time()
+    if args.rate > 0:
+        loop.run_until_complete(load.open_loop(args.rate, args.duration))
+    else:
+        loop.run_until_complete(load.closed_loop(args.concurrency, args.duration))
+    seconds = loop.time() - started
+    client.close()
+    for node in nodes:
+        node.kill()
+    # lets the closed connections finish up
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    loop.close()
+
+    answered = sum(histogram.count for histogram in load.latencies.values())
+    result = {
+        'entries': [str(entry) for entry in entries],
+        'seconds': seconds,
+        'answered': answered,
+        'rejected': load.rejected,
+        'errors': load.errors,
+        'requests_per_second': answered / seconds,
+        'latency_seconds': {kind: histogram.to_dict() for kind, histogram in load.latencies.items()
+                            if histogram.count > 0},
+    }
+    print('%8s %10s %10s %10s %10s %10s %10s' % ('kind', 'count', 'per s', 'p50 ms', 'p90 ms', 'p99 ms', 'p999 ms'))
+    for kind, latencies in sorted(result['latency_seconds'].items()):
+        print('%8s %10d %10.1f %10.2f %10.2f %10.2f %10.2f' % (
+            kind, latencies['count'], latencies['count'] / seconds, latencies['p50'] * 1000, latencies['p90'] * 1000,
+            latencies['p99'] * 1000, latencies['p999'] * 1000))
+    print('%d requests per second, %d rejected, %d errors' % (result['requests_per_second'], load.rejected,
+                                                              load.errors))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(result, argv=sys.argv[1:]), f, indent=2)
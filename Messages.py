@@ -1,29 +1,11 @@
-from functools import reduce
 import time
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
+# the one ServerInfo class shared with DataRepMessages.py, see Registry.py
+from Registry import ServerInfo
 
 __author__ = 'michel'
 
 
-class ServerInfo:
-    def __init__(self, ip: str, port: int):
-        self.ip = ip
-        self.port = port
-
-    def __eq__(self, other) -> bool:
-        return (isinstance(other, ServerInfo)
-                and self.ip == other.ip
-                and self.port == other.port)
-
-    def __hash__(self) -> int:
-        return reduce(lambda acc, x: acc * 17 + x.__hash__(),
-                      [self.ip, self.port],
-                      71)
-
-    def __str__(self):
-        return self.ip + ':' + str(self.port)
-
-
 class Message:
     def __init__(self, sender: ServerInfo):
         # initialize stuff common to all messages
@@ -38,12 +20,74 @@ class Inform(Message):
 
 
 class DataMessage(Message):
-    def __init__(self, data: Dict[Any, Any], sender: ServerInfo):
+    def __init__(self, data: Dict[Any, Any], versions: Dict[Any, Tuple[int, str]], sender: ServerInfo):
         super().__init__(sender)
         self.data = data
+        self.versions = versions  # the version of every value, where the newest one wins, see SimpleServer.merge
 
 
 class ServerListMessage(Message):
     def __init__(self, servers: List[ServerInfo], sender: ServerInfo):
         super().__init__(sender)
         self.servers = servers
+
+
+class DigestMessage(Message):
+    def __init__(self, root: int, buckets: List[int], sender: ServerInfo):
+        super().__init__(sender)
+        # summary of the senders dataset, see DataDigest.py
+        self.root = root
+        self.buckets = buckets
+
+
+class BucketDataMessage(Message):
+    def __init__(self, buckets: List[int], data: Dict[Any, Any], versions: Dict[Any, Tuple[int, str]],
+                 reply: bool, sender: ServerInfo):
+        super().__init__(sender)
+        self.buckets = buckets  # the buckets which differs between the two datasets
+        self.data = data  # the senders data in those buckets
+        self.versions = versions  # the version of every value in data
+        self.reply = reply  # whether the receiver should send back the data in those buckets which the sender lacks
+
+
+class MembershipDelta(Message):
+    def __init__(self, entries: List[Tuple[ServerInfo, int]], sender: ServerInfo):
+        super().__init__(sender)
+        self.entries = entries  # (member, incarnation) pairs which are new to the sender, see Gossip.py
+
+
+class BroadcastMessage(Message):
+    def __init__(self, msg_id: int, origin: ServerInfo, hops: int, data: Dict[Any, Any],
+                 versions: Dict[Any, Tuple[int, str]], sender: ServerInfo):
+        super().__init__(sender)
+        # the id the copies of the message are told apart by, and the server which broadcast it, see Broadcast.py
+        self.msg_id = msg_id
+        self.origin = origin
+        self.hops = hops  # number of servers the message has been relayed by
+        self.data = data
+        self.versions = versions
+
+
+class StatsRequest(Message):
+    """asks a server for its metrics, which it replies to on the same connection, see Metrics.py"""
+    pass
+
+
+class StatsResponse(Message):
+    def __init__(self, stats: Dict[str, Any], sender: ServerInfo):
+        super().__init__(sender)
+        self.stats = stats
+
+
+# tags identifying the message type of a frame on the wire, see Framing.py
+MESSAGE_TAGS = {
+    Inform: 1,
+    DataMessage: 2,
+    ServerListMessage: 3,
+    DigestMessage: 4,
+    BucketDataMessage: 5,
+    MembershipDelta: 6,
+    StatsRequest: 7,
+    StatsResponse: 8,
+    BroadcastMessage: 9,
+}
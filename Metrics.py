@@ -0,0 +1,268 @@
+"""
+This file contains the instrumentation of the servers, which replaces printing on every message with
+- counters of the messages and bytes sent and received per message type
+- histograms of the time spent encoding and decoding messages, waiting for quorums and committing writes
+- a monitor of the event loop lag, which is how late the loop runs a callback scheduled at a given time
+The metrics of a server can be asked for with a StatsRequest, and dumped as json, eg.
+    python Metrics.py 127.0.0.1:5001 --kind datarep
+
+The histograms are log-linear, like HDR histograms, where every power of two range of values is split into
+the same number of sub buckets, such that any value from a microsecond to hours is recorded with the same
+relative precision of about 3%, in a fixed small number of buckets, without keeping the values themselves.
+
+The log messages of the servers go through a logger, whose records are put on a bounded queue and written by
+a background thread, such that a slow terminal never blocks the event loop. Debug records are sampled,
+and when the queue is full records are dropped and counted instead of waited for.
+"""
+__author__ = 'michel'
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/logging.handlers.html#queuehandler
+# a handler which only puts the records on a queue, and a listener which handles them in a thread of its own
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+
+import argparse
+import json
+import random
+import sys
+
+# -- python community libs -- #
+from typing import Dict
+
+# the logger every server logs to, which throws the records away until start_logging is called
+log = logging.getLogger('distributed-system')
+log.addHandler(logging.NullHandler())
+
+# every power of two range of values is split into this many buckets
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS // 2
+
+# values are recorded in integer units of a microsecond
+UNIT = 1e-6
+
+
+def bucket_of(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + (value >> shift) - HALF_SUB_BUCKETS
+
+
+def bucket_value(bucket: int) -> int:
+    """the value in the middle of the range of values counted in the bucket"""
+    if bucket < SUB_BUCKETS:
+        return bucket
+    shift = (bucket - SUB_BUCKETS) // HALF_SUB_BUCKETS + 1
+    top = (bucket - SUB_BUCKETS) % HALF_SUB_BUCKETS + HALF_SUB_BUCKETS
+    return (top << shift) + (1 << shift) // 2
+
+
+class Histogram:
+    """counts values given in seconds, in log-linear buckets"""
+    def __init__(self):
+        self.counts = dict()  # type: Dict[int, int]  # bucket -> number of values in it
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        bucket = bucket_of(max(0, int(seconds / UNIT)))
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = max(1, int(self.count * p + 0.5))
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.max, max(self.min, bucket_value(bucket) * UNIT))
+        return self.max
+
+    def merge(self, other: 'Histogram'):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count > 0 else 0.0,
+            'min': self.min if self.count > 0 else 0.0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'p999': self.percentile(0.999),
+        }
+
+
+class Metrics:
+    """the counters and histograms of one server"""
+    def __init__(self, loop, lag_interval: float = 0.5):
+        self.loop = loop
+        self.messages_in = dict()  # type: Dict[str, int]  # message type -> number of messages
+        self.bytes_in = dict()  # type: Dict[str, int]
+        self.messages_out = dict()  # type: Dict[str, int]
+        self.bytes_out = dict()  # type: Dict[str, int]
+        self.histograms = dict()  # type: Dict[str, Histogram]
+        # the lag is measured by a callback which reschedules itself every lag_interval seconds
+        self.lag_interval = lag_interval
+        self.lag_due = loop.time() + lag_interval
+        self.lag_handle = loop.call_at(self.lag_due, self.measure_lag)
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def record(self, name: str, seconds: float):
+        self.histogram(name).record(seconds)
+
+    def received(self, kind: str, size: int, seconds: float = None):
+        """counts a received message of the given type and size, and the time it took to decode"""
+        self.messages_in[kind] = self.messages_in.get(kind, 0) + 1
+        self.bytes_in[kind] = self.bytes_in.get(kind, 0) + size
+        if seconds is not None:
+            self.record('decode', seconds)
+
+    def sent(self, kind: str, size: int, seconds: float = None):
+        """counts a sent message of the given type and size, and the time it took to encode"""
+        self.messages_out[kind] = self.messages_out.get(kind, 0) + 1
+        self.bytes_out[kind] = self.bytes_out.get(kind, 0) + size
+        if seconds is not None:
+            self.record('encode', seconds)
+
+    def measure_lag(self):
+        now = self.loop.time()
+        self.record('loop_lag', now - self.lag_due)
+        self.lag_due = now + self.lag_interval
+        self.lag_handle = self.loop.call_at(self.lag_due, self.measure_lag)
+
+    def to_dict(self) -> dict:
+        return {
+            'messages_in': dict(self.messages_in),
+            'bytes_in': dict(self.bytes_in),
+            'messages_out': dict(self.messages_out),
+            'bytes_out': dict(self.bytes_out),
+            'seconds': {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            'log_dropped': dropped_records(),
+        }
+
+    def dump(self, path: str, **extra):
+        with open(path, 'w') as f:
+            json.dump(dict(self.to_dict(), **extra), f, indent=2, sort_keys=True)
+
+    def close(self):
+        self.lag_handle.cancel()
+
+
+class SampleFilter(logging.Filter):
+    """lets every warning through, but only a share of the records below that"""
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.sample_rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """puts the records on a bounded queue, and drops them when it is full instead of waiting"""
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None  # type: DroppingQueueHandler
+_listener = None  # type: QueueListener
+
+
+def start_logging(sample_rate: float = 1.0, stream=None, level: int = logging.DEBUG, max_queued: int = 10000):
+    """
+    starts writing the log of this process to the stream, standard out by default,
+    where only the given share of the debug and info records are written
+    """
+    global _handler, _listener
+    stop_logging()
+    records = queue.Queue(max_queued)
+    _handler = DroppingQueueHandler(records)
+    _handler.addFilter(SampleFilter(sample_rate))
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter('%(message)s'))
+    _listener = QueueListener(records, output)
+    _listener.start()
+    log.addHandler(_handler)
+    log.setLevel(level)
+
+
+def stop_logging():
+    """writes the records which are still queued, and stops the thread writing them"""
+    global _handler, _listener
+    if _listener is not None:
+        log.removeHandler(_handler)
+        _listener.stop()
+        _handler, _listener = None, None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+if __name__ == "__main__":
+    # asks a running server for its metrics, and prints them as json
+    parser = argparse.ArgumentParser(description='prints the metrics of a running server as json')
+    parser.add_argument('address', help='ip:port of the server')
+    parser.add_argument('--kind', choices=['datarep', 'simple'], default='datarep')
+    args = parser.parse_args()
+    ip, port = args.address.rsplit(':', 1)
+
+    @asyncio.coroutine
+    def ask():
+        from Framing import FramedConnection
+        reader, writer = yield from asyncio.open_connection(ip, int(port), loop=loop)
+        conn = FramedConnection(reader, writer, loop, lambda c, frame: None)
+        try:
+            if args.kind == 'datarep':
+                import DataRepCodec
+                import DataRepMessages
+                me = DataRepMessages.ServerInfo('127.0.0.1', 0)
+                frame = yield from conn.request(*DataRepCodec.encode(DataRepMessages.StatsRequest(me)), timeout=10)
+                return json.loads(DataRepCodec.decode(frame.tag, frame.payload).stats)
+            else:
+                import pickle
+                import Messages
+                msg = Messages.StatsRequest(Messages.ServerInfo('127.0.0.1', 0))
+                frame = yield from conn.request(Messages.MESSAGE_TAGS[Messages.StatsRequest], pickle.dumps(msg),
+                                                timeout=10)
+                return pickle.loads(frame.payload).stats
+        finally:
+            conn.close()
+
+    loop = asyncio.get_event_loop()
+    stats = loop.run_until_complete(ask())
+    json.dump(stats, sys.stdout, indent=2, sort_keys=True)
+    print()
+    loop.close()
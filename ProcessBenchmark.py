@@ -0,0 +1,76 @@
+"""
+This file contains a benchmark of how the throughput of a tree of DataRepNodes scales with the number of
+worker processes the nodes are spread over by Launcher.py, with and without frontend processes
+serving the public ports of the nodes.
+The client runs in this process, and sends writes as fast as it can, round robin to all nodes.
+
+run it with
+    python ProcessBenchmark.py [--size number of nodes] [--writes number of writes per run]
+"""
+__author__ = 'michel'
+from DataRepMessages import ServerInfo
+from Launcher import Launcher
+from QuorumBenchmark import LatencyRecorder, send_writes, percentile
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+# https://docs.python.org/3/library/argparse.html
+import argparse
+import multiprocessing
+
+
+def run(size: int, workers: int, frontends: int, writes: int, loop, base_port: int = 21000) -> (float, float):
+    """returns the number of committed writes per second, and the median commit latency"""
+    launcher = Launcher({
+        'kind': 'datarep',
+        'addresses': [('127.0.0.1', base_port + i) for i in range(size)],
+        'fanout': 3,
+        'options': {'send_delay': 0},
+        'frontend_offset': 1000,
+    }, workers, frontends)
+    launcher.start()
+
+    client = ServerInfo('127.0.0.1', base_port - 1)
+    recorder = LatencyRecorder(writes, loop)
+    listener = loop.run_until_complete(
+        asyncio.start_server(recorder.handle_msg, client.ip, client.port, loop=loop))
+    public = [ServerInfo(*launcher.public_address(i)) for i in range(size)]
+    try:
+        started = loop.time()
+        connections = loop.run_until_complete(send_writes(public, client, writes, 0, recorder, loop))
+        try:
+            finished = loop.run_until_complete(asyncio.wait_for(recorder.done, 60, loop=loop))
+        except asyncio.TimeoutError:
+            finished = loop.time()
+        for writer in connections:
+            writer.close()
+    finally:
+        launcher.stop()
+        for conn in recorder.connections:
+            conn.close()
+        listener.close()
+        loop.run_until_complete(listener.wait_closed())
+        # lets the closed connections finish up before the next run
+        loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+    return len(recorder.latencies) / (finished - started), percentile(recorder.latencies, 0.5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='measures how the throughput scales with the number of worker processes')
+    parser.add_argument('--size', type=int, default=27, help='number of nodes in the tree')
+    parser.add_argument('--writes', type=int, default=2000, help='number of client writes per run')
+    args = parser.parse_args()
+    size = args.size
+    writes = args.writes
+    loop = asyncio.get_event_loop()
+
+    cores = multiprocessing.cpu_count()
+    print('%d nodes on a machine with %d cores' % (size, cores))
+    print('%8s %10s %12s %10s' % ('workers', 'frontends', 'writes/s', 'p50 ms'))
+    worker_counts = sorted(set([1, 2, 4, 8, cores]))
+    for workers in worker_counts:
+        for frontends in [0, 2]:
+            throughput, p50 = run(size, workers, frontends, writes, loop)
+            print('%8d %10d %12.0f %10.2f' % (workers, frontends, throughput, p50 * 1000))
+    loop.close()
@@ -0,0 +1,214 @@
+"""
+This file contains a benchmark suite for the quorum trees of DataRepNodes, which measures for trees of different sizes
+- the commit latency of client writes, from the write is sent until its acknowledgement arrives (p50, p99, p999)
+- the number of committed writes per second
+- the number of messages, and bytes, sent by the nodes per committed write
+- the cpu time spent per node handling messages
+All nodes run in this process, over real sockets on localhost, and the client sends writes at a fixed rate
+round robin to all nodes, without waiting for acknowledgements.
+
+The results are printed as a table, and can also be written as json, such that runs of different releases
+can be compared to catch regressions, eg.
+    python QuorumBenchmark.py --sizes 9 27 81 243 --rate 500 --writes 2000 --json results.json
+With --partitioned the writes are spread over --keys keys, which are assigned to the bottom level groups
+by a hash ring, such that the groups commit their own keys in parallel, see HashRing.py.
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+from DataRepServer import DataRepNode
+from HashRing import HashRing, group_name
+from Metrics import Histogram
+from Framing import FramedConnection, Frame
+import DataRepCodec
+import Topology
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/argparse.html
+import argparse
+import json
+import platform
+import sys
+import time
+
+# -- python community libs -- #
+from typing import Dict, List
+
+
+class LatencyRecorder:
+    """listens for the acknowledgements sent back to the client, and records the latency of every write"""
+    def __init__(self, expected: int, loop):
+        self.expected = expected
+        self.loop = loop
+        self.sent = dict()  # type: Dict[int, float]
+        self.latencies = []  # type: List[float]
+        self.done = asyncio.Future(loop=loop)
+        self.connections = []
+
+    @asyncio.coroutine
+    def handle_msg(self, reader, writer):
+        conn = FramedConnection(reader, writer, self.loop, self.handle_frame)
+        self.connections.append(conn)
+        yield from asyncio.wait([conn.reader_task], loop=self.loop)
+
+    def handle_frame(self, conn: FramedConnection, frame: Frame):
+        msg = DataRepCodec.decode(frame.tag, frame.payload)
+        if isinstance(msg, ClientDataResponse) and msg.version_number in self.sent:
+            self.latencies.append(self.loop.time() - self.sent.pop(msg.version_number))
+            if len(self.latencies) == self.expected and not self.done.done():
+                self.done.set_result(self.loop.time())
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    if len(latencies) == 0:
+        return float('nan')
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+@asyncio.coroutine
+def send_writes(servers: List[ServerInfo], client: ServerInfo, writes: int, rate: float,
+                recorder: LatencyRecorder, loop, keys: int = 1, payload: int = 0):
+    """
+    sends the writes round robin at the given rate per second, or as fast as possible when the rate is 0,
+    where the content of every write is padded to the given number of payload bytes
+    """
+    connections = []
+    for server in servers:
+        reader, writer = yield from asyncio.open_connection(server.ip, server.port, loop=loop)
+        connections.append(writer)
+
+    started = loop.time()
+    for i in range(writes):
+        if rate > 0:
+            due = started + i / rate
+            if due > loop.time():
+                yield from asyncio.sleep(due - loop.time(), loop=loop)
+        key = 'key %d' % (i % keys) if keys > 1 else ''
+        content = ('write %d ' % i).ljust(payload, 'x')
+        msg = ClientDataMessage(client, Data(content=content, version_number=i, key=key))
+        recorder.sent[i] = loop.time()
+        connections[i % len(connections)].write(Frame(*DataRepCodec.encode(msg)).encode())
+        if rate == 0 and i % len(connections) == 0:
+            yield from connections[0].drain()
+    for writer in connections:
+        yield from writer.drain()
+    return connections
+
+
+def run(size: int, fanout: int, writes: int, rate: float, send_delay: float, batch_window: float,
+        timeout: float, loop, base_port: int = 20000, partitioned: bool = False, keys: int = 1,
+        payload: int = 0) -> dict:
+    servers = [ServerInfo('127.0.0.1', base_port + i) for i in range(size)]
+    client = ServerInfo('127.0.0.1', base_port - 1)
+    recorder = LatencyRecorder(writes, loop)
+    listener = loop.run_until_complete(
+        asyncio.start_server(recorder.handle_msg, client.ip, client.port, loop=loop))
+
+    structures = Topology.network_structures(servers, fanout)
+    ring = None
+    if partitioned:
+        ring = HashRing()
+        for structure in structures:
+            if group_name(structure[-1]) not in ring:
+                ring.add(structure[-1])
+    nodes = [DataRepNode(server, structure, loop, Data('lorem', 0), send_delay=send_delay, batch_window=batch_window,
+                         ring=ring)
+             for server, structure in zip(servers, structures)]
+
+    cpu_started = time.process_time()
+    started = loop.time()
+    connections = loop.run_until_complete(send_writes(servers, client, writes, rate, recorder, loop, keys,
+                                                           payload))
+    try:
+        finished = loop.run_until_complete(asyncio.wait_for(recorder.done, timeout, loop=loop))
+    except asyncio.TimeoutError:
+        # the writes which were not acknowledged in time are left out of the latencies, and reported as lost
+        finished = loop.time()
+    cpu_used = time.process_time() - cpu_started
+
+    committed = len(recorder.latencies)
+    messages = sum(node.messages_sent for node in nodes)
+    sent = sum(node.bytes_sent for node in nodes)
+    node_cpu = [node.cpu_time for node in nodes]
+    # the histograms of all the nodes, merged by name
+    histograms = dict()  # type: Dict[str, Histogram]
+    for node in nodes:
+        for name, histogram in node.metrics.histograms.items():
+            histograms.setdefault(name, Histogram()).merge(histogram)
+
+    for writer in connections:
+        writer.close()
+    for node in nodes:
+        node.kill()
+    for conn in recorder.connections:
+        conn.close()
+    listener.close()
+    loop.run_until_complete(listener.wait_closed())
+    # lets the closed connections finish up before the next run
+    loop.run_until_complete(asyncio.sleep(0.1, loop=loop))
+
+    return {
+        'nodes': size,
+        'fanout': fanout,
+        'depth': Topology.tree_depth(size, fanout),
+        'writes': writes,
+        'rate': rate,
+        'send_delay': send_delay,
+        'batch_window': batch_window,
+        'partitioned': partitioned,
+        'keys': keys,
+        'payload': payload,
+        'committed': committed,
+        'lost': writes - committed,
+        'seconds': finished - started,
+        'writes_per_second': committed / (finished - started),
+        'latency_p50_ms': percentile(recorder.latencies, 0.5) * 1000,
+        'latency_p99_ms': percentile(recorder.latencies, 0.99) * 1000,
+        'latency_p999_ms': percentile(recorder.latencies, 0.999) * 1000,
+        'messages_per_commit': messages / max(1, committed),
+        'bytes_per_commit': sent / max(1, committed),
+        # handling messages is only part of the work, the rest is spent encoding and sending them
+        'handler_cpu_ms_per_node': sum(node_cpu) / size * 1000,
+        'handler_cpu_ms_max_node': max(node_cpu) * 1000,
+        'process_cpu_ms_per_node': cpu_used / size * 1000,
+        # as seen by the nodes, see Metrics.py
+        'node_seconds': {name: histogram.to_dict() for name, histogram in sorted(histograms.items())},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='benchmarks commits through quorum trees of DataRepNodes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[9, 27, 81, 243])
+    parser.add_argument('--fanout', type=int, default=3)
+    parser.add_argument('--writes', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=500.0, help='client writes per second, 0 for unlimited')
+    parser.add_argument('--send-delay', type=float, default=0.0, help='simulated network delay of every message')
+    parser.add_argument('--batch-window', type=float, default=0.005)
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds to wait for the last acknowledgement')
+    parser.add_argument('--partitioned', action='store_true', help='assign the keys to groups with a hash ring')
+    parser.add_argument('--keys', type=int, default=1, help='number of keys the writes are spread over')
+    parser.add_argument('--payload', type=int, default=0, help='bytes of content of every write')
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    results = []
+    print('%6s %10s %10s %10s %10s %10s %12s %12s %12s' % (
+        'nodes', 'writes/s', 'p50 ms', 'p99 ms', 'p999 ms', 'lost', 'msgs/commit', 'bytes/commit', 'cpu ms/node'))
+    for size in args.sizes:
+        result = run(size, args.fanout, args.writes, args.rate, args.send_delay, args.batch_window,
+                     args.timeout, loop, partitioned=args.partitioned, keys=args.keys,
+                     payload=args.payload)
+        results.append(result)
+        print('%6d %10.0f %10.2f %10.2f %10.2f %10d %12.1f %12.0f %12.2f' % (
+            size, result['writes_per_second'], result['latency_p50_ms'], result['latency_p99_ms'],
+            result['latency_p999_ms'], result['lost'], result['messages_per_commit'], result['bytes_per_commit'],
+            result['process_cpu_ms_per_node']))
+    loop.close()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'python': platform.python_version(), 'argv': sys.argv[1:], 'results': results}, f, indent=2)
@@ -0,0 +1,69 @@
+"""
+This file contains the registry of the servers known to this process, which hands out one ServerInfo per address.
+A ServerInfo is created once per address and then shared by every message, membership table and network structure
+referring to the server, such that
+- comparing two of them is mostly an identity check, and their hash is computed once instead of on every lookup
+- every server gets a small integer id, counting from 0 in the order the process first saw them,
+  which can index lists instead of hashing the address, see server_of
+The ids are local to the process, two processes may give the same server different ids,
+so they are never sent to another server, see DataRepCodec.node_id for the id used on the wire.
+A cluster only has so many servers, so the registry is never cleaned up.
+
+The indexes below turn the lists of servers which make up groups and levels into sets,
+such that checking whether a server is part of one costs the same for a group of three or of three thousand
+    members_of([[a, d, e], [a, b, c]]) -> [{a, d, e}, {a, b, c}]
+"""
+__author__ = 'michel'
+
+# -- python community libs -- #
+from typing import Dict, FrozenSet, List, Tuple
+
+
+class ServerInfo:
+    __slots__ = ('ip', 'port', 'node', 'hash')
+
+    def __new__(cls, ip: str, port: int) -> 'ServerInfo':
+        info = _interned.get((ip, port))
+        if info is None:
+            info = super().__new__(cls)
+            info.ip = ip
+            info.port = port
+            info.node = len(_servers)
+            info.hash = hash((ip, port))
+            _interned[(ip, port)] = info
+            _servers.append(info)
+        return info
+
+    def __eq__(self, other) -> bool:
+        return self is other or (isinstance(other, ServerInfo)
+                                 and self.ip == other.ip
+                                 and self.port == other.port)
+
+    def __hash__(self) -> int:
+        return self.hash
+
+    def __reduce__(self):
+        # unpickling gives the ServerInfo of the address in the receiving process, with the id it has there
+        return ServerInfo, (self.ip, self.port)
+
+    def __str__(self):
+        return self.ip + ':' + str(self.port)
+
+
+# (ip, port) -> the one ServerInfo of the address, and the ServerInfos by their id
+_interned = dict()  # type: Dict[Tuple[str, int], ServerInfo]
+_servers = []  # type: List[ServerInfo]
+
+
+def server_of(node: int) -> ServerInfo:
+    """the server with the given id"""
+    return _servers[node]
+
+
+def known_servers() -> int:
+    return len(_servers)
+
+
+def members_of(structure: List[List[ServerInfo]]) -> List[FrozenSet[ServerInfo]]:
+    """the members of every level of a network structure as a set"""
+    return [frozenset(group) for group in structure]
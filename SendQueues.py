@@ -0,0 +1,214 @@
+"""
+This file contains bounded outbound queues, one per peer, which every message to the peer goes through.
+A single writer per peer takes the messages off its queue one at a time and waits for the connection to drain
+after each of them, so a slow peer makes its own queue grow instead of the memory of the process,
+and once the queue is full, new messages are dropped instead of piling up.
+
+Every queue has a lane per priority, and the writer always takes the next message from the most important lane,
+such that quorum votes overtake large data transfers to the same peer
+    CONTROL  votes and requests, which are small and on the critical path of every round
+    DATA     messages carrying data, eg. the batch of a write request
+    BULK     background transfers, eg. synchronizing whole data sets, which are the first to be dropped
+When a message does not fit in a full queue, queued messages of less important lanes are dropped to make room,
+newest first, and if that is not enough the message itself is dropped.
+Senders which would rather wait than have their message dropped can wait for room with put.
+
+A message to a peer with an empty queue and an open connection, which has less than write_buffer bytes
+waiting to be sent, is written right away without going through the queue at all.
+Messages handed over by a transport which does not serialize them have no size in bytes,
+so only their number is bounded, see Transport.py.
+"""
+__author__ = 'michel'
+from ConnectionPool import ConnectionPool
+from Framing import Frame, payload_size
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/collections.html#collections.deque
+# a list with fast appends and pops at both ends
+from collections import deque
+
+# -- python community libs -- #
+from typing import Any, Dict, List, Tuple
+
+CONTROL, DATA, BULK = 0, 1, 2
+LANE_NAMES = ['control', 'data', 'bulk']
+
+
+class MessageDropped(ConnectionError):
+    """the message was dropped from a full send queue"""
+    pass
+
+
+def fail_closed(future: asyncio.Future):
+    """
+    fails a queued message because the queues are closed. Its sender may be gone by now, eg. with the node
+    it belonged to, so the exception is marked as retrieved, instead of being logged as never retrieved
+    """
+    if not future.done():
+        future.set_exception(MessageDropped('the send queues have been closed'))
+        future.exception()
+
+
+class PeerQueue:
+    def __init__(self):
+        # tag, payload and the future which is done once the message has been written
+        self.lanes = [deque() for name in LANE_NAMES]  # type: List[deque]
+        self.messages = 0
+        self.bytes = 0
+        self.sent = 0
+        self.dropped = [0 for name in LANE_NAMES]
+        self.writer = None  # type: asyncio.Task  # only running while there are messages queued
+        self.room = deque()  # senders waiting for room in the queue
+
+    def push(self, lane: int, tag: int, payload: bytes, future: asyncio.Future):
+        self.lanes[lane].append((tag, payload, future))
+        self.messages += 1
+        self.bytes += payload_size(payload)
+
+    def pop(self) -> Tuple[int, bytes, asyncio.Future]:
+        for lane in self.lanes:
+            if len(lane) > 0:
+                tag, payload, future = lane.popleft()
+                self.forget(payload)
+                return tag, payload, future
+
+    def drop_newest(self, lane: int):
+        tag, payload, future = self.lanes[lane].pop()
+        self.forget(payload)
+        self.dropped[lane] += 1
+        if not future.done():
+            future.set_exception(MessageDropped('dropped from the %s lane to make room' % LANE_NAMES[lane]))
+
+    def forget(self, payload: bytes):
+        self.messages -= 1
+        self.bytes -= payload_size(payload)
+        # a sender waiting for room is let in for every message which leaves the queue
+        while len(self.room) > 0:
+            waiter = self.room.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+
+class SendQueues:
+    def __init__(self, pool: ConnectionPool, loop, max_messages: int = 1024, max_bytes: int = 16 * 1024 * 1024,
+                 write_buffer: int = 64 * 1024):
+        self.pool = pool
+        self.loop = loop
+        self.write_buffer = write_buffer
+        # the bounds of the queue of every peer
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.queues = dict()  # type: Dict[Any, PeerQueue]
+
+    def queue_of(self, recipient) -> PeerQueue:
+        queue = self.queues.get(recipient)
+        if queue is None:
+            queue = self.queues[recipient] = PeerQueue()
+        return queue
+
+    def fits(self, queue: PeerQueue, size: int) -> bool:
+        # an empty queue takes any message, such that a message larger than the byte bound can still be sent
+        return queue.messages == 0 or (queue.messages < self.max_messages and queue.bytes + size <= self.max_bytes)
+
+    def send(self, recipient, tag: int, payload: bytes, lane: int = DATA) -> asyncio.Future:
+        """
+        queues the message, and returns a future which is done once it has been written and the connection drained,
+        or fails with MessageDropped if there is no room for it
+        """
+        queue = self.queue_of(recipient)
+        future = asyncio.Future(loop=self.loop)
+        if queue.messages == 0 and self.write_now(recipient, queue, tag, payload):
+            future.set_result(None)
+            return future
+
+        less_important = len(LANE_NAMES) - 1
+        while not self.fits(queue, payload_size(payload)) and less_important > lane:
+            if len(queue.lanes[less_important]) > 0:
+                queue.drop_newest(less_important)
+            else:
+                less_important -= 1
+        if not self.fits(queue, payload_size(payload)):
+            queue.dropped[lane] += 1
+            future.set_exception(MessageDropped('the send queue to %s is full' % recipient))
+            return future
+
+        queue.push(lane, tag, payload, future)
+        if queue.writer is None:
+            queue.writer = asyncio.async(self.write_all(recipient, queue), loop=self.loop)
+        return future
+
+    def write_now(self, recipient, queue: PeerQueue, tag: int, payload: bytes) -> bool:
+        """writes the message right away if the connection is open and not backed up"""
+        conn = self.pool.open_connection(recipient)
+        if conn is None or conn.buffered() > self.write_buffer:
+            return False
+        conn.write(Frame(tag, payload))
+        queue.sent += 1
+        return True
+
+    @asyncio.coroutine
+    def put(self, recipient, tag: int, payload: bytes, lane: int = BULK):
+        """like send, but waits for room in the queue instead of dropping the message, and for it to be written"""
+        queue = self.queue_of(recipient)
+        while not self.fits(queue, payload_size(payload)):
+            waiter = asyncio.Future(loop=self.loop)
+            queue.room.append(waiter)
+            yield from waiter
+        yield from self.send(recipient, tag, payload, lane)
+
+    @asyncio.coroutine
+    def write_all(self, recipient, queue: PeerQueue):
+        """writes the queued messages one by one, until the queue is empty"""
+        try:
+            while queue.messages > 0:
+                tag, payload, future = queue.pop()
+                if future.done():
+                    # the sender has given up on the message, eg. because the quorum it was asking for is reached
+                    continue
+                try:
+                    # waits for the connection to drain, such that at most one message is buffered per peer
+                    yield from self.pool.send(recipient, tag, payload)
+                except asyncio.CancelledError:
+                    fail_closed(future)
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    queue.sent += 1
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            queue.writer = None
+
+    def depth(self) -> Tuple[int, int]:
+        """the number of messages and bytes queued to all peers"""
+        return (sum(queue.messages for queue in self.queues.values()),
+                sum(queue.bytes for queue in self.queues.values()))
+
+    def stats(self) -> dict:
+        messages, size = self.depth()
+        return {
+            'messages': messages,
+            'bytes': size,
+            'sent': sum(queue.sent for queue in self.queues.values()),
+            'dropped': {name: sum(queue.dropped[lane] for queue in self.queues.values())
+                        for lane, name in enumerate(LANE_NAMES)},
+            'peers': {str(peer): {'messages': queue.messages, 'bytes': queue.bytes,
+                                  'dropped': dict(zip(LANE_NAMES, queue.dropped))}
+                      for peer, queue in self.queues.items() if queue.messages > 0 or any(queue.dropped)},
+        }
+
+    def close(self):
+        for queue in self.queues.values():
+            if queue.writer is not None:
+                queue.writer.cancel()
+            for lane in queue.lanes:
+                for tag, payload, future in lane:
+                    fail_closed(future)
+                lane.clear()
+            queue.messages, queue.bytes = 0, 0
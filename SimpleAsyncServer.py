@@ -1,5 +1,14 @@
 __author__ = 'michel'
 from Messages import *
+from ConnectionPool import ConnectionPool
+from Framing import FramedConnection, Frame, payload_size
+from Transport import TcpTransport
+from DataDigest import DataDigest
+from Gossip import Membership
+from Broadcast import Broadcaster
+from Metrics import Metrics, log, start_logging, stop_logging
+from SendQueues import SendQueues, CONTROL, BULK
+from CatchUp import TokenBucket
 
 # -- python core libs -- #
 # https://docs.python.org/3/library/asyncio.html
@@ -9,50 +18,157 @@ import asyncio
 # decode and encode objects to and from bytes
 import pickle
 
+# https://docs.python.org/3/library/time.html#time.perf_counter
+import time
+
 # -- python community libs -- #
 # pip install mypy-lang
 # http://mypy.readthedocs.org/en/latest/introduction.html
 # library that adds optional types which helps on readability and intellisense autocompletion
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 # pip install toolz
 # http://toolz.readthedocs.org/en/latest/
 # library that adds common functions, primarely for list and dictionary manipulation
-from toolz.curried import pipe, filter, map
+from toolz.curried import pipe, map
 from toolz import curry
 
 
 class SimpleServer:
     def __init__(self, info: ServerInfo, servers: List[ServerInfo],
-                 loop, data: Dict[str, str]):
-        self.servers = servers
-        self.servers.append(info)
+                 loop, data: Dict[str, str], sync_interval: float = 10.0,
+                 gossip_interval: float = 1.0, gossip_fanout: int = 3,
+                 queue_messages: int = 1024, queue_bytes: int = 16 * 1024 * 1024,
+                 send_delay: float = 3.0, transport=None, sync_fanout: int = 3,
+                 broadcast: str = 'tree', broadcast_fanout: int = 3,
+                 sync_rate: float = 16 * 1024 * 1024, sync_page: int = 256 * 1024):
+        # the servers we know of, which is spread to the others by gossip
+        self.membership = Membership(info, servers, gossip_fanout)
+        self.gossip_interval = gossip_interval
         self.loop = loop
         self.info = info
         self.data = data
+        # the version of every value, which is the time it was published at and the server publishing it,
+        # such that two servers holding different values of a key both keep the newest one, whichever syncs first.
+        # The data a server starts out with is older than anything published, and when two servers start out with
+        # different values of a key, the value of the server whose address sorts last wins
+        self.versions = {key: (0, str(info)) for key in data}  # type: Dict[str, Tuple[int, str]]
+        # summary of the data, which is kept up to date on every insert, such that a sync only has to send
+        # the summary, and then the parts of the data which differs
+        self.digest = DataDigest.of(data)
+        self.sync_interval = sync_interval
+        self.sync_fanout = sync_fanout  # number of random servers a digest is sent to every sync
+        # the data of the differing buckets is sent in pages of about sync_page bytes, at most sync_rate bytes
+        # per second, such that a new server pulling in the whole dataset does not crowd out everything else
+        self.sync_bucket = TokenBucket(sync_rate, 4 * sync_page, loop)
+        self.sync_page = sync_page
+        # new data is relayed to all servers by the servers themselves, see Broadcast.py
+        self.broadcaster = Broadcaster(self.membership, broadcast, broadcast_fanout)
+        # counters and histograms of the messages, which are asked for with a StatsRequest, see Metrics.py
+        self.metrics = Metrics(loop)
+        self.send_delay = send_delay  # simulated network delay of every message
+        # tcp, or an in-memory network when many servers are simulated in one process, see Transport.py
+        self.transport = transport or TcpTransport(loop)
+        # long lived connections to the other servers
+        self.pool = ConnectionPool(loop, self.handle_frame, transport=self.transport, local=info)
+        # a bounded queue per server, where digests and gossip overtake the data, see SendQueues.py
+        self.queues = SendQueues(self.pool, loop, queue_messages, queue_bytes)
         self.server = pipe(
-            asyncio.start_server(self.handle_msg,
-                                 info.ip,
-                                 info.port,
-                                 loop=loop),
+            self.transport.serve(info, self.handle_frame),
             loop.run_until_complete)
 
         # the async function enqueues a coroutine to be run in the event loop,
         # and continues current flow immediatly without waiting
-        asyncio.async(self.sync_data())
+        self.sync_task = asyncio.async(self.sync_data())
+        self.gossip_task = asyncio.async(self.gossip())
+
+    @property
+    def servers(self) -> List[ServerInfo]:
+        return self.membership.members()
+
+    def put(self, key: str, value: str, version: Tuple[int, str]):
+        replaced = key in self.data
+        self.digest.put(key, value, self.data.get(key), replaced)
+        self.data[key] = value
+        self.versions[key] = version
+
+    def newer(self, key: str, value: str, version: Tuple[int, str]) -> bool:
+        """
+        whether the value is newer than the one we hold of the key. Versions of the same time are told apart by the
+        server publishing them, so the value itself only breaks a tie between two values one server published at once,
+        such that all servers pick the same one of any two values
+        """
+        return key not in self.data or (version, value) > (self.versions[key], self.data[key])
+
+    def merge(self, data: Dict[str, str], versions: Dict[str, Tuple[int, str]]):
+        """puts the values which are newer than the ones we hold, the last writer wins"""
+        for k, v in data.items():
+            if self.newer(k, v, versions[k]):
+                self.put(k, v, versions[k])
+
+    def publish(self, data: Dict[str, str]):
+        """puts the data, and broadcasts it to all the servers"""
+        version = (int(time.time() * 1e9), str(self.info))
+        versions = {key: version for key in data}
+        self.merge(data, versions)
+        self.relay(BroadcastMessage(self.broadcaster.originate(), self.info, 0, data, versions, self.info))
+
+    def relay(self, msg: BroadcastMessage):
+        pipe(self.broadcaster.targets(msg.origin, msg.sender),
+             map(lambda target: self.send_message_to(
+                 target, BroadcastMessage(msg.msg_id, msg.origin, msg.hops + 1, msg.data, msg.versions, self.info))),
+             map(asyncio.async),
+             list
+             )
 
     # functions marked as coroutine can be scheduled for run in the event loop
     @asyncio.coroutine
     def sync_data(self):
-        pipe(self.servers,
-             filter(lambda s: s != self.info),
-             map(self.send_data_to),
-             list  # calling list will force the lazy sequence to be evaluated
-             )
+        # every sync exchanges digests with a few random servers, which pulls in the data that a broadcast missed,
+        # and a sync where nothing has changed only costs the digests, so it is cheap to repeat
+        while True:
+            pipe(self.membership.sample(self.sync_fanout, {self.info}),
+                 map(self.send_digest_to),
+                 list  # calling list will force the lazy sequence to be evaluated
+                 )
+            yield from asyncio.sleep(self.sync_interval)
+
+    def send_digest_to(self, recipient):
+        pipe(
+            DigestMessage(self.digest.root, list(self.digest.buckets), self.info),
+            curry(self.send_message_to, recipient),
+            asyncio.async
+        )
+
+    def send_buckets_to(self, recipient, buckets: List[int], keys, reply: bool):
+        asyncio.async(self.stream_buckets(recipient, buckets, keys, reply))
+
+    @asyncio.coroutine
+    def stream_buckets(self, recipient, buckets: List[int], keys, reply: bool):
+        """
+        sends the data of the buckets a few buckets at a time, where every page carries the buckets it covers,
+        such that the recipient can answer every page with its own data of those buckets
+        """
+        by_bucket = {bucket: [] for bucket in buckets}  # type: Dict[int, List[str]]
+        for k in keys:
+            by_bucket[self.digest.bucket_of(k)].append(k)
+        page = []
+        size = 0
+        for i, bucket in enumerate(buckets):
+            page.append(bucket)
+            size += sum(len(k) + len(str(self.data[k])) for k in by_bucket[bucket])
+            if size >= self.sync_page or i == len(buckets) - 1:
+                data = {k: self.data[k] for b in page for k in by_bucket[b]}
+                versions = {k: self.versions[k] for k in data}
+                yield from self.sync_bucket.take(size)
+                msg = BucketDataMessage(page, data, versions, reply, self.info)
+                asyncio.async(self.send_message_to(recipient, msg))
+                page = []
+                size = 0
 
     def send_data_to(self, recipient):
         pipe(
-            DataMessage(self.data, self.info),
+            DataMessage(self.data, self.versions, self.info),
             curry(self.send_message_to, recipient),
             asyncio.async
         )
@@ -61,68 +177,113 @@ class SimpleServer:
     def send_message_to(self, recipient: ServerInfo, msg: Message):
         # asyncio.sleep syspends the function and allows the event loop to continue processing on the next scheduled
         # coroutine in the queue, until this one finishes its sleep
-        yield from asyncio.sleep(3)
-        reader, writer = yield from asyncio.open_connection(recipient.ip,
-                                                            recipient.port,
-                                                            loop=loop)
-        pipe(msg,
-             pickle.dumps,
-             writer.write)
-        writer.close()
+        if self.send_delay > 0:
+            yield from asyncio.sleep(self.send_delay)
+        try:
+            if isinstance(msg, (DataMessage, BucketDataMessage, BroadcastMessage)):
+                # a data sync waits for room in the queue rather than being dropped, which slows down the syncs
+                # instead of the rest of the messages
+                yield from self.queues.put(recipient, MESSAGE_TAGS[type(msg)], self.encode(msg), BULK)
+            else:
+                yield from self.queues.send(recipient, MESSAGE_TAGS[type(msg)], self.encode(msg), CONTROL)
+        except (ConnectionError, OSError) as e:
+            # the data a server misses is pulled in by a later sync, so the message is not retried
+            log.warning("%s could not reach %s: %r", self.info, recipient, e)
+
+    def encode(self, msg: Message) -> bytes:
+        started = time.perf_counter()
+        payload = pickle.dumps(msg) if self.transport.serializes else msg
+        self.metrics.sent(type(msg).__name__, payload_size(payload), time.perf_counter() - started)
+        return payload
 
     @asyncio.coroutine
-    def sync_servers_list(self):
-        pipe(self.servers,
-             filter(lambda s: s != self.info),
-             map(self.send_servers_list_to),
-             list  # calling list will force the lazy sequence to be evaluated
-             )
+    def gossip(self):
+        # every round the news about members is sent to a few random members, see Gossip.py
+        while True:
+            delta = self.membership.next_delta()
+            if len(delta) > 0:
+                pipe(self.membership.targets(),
+                     map(curry(self.send_membership_to, delta)),
+                     list
+                     )
+            yield from asyncio.sleep(self.gossip_interval)
 
-    def send_servers_list_to(self, recipient):
+    def send_membership_to(self, entries, recipient):
         pipe(
-            ServerListMessage(self.servers, self.info),
+            MembershipDelta(entries, self.info),
             curry(self.send_message_to, recipient),
             asyncio.async
         )
 
-    @asyncio.coroutine
-    def handle_msg(self, reader, writer):
-        # reading the received bytes
-        msg = yield from reader.read()
-
+    def handle_frame(self, conn: FramedConnection, frame: Frame):
         # decodes the object from bytes
-        data = pickle.loads(msg)
+        started = time.perf_counter()
+        data = pickle.loads(frame.payload) if self.transport.serializes else frame.payload
+        self.metrics.received(type(data).__name__, payload_size(frame.payload), time.perf_counter() - started)
+
+        if isinstance(data, StatsRequest):
+            # the one asking is not necessarily a server, so it is not added to the membership
+            stats = dict(self.metrics.to_dict(), node=str(self.info), keys=len(self.data), servers=len(self.servers),
+                         send_queues=self.queues.stats(), broadcast_duplicates=self.broadcaster.duplicates)
+            conn.reply(frame, MESSAGE_TAGS[StatsResponse], self.encode(StatsResponse(stats, self.info)))
+            return
 
-        # if we see a new server then we update out own list and send the updated list to all other servers
+        # if we see a new server then we add it to our membership, from where it is gossiped to the others,
+        # and the new server gets all the members we know of
         if isinstance(data, Message):
-            if not(data.sender in self.servers):
-                self.servers.append(data.sender)
-                asyncio.async(self.sync_servers_list())
+            if not(data.sender in self.membership):
+                self.membership.add(data.sender)
+                self.send_membership_to(self.membership.snapshot(), data.sender)
 
         # match message type and perform appropiate actions
         if isinstance(data, Inform):
-            print(data.info)
+            log.info('%s', data.info)
         elif isinstance(data, ServerListMessage):
-            print('%s got new serverlist %d' % (self.info, len(self.servers)))
-            self.servers = list(set(data.servers) | set(self.servers))  # union of the two server lists
+            log.debug('%s got new serverlist %d', self.info, len(self.servers))
+            self.membership.merge([(server, 0) for server in data.servers])
+        elif isinstance(data, MembershipDelta):
+            if len(self.membership.merge(data.entries)) > 0:
+                log.debug('%s now knows %d servers', self.info, len(self.membership))
         elif isinstance(data, DataMessage):
-            # the difference between received dataset and local
-            new_data_keys = set(data.data.keys()) - set(self.data.keys())
-            new_data_keys_other = set(self.data.keys()) - set(data.data.keys())
+            self.merge(data.data, data.versions)
 
-            for k in new_data_keys:
-                self.data[k] = data.data[k]
-
-            # if the other guys dataset is missing some of our data, then we schedule a sync
-            if len(new_data_keys_other) > 0:
+            # if the other guys dataset is missing some of our data, or holds older values, then we schedule a sync
+            if any(k not in data.data or data.versions[k] != self.versions[k] for k in self.data):
                 self.send_data_to(data.sender)
 
-            print('synced %s, now has data: %s' % (self.info, self.data))
+            log.debug('synced %s, now has data: %s', self.info, self.data)
+        elif isinstance(data, BroadcastMessage):
+            # the copies of a message which has already been handled are dropped, instead of being relayed again
+            if self.broadcaster.first_time(data.msg_id, data.hops):
+                self.merge(data.data, data.versions)
+                self.relay(data)
+        elif isinstance(data, DigestMessage):
+            # only the buckets where the datasets differ are sent back,
+            # and the sender is asked to return the part of those buckets that we lack or hold older values of
+            buckets = self.digest.differing_buckets(data.root, data.buckets)
+            if len(buckets) > 0:
+                self.send_buckets_to(data.sender, buckets, self.digest.keys_in(buckets), reply=True)
+        elif isinstance(data, BucketDataMessage):
+            self.merge(data.data, data.versions)
+
+            # after the merge we hold the newest of the two values of every key, so the keys where the sender
+            # holds another value, or none, are the ones it lacks
+            if data.reply:
+                outdated_keys_other = {k for k in self.digest.keys_in(data.buckets)
+                                       if k not in data.data or data.versions[k] != self.versions[k]}
+                if len(outdated_keys_other) > 0:
+                    self.send_buckets_to(data.sender, data.buckets, outdated_keys_other, reply=False)
+
+            log.debug('synced %d buckets %s, now has %d keys', len(data.buckets), self.info, len(self.data))
         else:
-            print('unkown message type!')
-            print(data)
+            log.warning('%s got unknown message type %s', self.info, type(data).__name__)
 
     def kill(self):
+        self.sync_task.cancel()
+        self.gossip_task.cancel()
+        self.metrics.close()
+        self.queues.close()
+        self.pool.close()
         self.server.close()
         self.loop.run_until_complete(self.server.wait_closed())
 
@@ -130,6 +291,7 @@ class SimpleServer:
 if __name__ == "__main__":
     # the backbone of async is its event loop which is responsible for running the tasks you give it
     loop = asyncio.get_event_loop()
+    start_logging()
 
     # information for three servers
     servers = [
@@ -148,6 +310,8 @@ if __name__ == "__main__":
         SimpleServer(servers[3], [servers[0]], loop, {'jp': 'konnichiwa'}),
         SimpleServer(servers[4], [servers[0]], loop, {'ch': 'ni hao'}),
     ]
+    # once the servers know each other, a new greeting is broadcast to all of them
+    loop.call_later(15, started_servers[2].publish, {'se': 'hej'})
 
     try:
         loop.run_forever()
@@ -157,4 +321,5 @@ if __name__ == "__main__":
         for s in started_servers:
             s.kill()
         loop.close()
+        stop_logging()
         print('over and out')
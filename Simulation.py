@@ -0,0 +1,173 @@
+"""
+This file contains a simulation of a large tree of DataRepNodes, which all run in this process on one event loop
+and talk to each other over the in-memory LoopbackTransport instead of sockets, see Transport.py.
+Nothing is serialized and no port is bound, so a tree of a thousand nodes is set up and commits writes in seconds,
+eg.
+    python Simulation.py --nodes 1000 --fanout 10 --writes 500 --latency lognormal --median 0.002
+    python Simulation.py --nodes 1000 --loss 0.01 --partition 0.2 --seed 7 --profile simulation.prof
+
+Every write is replicated to every node of the tree, so the client sends its writes through a few entry nodes,
+which commit them in batches, instead of starting a round per write on each of the thousand nodes.
+
+The latencies and losses are drawn from a generator seeded with --seed, and so are the ids of the rounds,
+so a run can be repeated with the same network, and its profile compared with the one before a change.
+The commit latencies are measured on the clock of the loop, so they include the simulated latencies.
+"""
+__author__ = 'michel'
+from DataRepMessages import *
+from DataRepServer import DataRepNode
+from ConnectionPool import ConnectionPool
+from Framing import FramedConnection, Frame
+from QuorumBenchmark import percentile
+from Transport import LoopbackTransport, Latency, constant, uniform, exponential, lognormal
+import Topology
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/profile.html
+# a deterministic profiler, which counts every call of every function during the run
+import cProfile
+import pstats
+
+import argparse
+import random
+import time
+
+# -- python community libs -- #
+from typing import Dict, List
+
+
+class SimulatedClient:
+    """sends writes to the nodes over the transport, and records the latency of every acknowledged write"""
+    def __init__(self, info: ServerInfo, transport: LoopbackTransport, loop):
+        self.info = info
+        self.loop = loop
+        self.sent = dict()  # type: Dict[int, float]
+        self.latencies = []  # type: List[float]
+        self.rejected = 0
+        self.pool = ConnectionPool(loop, self.handle_frame, max_connections=100000, transport=transport, local=info)
+        self.server = loop.run_until_complete(transport.serve(info, self.handle_frame))
+
+    def handle_frame(self, conn: FramedConnection, frame: Frame):
+        msg = frame.payload
+        if isinstance(msg, ClientDataResponse) and msg.version_number in self.sent:
+            sent = self.sent.pop(msg.version_number)
+            if msg.accepted:
+                self.latencies.append(self.loop.time() - sent)
+            else:
+                self.rejected += 1
+
+    @asyncio.coroutine
+    def send_writes(self, servers: List[ServerInfo], writes: int, rate: float):
+        started = self.loop.time()
+        for i in range(writes):
+            due = started + i / rate
+            if due > self.loop.time():
+                yield from asyncio.sleep(due - self.loop.time(), loop=self.loop)
+            msg = ClientDataMessage(self.info, Data(content='write %d' % i, version_number=i))
+            self.sent[i] = self.loop.time()
+            try:
+                yield from self.pool.send(servers[i % len(servers)], MESSAGE_TAGS[ClientDataMessage], msg)
+            except ConnectionError:
+                pass
+
+    def close(self):
+        self.pool.close()
+        self.server.close()
+
+
+def latency_of(args) -> Latency:
+    if args.latency == 'constant':
+        return constant(args.median)
+    elif args.latency == 'uniform':
+        return uniform(0.0, 2 * args.median)
+    elif args.latency == 'exponential':
+        return exponential(args.median / 2, minimum=args.median / 2)
+    return lognormal(args.median, args.sigma)
+
+
+def simulate(args, loop) -> dict:
+    random.seed(args.seed)
+    transport = LoopbackTransport(loop, latency_of(args), args.loss, seed=args.seed)
+    servers = [ServerInfo('10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255), 5000) for i in range(args.nodes)]
+    client = SimulatedClient(ServerInfo('10.255.255.255', 5000), transport, loop)
+
+    setup_started = time.perf_counter()
+    structures = Topology.network_structures(servers, args.fanout)
+    stand_ins = Topology.stand_ins(structures)
+    nodes = [DataRepNode(server, structure, loop, Data('lorem', 0), send_delay=0, transport=transport,
+                         level_timeout=args.level_timeout, batch_window=args.batch_window,
+                         heartbeat_interval=args.heartbeat_interval, stand_ins=stand_ins)
+             for server, structure in zip(servers, structures)]
+    setup = time.perf_counter() - setup_started
+
+    # the last share of the nodes is cut off from the rest, and the client, for the whole run
+    cut_off = servers[len(servers) - int(len(servers) * args.partition):]
+    if len(cut_off) > 0:
+        transport.partition(cut_off)
+    entries = servers[:min(args.entries, len(servers) - len(cut_off))]
+
+    run_started = time.perf_counter()
+    loop.run_until_complete(client.send_writes(entries, args.writes, args.rate))
+    # waits for the last writes, or for their rounds to time out
+    deadline = loop.time() + args.level_timeout * (Topology.tree_depth(args.nodes, args.fanout) + 1)
+    while len(client.sent) > 0 and loop.time() < deadline:
+        loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+    run = time.perf_counter() - run_started
+
+    result = {
+        'nodes': args.nodes,
+        'depth': Topology.tree_depth(args.nodes, args.fanout),
+        'setup_seconds': setup,
+        'run_seconds': run,
+        'committed': len(client.latencies),
+        'rejected': client.rejected,
+        'lost': args.writes - len(client.latencies) - client.rejected,
+        'latency_p50_ms': percentile(client.latencies, 0.5) * 1000,
+        'latency_p99_ms': percentile(client.latencies, 0.99) * 1000,
+        'messages_per_commit': sum(node.messages_sent for node in nodes) / max(1, len(client.latencies)),
+        'frames_delivered': transport.delivered,
+        'frames_lost': transport.lost,
+    }
+    for node in nodes:
+        node.kill()
+    client.close()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='simulates a tree of DataRepNodes over an in-memory network')
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--writes', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=100.0, help='client writes per second')
+    parser.add_argument('--entries', type=int, default=1, help='number of nodes the client sends its writes to')
+    parser.add_argument('--batch-window', type=float, default=0.5)
+    parser.add_argument('--latency', choices=['constant', 'uniform', 'exponential', 'lognormal'], default='lognormal',
+                        help='distribution of the latency of every message')
+    parser.add_argument('--median', type=float, default=0.001, help='median latency in seconds')
+    parser.add_argument('--sigma', type=float, default=0.5, help='spread of the lognormal latency')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability that a message is lost')
+    parser.add_argument('--partition', type=float, default=0.0, help='share of the nodes cut off from the rest')
+    parser.add_argument('--level-timeout', type=float, default=1.0)
+    # every node pings the idle peers of its groups, which for a thousand nodes sharing one cpu adds up
+    parser.add_argument('--heartbeat-interval', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--profile', help='file to write the profile of the run to, the top functions are printed')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    result = simulate(args, loop)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    loop.close()
+
+    for name, value in result.items():
+        print('%20s %s' % (name, '%.3f' % value if isinstance(value, float) else value))
@@ -0,0 +1,171 @@
+"""
+This file contains functions for building the network structures of a tree of data replication nodes.
+The network structure of a node lists, for every level of the tree, the group it is part of at that level,
+where the node itself represents its own group in every virtual level, eg. for node 4 in a tree of 27 nodes
+
+    [[4, 9, 18], [0, 4, 6], [3, 4, 5]]
+
+Any number of servers can be arranged in a tree. The servers are split into as few groups as fit below each level,
+where the sizes of the groups differ by at most one. A group of two needs both members for a majority, such that one
+dead server would block every round passing through it, so from three servers on no group has two members,
+nor one member apart from a node representing its own group. Some groups get more than fanout members instead,
+eg. 10 servers with a fanout of 3 become
+
+              _______0_______________
+             |               |       |
+             0               4       7
+             |               |       |
+             0               4       7      <- bottom groups [0, 1, 2, 3], [4, 5, 6], [7, 8, 9]
+"""
+__author__ = 'michel'
+from DataRepMessages import ServerInfo
+
+# -- python core libs -- #
+import math
+
+# -- python community libs -- #
+from typing import Dict, List, Tuple
+
+# the groups of a server at every level, from the top level to its bottom level group
+Structure = List[List[ServerInfo]]
+
+
+def tree_depth(size: int, fanout: int) -> int:
+    """the number of levels needed for a tree of the given size, where every group has fanout members"""
+    if fanout < 2:
+        raise ValueError('groups of %d servers do not make up a tree' % fanout)
+    depth, capacity = 1, fanout
+    while capacity < size:
+        depth, capacity = depth + 1, capacity * fanout
+    return depth
+
+
+def quorum_latency(size: int, fanout: int, send_time: float = 0.05) -> float:
+    """
+    the expected time of a quorum round, in round trips, which is the cost the fanout is chosen by.
+    At every level the leader first only asks as many of the other members as needed for a majority,
+    sending the requests one after the other, which takes send_time each, and then waits for the slowest of them.
+    With round trips taking an exponentially distributed time, the slowest of m takes 1 + 1/2 + ... + 1/m of them,
+    so a larger fanout means fewer levels but a longer wait at each of them
+    """
+    asked = fanout // 2
+    slowest = sum(1.0 / i for i in range(1, asked + 1))
+    return tree_depth(size, fanout) * (slowest + asked * send_time)
+
+
+def best_fanout(size: int, send_time: float = 0.05) -> int:
+    """
+    the fanout with the lowest expected quorum latency for a tree of the given size, the shallower tree wins a tie.
+    A group of two needs both members for a majority, such that one dead server blocks every round,
+    so the smallest fanout considered is three, which is the smallest group to survive losing a member
+    """
+    candidates = range(3, max(3, size) + 1)
+    return min(candidates, key=lambda fanout: (quorum_latency(size, fanout, send_time), tree_depth(size, fanout)))
+
+
+def split(servers: List[ServerInfo], parts: int) -> List[List[ServerInfo]]:
+    """splits the servers into the given number of groups, whose sizes differ by at most one"""
+    size, larger = divmod(len(servers), parts)
+    groups, start = [], 0
+    for i in range(parts):
+        end = start + size + (1 if i < larger else 0)
+        groups.append(servers[start:end])
+        start = end
+    return groups
+
+
+def parts_of(size: int, capacity: int) -> int:
+    """
+    the number of subgroups a group of the given size is split into, such that they hold at most capacity servers,
+    unless that would leave a group of fewer than three servers, in which case some of them get more.
+    A group of the subgroups' representatives which would have two members is made one of three or of one instead
+    """
+    if size < 3:
+        return 1
+    parts = min(math.ceil(size / capacity), size // 3)
+    if parts == 2:
+        parts = 3 if size >= 9 else 1
+    return parts
+
+
+def network_structures(servers: List[ServerInfo], fanout: int = 3, depth: int = None) -> List[Structure]:
+    """
+    builds the network structure of every server, such that network_structures(servers)[i] belongs to servers[i].
+    The first server of a group is the one representing the group in the levels above it.
+    Without a depth, the tree gets as few levels as the fanout allows, and with a fanout of None
+    the fanout is chosen by best_fanout
+    """
+    if fanout is None:
+        fanout = best_fanout(len(servers))
+    elif fanout < 2:
+        raise ValueError('groups of %d servers do not make up a tree' % fanout)
+    depth = depth or tree_depth(len(servers), fanout)
+    if fanout ** depth < len(servers):
+        raise ValueError('%d servers do not fit in %d levels of groups of %d' % (len(servers), depth, fanout))
+
+    structures = [[] for i in range(len(servers))]  # type: List[Structure]
+
+    def assign(first: int, group: List[ServerInfo], lvl: int):
+        """adds the groups at the given level, and below it, to the structures of the servers in group"""
+        if lvl == depth - 1:
+            for i in range(len(group)):
+                structures[first + i].append(group)
+            return
+
+        # every subgroup must fit in the levels below this one
+        capacity = fanout ** (depth - lvl - 1)
+        subgroups = split(group, parts_of(len(group), capacity))
+        start = first
+        for subgroup in subgroups:
+            for i, server in enumerate(subgroup):
+                # the server represents its own subgroup, the other subgroups are represented by their first server
+                structures[start + i].append([server if other is subgroup else other[0] for other in subgroups])
+            assign(start, subgroup, lvl + 1)
+            start += len(subgroup)
+
+    assign(0, list(servers), 0)
+    return structures
+
+
+def stand_ins(structures: List[Structure]) -> Dict[ServerInfo, List[ServerInfo]]:
+    """
+    the servers which can stand in for every server where it represents its group, which are the other members
+    of its bottom level group, since they are part of every group the server represents.
+    Any member of a group can assemble the quorum of the group, as every member has the levels below in its structure
+    """
+    result = dict()  # type: Dict[ServerInfo, List[ServerInfo]]
+    for structure in structures:
+        for server in structure[-1]:
+            if server not in result:
+                result[server] = [other for other in structure[-1] if other != server]
+    return result
+
+
+def rebuild(servers: List[ServerInfo], joined: List[ServerInfo], left: List[ServerInfo],
+            fanout: int = 3, depth: int = None) -> Tuple[List[ServerInfo], Dict[ServerInfo, Structure]]:
+    """
+    rebuilds the tree after the membership has changed, and returns the new order of the servers
+    together with the structures which changed, such that only the servers in it need to be updated.
+    A joining server takes the place of a leaving one, so as long as the same number join as leave, only the groups
+    of the replaced servers change. Any other joining servers are appended at the end, which changes the split
+    of the servers into groups, and with it most of the structures
+    """
+    old = dict(zip(servers, network_structures(servers, fanout, depth))) if len(servers) > 0 else dict()
+    gone = set(left)
+    joining = [server for server in joined if server not in old]
+
+    order = []
+    for server in servers:
+        if server not in gone:
+            order.append(server)
+        elif len(joining) > 0:
+            order.append(joining.pop(0))
+    order += joining
+
+    if len(order) == 0:
+        return order, dict()
+    changed = dict()  # type: Dict[ServerInfo, Structure]
+    for server, structure in zip(order, network_structures(order, fanout, depth)):
+        if old.get(server) != structure:
+            changed[server] = structure
+    return order, changed
@@ -0,0 +1,262 @@
+"""
+This file contains the transports which the servers talk to each other over, that is where the connections
+a server accepts and opens come from
+- TcpTransport, real tcp connections between processes or machines, carrying the frames of Framing.py
+- LoopbackTransport, an in-memory network between servers on the same event loop, which hands the messages
+  from one server to the other without serializing them, and simulates the latency, loss and partitions
+  of a real network, such that a tree of a thousand nodes can be run in a single process, see Simulation.py
+Both hand the servers connections with the interface of FramedConnection, so a server does not know which one it runs
+on, except that it only encodes its messages when the transport serializes them.
+
+A transport has
+    serializes                         whether the payload of a frame has to be bytes
+    serve(info, handler, on_closed)    coroutine, listens at the address, and returns a server that can be closed
+    connect(local, recipient, handler) coroutine, opens a connection from the local address to the recipient
+where every frame coming in on a connection is given to the handler as handler(connection, frame)
+"""
+__author__ = 'michel'
+from Framing import FramedConnection, Frame
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/random.html
+# the latencies and losses are drawn from a generator of their own, such that a seeded simulation can be repeated
+import random
+import itertools
+import math
+
+# https://docs.python.org/3/library/collections.html#collections.deque
+from collections import deque
+
+# -- python community libs -- #
+from typing import Any, Callable, Dict, List, Set
+
+# a latency distribution draws the seconds a frame takes to arrive from the random generator it is given
+Latency = Callable[[random.Random], float]
+
+
+class TcpServer:
+    """accepts tcp connections at an address, and closes the ones still open when it is closed itself"""
+    def __init__(self, loop, handler: Callable, on_closed: Callable = None):
+        self.loop = loop
+        self.handler = handler
+        self.on_closed = on_closed  # called with every accepted connection once it has closed
+        self.connections = set()  # type: Set[FramedConnection]
+        self.server = None  # type: asyncio.AbstractServer
+
+    @asyncio.coroutine
+    def accept(self, reader, writer):
+        # a connection stays open and carries frames in both directions until one of the ends closes it
+        conn = FramedConnection(reader, writer, self.loop, self.handler)
+        self.connections.add(conn)
+        yield from asyncio.wait([conn.reader_task], loop=self.loop)
+        self.connections.discard(conn)
+        if self.on_closed is not None:
+            self.on_closed(conn)
+
+    def close(self):
+        self.server.close()
+        for conn in list(self.connections):
+            conn.close()
+
+    @asyncio.coroutine
+    def wait_closed(self):
+        yield from self.server.wait_closed()
+
+
+class TcpTransport:
+    serializes = True
+
+    def __init__(self, loop):
+        self.loop = loop
+
+    @asyncio.coroutine
+    def serve(self, info, handler: Callable, on_closed: Callable = None) -> TcpServer:
+        server = TcpServer(self.loop, handler, on_closed)
+        server.server = yield from asyncio.start_server(server.accept, info.ip, info.port, loop=self.loop)
+        return server
+
+    @asyncio.coroutine
+    def connect(self, local, recipient, handler: Callable) -> FramedConnection:
+        reader, writer = yield from asyncio.open_connection(recipient.ip, recipient.port, loop=self.loop)
+        return FramedConnection(reader, writer, self.loop, handler)
+
+
+def constant(seconds: float) -> Latency:
+    return lambda rng: seconds
+
+
+def uniform(low: float, high: float) -> Latency:
+    return lambda rng: rng.uniform(low, high)
+
+
+def exponential(mean: float, minimum: float = 0.0) -> Latency:
+    """a minimum, like the time of flight, plus an exponentially distributed wait, like the time spent in queues"""
+    return lambda rng: minimum + rng.expovariate(1.0 / mean)
+
+
+def lognormal(median: float, sigma: float = 0.5) -> Latency:
+    """a heavy tailed latency, where most frames arrive close to the median and a few take many times longer"""
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+class LoopbackConnection(FramedConnection):
+    """
+    one end of an in-memory connection, whose frames are handed to the other end by the transport.
+    Frames arrive in the order they are written, like on a tcp connection, even when their latencies differ,
+    and the frames written before the connection is closed still arrive before the other end sees it close
+    """
+    def __init__(self, transport: 'LoopbackTransport', local, remote, handler: Callable):
+        super().__init__(None, None, transport.loop, handler)
+        self.transport = transport
+        self.local = local
+        self.remote = remote
+        self.peer = None  # type: LoopbackConnection  # the other end
+        self.closing = False
+        self.in_flight = deque()  # the frames on their way to the other end, where None is the end of the stream
+        self.arrives = 0.0  # the time the latest frame written on this end arrives at the other end
+        self.on_closed = None  # type: Callable
+
+    def write(self, frame: Frame):
+        if self.closing:
+            raise ConnectionResetError('connection closed')
+        self.last_used = self.loop.time()
+        self.transport.deliver(self, frame)
+
+    def write_parts(self, tag: int, parts: List[bytes]):
+        self.write(Frame(tag, b''.join(parts)))
+
+    @asyncio.coroutine
+    def drain(self):
+        # nothing is buffered, the frames are in flight until the transport delivers them
+        if self.closing:
+            raise ConnectionResetError('connection closed')
+
+    def buffered(self) -> int:
+        return 0
+
+    def is_closed(self) -> bool:
+        return self.closing
+
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self.fail_pending()
+        if self.on_closed is not None:
+            self.on_closed(self)
+        self.run_close_callbacks()
+        # the other end sees the connection close after the frames in flight to it, and the ones to us are lost
+        if self.peer is not None and not self.peer.closing:
+            self.transport.send(self, None)
+
+
+class LoopbackServer:
+    def __init__(self, transport: 'LoopbackTransport', info, handler: Callable, on_closed: Callable = None):
+        self.transport = transport
+        self.info = info
+        self.handler = handler
+        self.on_closed = on_closed
+        self.connections = set()  # type: Set[LoopbackConnection]
+        self.closed = asyncio.Event(loop=transport.loop)
+
+    def accept(self, conn: LoopbackConnection):
+        self.connections.add(conn)
+        conn.on_closed = self.forget
+
+    def forget(self, conn: LoopbackConnection):
+        self.connections.discard(conn)
+        if self.on_closed is not None:
+            self.on_closed(conn)
+
+    def close(self):
+        if self.transport.servers.get(self.info) is self:
+            del self.transport.servers[self.info]
+        for conn in list(self.connections):
+            conn.close()
+        self.closed.set()
+
+    @asyncio.coroutine
+    def wait_closed(self):
+        yield from self.closed.wait()
+
+
+class LoopbackTransport:
+    """
+    An in-memory network shared by all the servers on one event loop, where every server is found by its address.
+    Every frame is delayed by a latency drawn from the given distribution, and lost with the given probability,
+    and the servers can be split into partitions which do not reach each other until the network is healed.
+    With serialize turned on the servers still encode their messages, which costs the time but counts the bytes
+    """
+    def __init__(self, loop, latency: Latency = constant(0.0005), loss: float = 0.0, seed: int = None,
+                 serialize: bool = False):
+        self.loop = loop
+        self.latency = latency
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.serializes = serialize
+        self.servers = dict()  # type: Dict[Any, LoopbackServer]
+        # address -> the partition it is in, where the addresses not in here are all in partition 0
+        self.partitions = dict()  # type: Dict[Any, int]
+        self.partition_ids = itertools.count(1)
+        self.delivered = 0
+        self.lost = 0
+
+    @asyncio.coroutine
+    def serve(self, info, handler: Callable, on_closed: Callable = None) -> LoopbackServer:
+        if info in self.servers:
+            raise OSError('address %s is already in use' % (info,))
+        server = self.servers[info] = LoopbackServer(self, info, handler, on_closed)
+        return server
+
+    @asyncio.coroutine
+    def connect(self, local, recipient, handler: Callable) -> LoopbackConnection:
+        server = self.servers.get(recipient)
+        if server is None:
+            raise ConnectionRefusedError('nothing listens at %s' % (recipient,))
+        conn = LoopbackConnection(self, local, recipient, handler)
+        conn.peer = LoopbackConnection(self, recipient, local, server.handler)
+        conn.peer.peer = conn
+        server.accept(conn.peer)
+        return conn
+
+    def partition(self, addresses: List[Any]):
+        """cuts the addresses off from the rest of the network, such that they only reach each other"""
+        partition = next(self.partition_ids)
+        for address in addresses:
+            self.partitions[address] = partition
+
+    def heal(self):
+        self.partitions.clear()
+
+    def reachable(self, sender, recipient) -> bool:
+        return self.partitions.get(sender, 0) == self.partitions.get(recipient, 0)
+
+    def deliver(self, conn: LoopbackConnection, frame: Frame):
+        """
+        sends a frame written on a connection. The partitions are checked for every frame, and not only when
+        a connection is opened, such that the connections already open across a partition are cut off as well
+        """
+        if not self.reachable(conn.local, conn.remote) or (self.loss > 0 and self.random.random() < self.loss):
+            self.lost += 1
+            return
+        self.send(conn, frame)
+
+    def send(self, conn: LoopbackConnection, frame: Frame):
+        conn.arrives = max(conn.arrives, self.loop.time() + self.latency(self.random))
+        conn.in_flight.append(frame)
+        self.loop.call_at(conn.arrives, self.arrive, conn)
+
+    def arrive(self, conn: LoopbackConnection):
+        # the frames are taken in the order they were written, whichever of their timers happens to run first
+        frame = conn.in_flight.popleft()
+        if frame is None:
+            conn.peer.close()
+        # a partition which appeared while the frame was in flight loses it as well
+        elif conn.peer.closing or not self.reachable(conn.local, conn.remote):
+            self.lost += 1
+        else:
+            self.delivered += 1
+            conn.peer.receive(frame)
@@ -0,0 +1,71 @@
+"""
+This file contains a benchmark of the write-ahead log, measuring the commit latency and the number of
+durable writes per second for every sync policy, with a number of concurrent writers each waiting
+for its write to be durable before making the next one, the same way a node waits before acknowledging a client.
+
+run it with
+    python WalBenchmark.py [--writes writes per writer] [--directory directory]
+where the directory should be on the disk to be measured, since the temp directory may be in memory
+"""
+__author__ = 'michel'
+from DataRepMessages import Data
+from WriteAheadLog import WriteAheadLog
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+# https://docs.python.org/3/library/argparse.html
+import argparse
+import shutil
+import tempfile
+
+# -- python community libs -- #
+from typing import List
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+@asyncio.coroutine
+def writer(wal: WriteAheadLog, writes: int, first_version: int, latencies: List[float], loop):
+    for i in range(writes):
+        started = loop.time()
+        yield from wal.append([Data(content='write %d' % i, version_number=first_version + i)])
+        latencies.append(loop.time() - started)
+
+
+def run(sync_policy: str, writers: int, writes: int, loop, directory: str = None):
+    """returns the median and 99th percentile commit latency, and the number of durable writes per second"""
+    directory = tempfile.mkdtemp(prefix='wal-', dir=directory)
+    wal = WriteAheadLog(directory, loop, sync_policy, snapshot_every=10 ** 9)
+    wal.recover()
+
+    latencies = []
+    started = loop.time()
+    loop.run_until_complete(asyncio.wait(
+        [writer(wal, writes, i * writes, latencies, loop) for i in range(writers)], loop=loop))
+    elapsed = loop.time() - started
+
+    wal.close()
+    shutil.rmtree(directory)
+    return percentile(latencies, 0.5), percentile(latencies, 0.99), writers * writes / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='measures the commit latency and durable writes per second of the log')
+    parser.add_argument('--writes', type=int, default=200, help='number of writes per writer')
+    parser.add_argument('--directory', default=None, help='where the logs are written, on the disk to be measured')
+    args = parser.parse_args()
+    writes = args.writes
+    directory = args.directory
+    loop = asyncio.get_event_loop()
+
+    print('%8s %8s %12s %12s %12s' % ('policy', 'writers', 'p50 ms', 'p99 ms', 'writes/s'))
+    for sync_policy in ['always', 'group', 'none']:
+        for writers in [1, 8, 64]:
+            p50, p99, throughput = run(sync_policy, writers, writes, loop, directory)
+            print('%8s %8d %12.3f %12.3f %12.0f' % (sync_policy, writers, p50 * 1000, p99 * 1000, throughput))
+
+    loop.close()
@@ -0,0 +1,253 @@
+"""
+This file contains a write-ahead log, which makes the data saved by a DataRepNode survive a restart.
+
+Every saved data is appended to the log as a record of the form
+
+    +----------------+----------------+----------------------------------+
+    | record length  | crc32 of data  | data encoded as in DataRepCodec  |
+    |    4 bytes     |    4 bytes     |  'length' bytes                  |
+    +----------------+----------------+----------------------------------+
+
+and the data only counts as saved once the log has been flushed to disk with fsync.
+Since fsync is by far the most expensive part of a write, there are three sync policies
+- 'always': every append gets its own fsync, which is the slowest but the simplest to reason about
+- 'group': appends made within sync_window seconds of each other share one fsync
+- 'none': the log is never synced, such that writes survive a crash of the process but not of the machine
+
+Every snapshot_every records the current data of every key is written to a snapshot, after which the log is removed,
+so recovery reads the snapshot and replays only the records appended after it.
+A snapshot of a large store takes long to write, so it is written in a thread, while the event loop goes on.
+When it is started, the log is set aside as 'log.old' and the records appended from then on go to a new log,
+since the snapshot does not cover them, and 'log.old' is removed once the snapshot is on disk.
+Recovery replays 'log.old' before the log, such that no record is lost when the process dies while a snapshot is written.
+A record which was only partly written when the process died fails its length or crc check,
+and is cut off the log when it is recovered.
+"""
+__author__ = 'michel'
+from DataRepMessages import Data
+import DataRepCodec
+
+# -- python core libs -- #
+# https://docs.python.org/3/library/asyncio.html
+import asyncio
+
+# https://docs.python.org/3/library/os.html#os.fsync
+import os
+import struct
+
+# https://docs.python.org/3/library/zlib.html#zlib.crc32
+import zlib
+
+# -- python community libs -- #
+from typing import Dict, List, Tuple
+
+RECORD_HEADER = struct.Struct('!II')
+
+SYNC_POLICIES = ('always', 'group', 'none')
+
+
+def encode_record(data: Data) -> bytes:
+    parts = []
+    DataRepCodec.encode_data(data, parts)
+    body = b''.join(parts)
+    return RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_records(path: str) -> Tuple[List[Data], int]:
+    """returns the intact records of the file, and the offset where they end"""
+    with open(path, 'rb') as f:
+        return decode_records(memoryview(f.read()))
+
+
+def fsync_directory(path: str):
+    """makes the files created, renamed or removed in the directory durable"""
+    directory = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def decode_records(buf: memoryview) -> Tuple[List[Data], int]:
+    """returns the intact records at the start of the buffer, and the offset where they end"""
+    records = []
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(buf):
+        length, crc = RECORD_HEADER.unpack_from(buf, offset)
+        start = offset + RECORD_HEADER.size
+        body = buf[start:start + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            break
+        data, end = DataRepCodec.decode_data(body, 0)
+        records.append(data)
+        offset = start + length
+    return records, offset
+
+
+class WriteAheadLog:
+    def __init__(self, directory: str, loop, sync_policy: str = 'group', sync_window: float = 0.002,
+                 snapshot_every: int = 1000):
+        if sync_policy not in SYNC_POLICIES:
+            raise ValueError('unknown sync policy %r, expected one of %s' % (sync_policy, SYNC_POLICIES))
+        self.directory = directory
+        self.loop = loop
+        self.sync_policy = sync_policy
+        self.sync_window = sync_window
+        self.snapshot_every = snapshot_every
+        self.log_path = os.path.join(directory, 'log')
+        self.old_log_path = os.path.join(directory, 'log.old')
+        self.snapshot_path = os.path.join(directory, 'snapshot')
+        os.makedirs(directory, exist_ok=True)
+        self.records = 0  # records appended since the last snapshot
+        # futures of the appends which are waiting for the next group fsync
+        self.waiting = []  # type: List[asyncio.Future]
+        self.sync_task = None
+        self.file = None
+        self.old_file = None  # the log set aside while a snapshot is written
+        # done once the directory entry of the log is durable, which a new log waits for before its records are
+        self.log_created = asyncio.Future(loop=loop)
+        self.log_created.set_result(None)
+        self.snapshot_task = None
+        self.snapshot_store = None  # the store of the next snapshot to write, which is asked for while one is written
+
+    def recover(self) -> Dict[str, Data]:
+        """
+        reads the snapshot and the records appended after it, and returns the newest data of every key among them.
+        Must be called once before the first append.
+        """
+        newest = dict()  # type: Dict[str, Data]
+        records = []
+        if os.path.exists(self.snapshot_path):
+            records, _ = read_records(self.snapshot_path)
+
+        # the process died while a snapshot was written, so the records set aside may not be covered by it
+        interrupted = os.path.exists(self.old_log_path)
+        if interrupted:
+            log, _ = read_records(self.old_log_path)
+            records += log
+
+        if os.path.exists(self.log_path):
+            log, end = read_records(self.log_path)
+            records += log
+            self.records = len(log)
+            # throws away a torn record at the end, such that new records are appended right after the intact ones
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(end)
+
+        for data in records:
+            # the same rule as DataRepNode.save_data, so records already in the snapshot change nothing
+            known = newest.get(data.key)
+            if known is None or data.version_number >= known.version_number:
+                newest[data.key] = data
+
+        if interrupted:
+            # the next snapshot sets the log aside as well, so the records of both logs are snapshotted first
+            self.write_snapshot(list(newest.values()))
+            with open(self.log_path, 'wb'):
+                pass
+            os.remove(self.old_log_path)
+            fsync_directory(self.directory)
+            self.records = 0
+
+        self.file = open(self.log_path, 'ab')
+        return newest
+
+    def append(self, batch: List[Data]) -> asyncio.Future:
+        """appends the data to the log, and returns a future which is done once they are on disk"""
+        self.file.write(b''.join(encode_record(data) for data in batch))
+        self.file.flush()
+        self.records += len(batch)
+
+        durable = asyncio.Future(loop=self.loop)
+        if self.sync_policy == 'none':
+            durable.set_result(None)
+        elif self.sync_policy == 'always':
+            asyncio.async(self.sync([durable], self.file), loop=self.loop)
+        else:
+            self.waiting.append(durable)
+            if self.sync_task is None:
+                self.sync_task = asyncio.async(self.sync_group(), loop=self.loop)
+        return durable
+
+    @asyncio.coroutine
+    def sync(self, futures: List[asyncio.Future], file):
+        """syncs the log the futures appended to, which has been closed if it was set aside and snapshotted since"""
+        if file is self.file:
+            yield from self.log_created
+        if not file.closed:
+            # fsync blocks until the disk is done, so it runs in a thread instead of stalling the event loop
+            yield from self.loop.run_in_executor(None, os.fsync, file.fileno())
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    @asyncio.coroutine
+    def sync_group(self):
+        if self.sync_window > 0:
+            yield from asyncio.sleep(self.sync_window, loop=self.loop)
+        # appends made while an fsync is running are synced by the next one
+        while len(self.waiting) > 0:
+            waiting, self.waiting = self.waiting, []
+            yield from self.sync(waiting, self.file)
+        self.sync_task = None
+
+    def needs_snapshot(self) -> bool:
+        return self.records >= self.snapshot_every and self.snapshot_task is None
+
+    def snapshot(self, store: Dict[str, Data]) -> asyncio.Future:
+        """
+        writes the data of every key of the store as the new snapshot, and returns a future which is done once it is
+        on disk. Only one snapshot is written at a time, and one asked for meanwhile is written after it
+        """
+        self.snapshot_store = store
+        if self.snapshot_task is None:
+            self.snapshot_task = asyncio.async(self.write_snapshots(), loop=self.loop)
+        return self.snapshot_task
+
+    @asyncio.coroutine
+    def write_snapshots(self):
+        try:
+            while self.snapshot_store is not None:
+                store, self.snapshot_store = self.snapshot_store, None
+                # the data is copied and the log set aside in one go, such that every record is either in the copy
+                # or appended to the new log
+                records = list(store.values())
+                os.replace(self.log_path, self.old_log_path)
+                self.old_file, self.file = self.file, open(self.log_path, 'ab')
+                self.records = 0
+                self.log_created = asyncio.async(
+                    self.loop.run_in_executor(None, fsync_directory, self.directory), loop=self.loop)
+                # the appends waiting for a sync of the old log are covered by the snapshot once it is on disk
+                covered, self.waiting = self.waiting, []
+                yield from self.loop.run_in_executor(None, self.write_snapshot, records)
+
+                self.old_file.close()
+                self.old_file = None
+                os.remove(self.old_log_path)
+                for future in covered:
+                    if not future.done():
+                        future.set_result(None)
+        finally:
+            self.snapshot_task = None
+
+    def write_snapshot(self, records: List[Data]):
+        """writes the data as the new snapshot, which blocks until it is on disk"""
+        temp_path = self.snapshot_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(b''.join(encode_record(data) for data in records))
+            f.flush()
+            os.fsync(f.fileno())
+        # renaming is atomic, so a crash leaves either the old or the new snapshot, and the old logs still apply
+        os.replace(temp_path, self.snapshot_path)
+        fsync_directory(self.directory)  # makes the rename itself durable
+
+    def close(self):
+        if self.sync_task is not None:
+            self.sync_task.cancel()
+        # a snapshot which is cut off leaves the old log behind, which is replayed by the next recovery
+        if self.snapshot_task is not None:
+            self.snapshot_task.cancel()
+        if self.old_file is not None:
+            self.old_file.close()
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+
+from DataRepClient import DataRepClient
+from DataRepMessages import Data
+from DataRepServer import DataRepNode
+from Registry import ServerInfo
+from Transport import LoopbackTransport
+import Topology
+
+
+class ClusterTestCase(unittest.TestCase):
+    """
+    a tree of DataRepNodes in this process, over the loopback transport, with a client writing to the first entries
+    of them. Every test case starts its own, on addresses of its own network
+    """
+    network = '10.100.0.%d'
+
+    def start(self, size: int = 9, entries: int = 1, serialize: bool = False, **options):
+        self.loop = asyncio.new_event_loop()
+        self.transport = LoopbackTransport(self.loop, serialize=serialize)
+        self.servers = [ServerInfo(self.network % i, 5000) for i in range(size)]
+        structures = Topology.network_structures(self.servers)
+        options = dict(dict(send_delay=0, heartbeat_interval=5.0, stand_ins=Topology.stand_ins(structures)),
+                       **options)
+        self.nodes = [DataRepNode(server, structure, self.loop, Data('lorem', 0), transport=self.transport, **options)
+                      for server, structure in zip(self.servers, structures)]
+        self.client = DataRepClient(self.servers[:entries], self.loop, timeout=5.0, transport=self.transport)
+
+    def tearDown(self):
+        if not hasattr(self, 'loop'):
+            return
+        self.client.close()
+        for node in self.nodes:
+            if node is not None:
+                node.kill()
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.loop.close()
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def kill(self, i: int):
+        """stops node i, which is left out when the tree is torn down"""
+        self.nodes[i].kill()
+        self.nodes[i] = None
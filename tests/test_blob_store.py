@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from BlobStore import BlobStore, BlobReceiver, BlobError, Blob, CHUNK_SIZE, CHUNK_HEADER
+
+
+def chunk_frames(store: BlobStore, blob: Blob, transfer_id: int = 1):
+    """the chunk frames a sender streams the blob in"""
+    frames = []
+    offset = 0
+    for chunk in store.chunks(blob):
+        frames.append(CHUNK_HEADER.pack(transfer_id, offset, blob.size, blob.digest) + bytes(chunk))
+        offset += len(chunk)
+    return frames or [CHUNK_HEADER.pack(transfer_id, 0, blob.size, blob.digest)]
+
+
+class BlobStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.sender = BlobStore()
+        self.receiver_store = BlobStore()
+        self.receiver = BlobReceiver(self.receiver_store)
+        self.content = os.urandom(3 * CHUNK_SIZE + 123)
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver_store.close()
+
+    def test_put_and_read(self):
+        blob = self.sender.put(self.content)
+        self.assertEqual(blob.size, len(self.content))
+        self.assertTrue(self.sender.has(blob))
+        self.assertEqual(self.sender.read(blob), self.content)
+        self.assertEqual(b''.join(bytes(chunk) for chunk in self.sender.chunks(blob)), self.content)
+        self.assertEqual(self.sender.put(self.content), blob)
+
+    def test_transfer(self):
+        blob = self.sender.put(self.content)
+        frames = chunk_frames(self.sender, blob)
+        self.assertEqual(len(frames), 4)
+        results = [self.receiver.receive(frame) for frame in frames]
+        self.assertEqual(results[:-1], [None] * 3)
+        self.assertEqual(results[-1], blob)
+        self.assertEqual(self.receiver_store.read(blob), self.content)
+        self.assertEqual(self.receiver.transfers, {})
+
+    def test_empty_blob(self):
+        blob = self.sender.put(b'')
+        self.assertEqual(self.receiver.receive(chunk_frames(self.sender, blob)[0]), blob)
+        self.assertEqual(self.receiver_store.read(blob), b'')
+
+    def test_interleaved_transfers(self):
+        one = self.sender.put(self.content)
+        other = self.sender.put(self.content[::-1])
+        done = []
+        for a, b in zip(chunk_frames(self.sender, one, 1), chunk_frames(self.sender, other, 2)):
+            done += [self.receiver.receive(a), self.receiver.receive(b)]
+        self.assertEqual([blob for blob in done if blob is not None], [one, other])
+
+    def test_corrupted_blob_is_rejected(self):
+        blob = self.sender.put(self.content)
+        frames = chunk_frames(self.sender, blob)
+        frames[1] = frames[1][:-1] + bytes([frames[1][-1] ^ 0xFF])
+        with self.assertRaises(BlobError):
+            for frame in frames:
+                self.receiver.receive(frame)
+        self.assertFalse(self.receiver_store.has(blob))
+
+    def test_chunk_out_of_order_is_rejected(self):
+        blob = self.sender.put(self.content)
+        frames = chunk_frames(self.sender, blob)
+        self.receiver.receive(frames[0])
+        with self.assertRaises(BlobError):
+            self.receiver.receive(frames[2])
+        self.assertEqual(self.receiver.transfers, {})
+
+    def test_oversized_blob_is_rejected(self):
+        blob = self.sender.put(self.content)
+        frame = CHUNK_HEADER.pack(1, 0, 10, blob.digest) + self.content[:20]
+        with self.assertRaises(BlobError):
+            self.receiver.receive(frame)
+        self.assertEqual(self.receiver.transfers, {})
+        self.assertEqual([name for name in os.listdir(self.receiver_store.directory)], [])
+
+    def test_abort_removes_the_partial_files(self):
+        blob = self.sender.put(self.content)
+        self.receiver.receive(chunk_frames(self.sender, blob)[0])
+        self.receiver.abort()
+        self.assertEqual(os.listdir(self.receiver_store.directory), [])
+
+
+class BlobDirectoryTest(unittest.TestCase):
+    def test_temporary_directory_is_created_lazily_and_removed(self):
+        store = BlobStore()
+        self.assertIsNone(store.directory)
+        self.assertFalse(store.has(Blob(b'\x00' * 32, 0)))
+        store.put(b'content')
+        directory = store.directory
+        self.assertTrue(os.path.isdir(directory))
+        store.close()
+        self.assertFalse(os.path.exists(directory))
+
+    def test_given_directory_is_kept(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = BlobStore(directory)
+            blob = store.put(b'content')
+            store.close()
+            self.assertTrue(BlobStore(directory).has(blob))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
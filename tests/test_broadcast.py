@@ -0,0 +1,69 @@
+import random
+import unittest
+from collections import Counter
+
+from Broadcast import Broadcaster
+from Gossip import Membership
+from Registry import ServerInfo
+
+
+def broadcasters(count: int, mode: str, fanout: int = 3):
+    infos = [ServerInfo('10.4.0.1', 5000 + i) for i in range(count)]
+    return infos, {info: Broadcaster(Membership(info, infos, rng=random.Random(i)), mode, fanout,
+                                     rng=random.Random(i)) for i, info in enumerate(infos)}
+
+
+def spread(nodes: dict, origin: ServerInfo) -> Counter:
+    """relays a message from the origin like SimpleServer does, and returns the number of copies every server got"""
+    received = Counter()
+    msg_id = nodes[origin].originate()
+    queue = [(origin, target) for target in nodes[origin].targets(origin, origin)]
+    while len(queue) > 0:
+        sender, recipient = queue.pop()
+        received[recipient] += 1
+        if nodes[recipient].first_time(msg_id, 1):
+            queue += [(recipient, target) for target in nodes[recipient].targets(origin, sender)]
+    return received
+
+
+class BroadcasterTest(unittest.TestCase):
+    def test_tree_reaches_every_server_exactly_once(self):
+        for count in [1, 2, 3, 4, 13, 100]:
+            infos, nodes = broadcasters(count, 'tree')
+            for origin in [infos[0], infos[count // 2]]:
+                received = spread(nodes, origin)
+                self.assertEqual(received, Counter({info: 1 for info in infos if info != origin}))
+
+    def test_tree_from_the_module_docstring(self):
+        infos, nodes = broadcasters(13, 'tree')
+        self.assertEqual(nodes[infos[4]].children(infos[4]), infos[5:8])
+        self.assertEqual(nodes[infos[6]].children(infos[4]), [infos[11], infos[12], infos[0]])
+
+    def test_copies_are_bounded_by_the_fanout(self):
+        infos, nodes = broadcasters(50, 'epidemic')
+        for node in nodes.values():
+            self.assertLessEqual(len(node.targets(infos[0], infos[1])), 3)
+
+    def test_direct_is_only_sent_by_the_origin(self):
+        infos, nodes = broadcasters(10, 'direct')
+        self.assertEqual(len(nodes[infos[0]].targets(infos[0], infos[0])), 9)
+        self.assertEqual(nodes[infos[1]].targets(infos[0], infos[0]), [])
+
+    def test_duplicates_are_dropped_until_forgotten(self):
+        infos, nodes = broadcasters(1, 'tree')
+        node = nodes[infos[0]]
+        node.remember = 2
+        self.assertTrue(node.first_time(1))
+        self.assertFalse(node.first_time(1))
+        node.first_time(2)
+        node.first_time(3)
+        self.assertTrue(node.first_time(1))
+        self.assertEqual(node.duplicates, 1)
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            broadcasters(1, 'flood')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import asyncio
+import unittest
+
+from CatchUp import TokenBucket, SnapshotReader, entry_pages, snapshot_pages
+from DataRepCodec import CodecError
+from DataRepMessages import Data
+
+
+def make_store(count: int):
+    return [Data(content='value %d ' % i * 20, version_number=i, key='key %d' % i) for i in range(count)]
+
+
+class TokenBucketTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def elapsed(self, bucket: TokenBucket, *amounts: int) -> float:
+        start = self.loop.time()
+        for amount in amounts:
+            self.loop.run_until_complete(bucket.take(amount))
+        return self.loop.time() - start
+
+    # the expected waits are lower bounds, and the upper bounds are loose, since a busy machine runs the loop late
+    def test_burst_is_not_delayed(self):
+        self.assertLess(self.elapsed(TokenBucket(1000, 1000, self.loop), 500, 500), 0.5)
+
+    def test_debt_is_waited_for(self):
+        # 100 bytes beyond the burst at 1000 bytes per second
+        self.assertGreaterEqual(self.elapsed(TokenBucket(1000, 1000, self.loop), 600, 500), 0.09)
+
+    def test_page_larger_than_the_bucket_is_not_stuck(self):
+        # 900 bytes of debt at 10000 bytes per second
+        elapsed = self.elapsed(TokenBucket(10000, 100, self.loop), 1000)
+        self.assertGreaterEqual(elapsed, 0.09)
+        self.assertLess(elapsed, 1.0)
+
+    def test_no_rate_means_no_limit(self):
+        self.assertLess(self.elapsed(TokenBucket(0, 0, self.loop), 10 ** 9, 10 ** 9), 0.5)
+
+
+class PagesTest(unittest.TestCase):
+    def test_entry_pages(self):
+        store = make_store(100)
+        pages = list(entry_pages(store, 1000))
+        self.assertGreater(len(pages), 1)
+        self.assertEqual([last for _, last in pages], [False] * (len(pages) - 1) + [True])
+        self.assertEqual([data for page, _ in pages for data in page], store)
+
+    def test_no_entries_make_one_empty_page(self):
+        self.assertEqual(list(entry_pages([], 1000)), [([], True)])
+
+    def test_snapshot_round_trip(self):
+        store = make_store(2000)
+        pages = list(snapshot_pages(store, 1024))
+        self.assertGreater(len(pages), 1)
+        self.assertEqual([data for _, fed, _ in pages for data in fed], store)
+        reader = SnapshotReader()
+        received = [data for page, _, _ in pages for data in reader.feed(page)]
+        self.assertTrue(reader.finished())
+        self.assertEqual([(d.key, d.content, d.version_number) for d in received],
+                         [(d.key, d.content, d.version_number) for d in store])
+
+    def test_cut_off_snapshot_is_not_finished(self):
+        pages = list(snapshot_pages(make_store(2000), 1024))
+        reader = SnapshotReader()
+        for page, _, _ in pages[:-1]:
+            reader.feed(page)
+        self.assertFalse(reader.finished())
+
+    def test_corrupted_snapshot_is_detected(self):
+        pages = [bytearray(page) for page, _, _ in snapshot_pages(make_store(2000), 1024)]
+        pages[1][len(pages[1]) // 2] ^= 0xFF
+        reader = SnapshotReader()
+        try:
+            for page in pages:
+                reader.feed(bytes(page))
+        except CodecError:
+            return
+        self.assertFalse(reader.finished())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+import DataRepCodec
+from DataRepCodec import CodecError
+from DataRepMessages import *
+
+
+def fields(msg) -> dict:
+    """the attributes of a message, with the data and refs in it turned into comparable tuples"""
+    def plain(value):
+        if isinstance(value, Data):
+            blob = None if value.blob is None else (value.blob.digest, value.blob.size)
+            return value.key, value.content, value.version_number, blob
+        if isinstance(value, DataRef):
+            return value.key, value.version_number, value.digest
+        if isinstance(value, list):
+            return [plain(v) for v in value]
+        return value
+    slots = [name for cls in type(msg).__mro__ for name in getattr(cls, '__slots__', ())]
+    return {name: plain(getattr(msg, name)) for name in slots}
+
+
+class CodecTest(unittest.TestCase):
+    def setUp(self):
+        self.sender = ServerInfo('10.0.0.1', 8001)
+        self.data = Data(content='content ø', version_number=42, key='kéy')
+        self.blob_data = Data(content='', version_number=43, blob=Blob(b'\x01' * 32, 1 << 40), key='large')
+        self.messages = [
+            ClientDataMessage(self.sender, self.data),
+            ClientDataResponse(self.sender, 42, True),
+            QuorumRequest(self.sender, [DataRef.of(self.data), DataRef.of(self.blob_data)], 2, 1 << 63),
+            QuorumResponse(self.sender, False, 1, 7, holds_data=True),
+            WriteDataRequest(self.sender, 42, 1, 7, log_id=9, seq=3, batch=[self.data, self.blob_data]),
+            WriteDataRequest(self.sender, 42, 1, 7),
+            ClientReadMessage(self.sender, 'kéy'),
+            ClientReadResponse(self.sender, None),
+            ClientReadResponse(self.sender, self.blob_data),
+            QuorumReadRequest(self.sender, 0, 5, 'key'),
+            QuorumReadResponse(self.sender, 0, 5, self.data),
+            DataFetchRequest(self.sender, 7),
+            DataFetchResponse(self.sender, 7, [self.data]),
+            StatsRequest(self.sender),
+            StatsResponse(self.sender, 'x' * 100000),
+            Heartbeat(self.sender),
+            CatchUpRequest(self.sender, 'partition', 9, 12, 1 << 40, 3),
+            CatchUpResponse(self.sender, 1 << 40, 3, 9, 12, [self.data], b'\x00snapshot', True, False),
+        ]
+
+    def test_round_trip(self):
+        for msg in self.messages:
+            tag, payload = DataRepCodec.encode(msg)
+            decoded = DataRepCodec.decode(tag, payload)
+            self.assertIs(type(decoded), type(msg))
+            self.assertEqual(fields(decoded), fields(msg))
+
+    def test_sender_is_the_interned_server_info(self):
+        tag, payload = DataRepCodec.encode(Heartbeat(self.sender))
+        self.assertIs(DataRepCodec.decode(tag, payload).sender, self.sender)
+
+    def test_every_message_type_has_a_schema(self):
+        for cls in MESSAGE_TAGS:
+            self.assertIn(cls, DataRepCodec.SCHEMAS)
+
+    def test_truncated_payload_is_rejected(self):
+        for msg in self.messages:
+            tag, payload = DataRepCodec.encode(msg)
+            for end in range(len(payload)):
+                with self.assertRaises(CodecError, msg=(type(msg).__name__, end)):
+                    DataRepCodec.decode(tag, payload[:end])
+
+    def test_trailing_bytes_are_rejected(self):
+        tag, payload = DataRepCodec.encode(ClientDataMessage(self.sender, self.data))
+        with self.assertRaises(CodecError):
+            DataRepCodec.decode(tag, payload + b'\x00')
+
+    def test_invalid_utf8_is_rejected(self):
+        tag, payload = DataRepCodec.encode(ClientReadMessage(self.sender, 'ab'))
+        with self.assertRaises(CodecError):
+            DataRepCodec.decode(tag, payload[:-2] + b'\xff\xfe')
+
+    def test_unknown_tag_is_rejected(self):
+        unknown = max(MESSAGE_TAGS.values()) + 1
+        with self.assertRaises(CodecError):
+            DataRepCodec.decode(unknown, b'')
+
+    def test_codec_error_is_a_value_error(self):
+        self.assertTrue(issubclass(CodecError, ValueError))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+
+from ConnectionPool import ConnectionPool
+from Registry import ServerInfo
+from Transport import LoopbackTransport
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.transport = LoopbackTransport(self.loop)
+        self.local = ServerInfo('10.5.0.1', 6000)
+        self.peers = [ServerInfo('10.5.0.2', 6000 + i) for i in range(3)]
+        self.received = []
+        self.servers = [self.loop.run_until_complete(self.transport.serve(peer, self.answer)) for peer in self.peers]
+        self.pool = ConnectionPool(self.loop, lambda conn, frame: None, max_connections=2, idle_timeout=1.0,
+                                   transport=self.transport, local=self.local)
+
+    def tearDown(self):
+        self.pool.close()
+        for server in self.servers:
+            server.close()
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.loop.close()
+
+    def answer(self, conn, frame):
+        self.received.append(frame.payload)
+        if frame.flags != 0:
+            conn.reply(frame, frame.tag, frame.payload.upper())
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def test_connection_is_reused(self):
+        one = self.wait(self.pool.connection_to(self.peers[0]))
+        self.assertIs(self.wait(self.pool.connection_to(self.peers[0])), one)
+        self.assertIs(self.pool.open_connection(self.peers[0]), one)
+        self.assertIsNone(self.pool.open_connection(self.peers[1]))
+
+    def test_concurrent_senders_share_one_connection(self):
+        conns = self.wait(asyncio.gather(*[self.pool.connection_to(self.peers[0]) for i in range(5)], loop=self.loop))
+        self.assertEqual(len(set(map(id, conns))), 1)
+        self.assertEqual(len(self.servers[0].connections), 1)
+
+    def test_least_recently_used_is_closed_to_make_room(self):
+        first = self.wait(self.pool.connection_to(self.peers[0]))
+        self.wait(self.pool.connection_to(self.peers[1]))
+        self.wait(self.pool.connection_to(self.peers[0]))
+        self.wait(self.pool.connection_to(self.peers[2]))
+        self.assertEqual(list(self.pool.connections), [self.peers[0], self.peers[2]])
+        self.assertFalse(first.is_closed())
+
+    def test_closed_connection_is_replaced(self):
+        one = self.wait(self.pool.connection_to(self.peers[0]))
+        one.close()
+        other = self.wait(self.pool.connection_to(self.peers[0]))
+        self.assertIsNot(other, one)
+        self.wait(self.pool.send(self.peers[0], 1, b'again'))
+        self.wait(asyncio.sleep(0.01, loop=self.loop))
+        self.assertEqual(self.received, [b'again'])
+
+    def test_request(self):
+        response = self.wait(self.pool.request(self.peers[1], 1, b'ping', timeout=1.0))
+        self.assertEqual(response.payload, b'PING')
+
+    def test_idle_connections_are_evicted(self):
+        self.wait(self.pool.connection_to(self.peers[0]))
+        self.wait(asyncio.sleep(1.6, loop=self.loop))
+        self.assertEqual(len(self.pool.connections), 0)
+
+    def test_locks_go_with_their_connections(self):
+        lock = None
+        for i in range(3):
+            self.wait(self.pool.connection_to(self.peers[0]))
+            lock = lock or self.pool.locks[self.peers[0]]
+            self.assertIs(self.pool.locks[self.peers[0]], lock)
+        self.wait(self.pool.connection_to(self.peers[1]))
+        self.wait(self.pool.connection_to(self.peers[2]))
+        # the connection to the first peer made room for the last one
+        self.assertEqual(set(self.pool.locks), {self.peers[1], self.peers[2]})
+        self.pool.drop(self.peers[1])
+        self.assertEqual(set(self.pool.locks), {self.peers[2]})
+
+    def test_lock_of_an_unreachable_peer_is_evicted(self):
+        gone = ServerInfo('10.5.0.9', 6000)
+        with self.assertRaises(ConnectionError):
+            self.wait(self.pool.connection_to(gone))
+        self.assertIn(gone, self.pool.locks)
+        self.wait(asyncio.sleep(1.1, loop=self.loop))
+        self.assertNotIn(gone, self.pool.locks)
+
+    def test_closed_pool_refuses(self):
+        self.pool.close()
+        with self.assertRaises(ConnectionError):
+            self.wait(self.pool.connection_to(self.peers[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from DataDigest import DataDigest
+
+
+class DataDigestTest(unittest.TestCase):
+    def setUp(self):
+        self.data = {'key %d' % i: 'value %d' % i for i in range(1000)}
+
+    def test_same_data_same_digest(self):
+        one = DataDigest.of(self.data)
+        other = DataDigest.of(dict(reversed(list(self.data.items()))))
+        self.assertEqual(one.root, other.root)
+        self.assertEqual(one.differing_buckets(other.root, other.buckets), [])
+
+    def test_differing_buckets_hold_the_differing_keys(self):
+        mine = DataDigest.of(self.data)
+        other = dict(self.data)
+        other['key 7'] = 'changed'
+        other['new key'] = 'new'
+        theirs = DataDigest.of(other)
+        buckets = mine.differing_buckets(theirs.root, theirs.buckets)
+        self.assertEqual(len(buckets), 2)
+        self.assertIn('key 7', mine.keys_in(buckets))
+        self.assertIn('new key', theirs.keys_in(buckets))
+
+    def test_put_keeps_the_digest_up_to_date(self):
+        digest = DataDigest.of(self.data)
+        digest.put('key 7', 'changed', 'value 7', replaced=True)
+        digest.put('new key', 'new')
+        changed = dict(self.data)
+        changed['key 7'] = 'changed'
+        changed['new key'] = 'new'
+        expected = DataDigest.of(changed)
+        self.assertEqual((digest.root, digest.buckets), (expected.root, expected.buckets))
+
+    def test_remove_undoes_put(self):
+        digest = DataDigest.of(self.data)
+        root = digest.root
+        digest.put('new key', 'new')
+        digest.remove('new key', 'new')
+        self.assertEqual(digest.root, root)
+        self.assertNotIn('new key', digest.keys_in(range(len(digest.buckets))))
+
+    def test_digests_of_different_sizes_can_not_be_compared(self):
+        with self.assertRaises(ValueError):
+            DataDigest(16).differing_buckets(1, [0] * 32)
+
+
+if __name__ == '__main__':
+    unittest.main()
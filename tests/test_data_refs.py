@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+
+from DataRepMessages import Data, DataRef
+from tests.cluster import ClusterTestCase
+
+
+class DataRefTest(unittest.TestCase):
+    def test_refers_to(self):
+        data = Data('hello', 7, key='k')
+        ref = DataRef.of(data)
+        self.assertTrue(ref.refers_to(data))
+        self.assertTrue(ref.refers_to(Data('hello', 7, key='k')))
+        self.assertFalse(ref.refers_to(Data('hellO', 7, key='k')))
+        self.assertFalse(ref.refers_to(Data('hello', 8, key='k')))
+        self.assertFalse(ref.refers_to(Data('hello', 7, key='other')))
+        self.assertFalse(ref.refers_to(None))
+
+
+class VotesTest(ClusterTestCase):
+    """the content of a write crosses the network once per replica, on the commit path, and never with the votes"""
+    network = '10.8.0.%d'
+
+    def setUp(self):
+        self.start(serialize=True)
+
+    def received(self, kind: str):
+        return (sum(node.metrics.messages_in.get(kind, 0) for node in self.nodes),
+                sum(node.metrics.bytes_in.get(kind, 0) for node in self.nodes))
+
+    def test_content_only_crosses_with_the_write_requests(self):
+        content = 'x' * 10000
+        self.assertTrue(self.wait(self.client.write(content, key='k')))
+        self.wait(asyncio.sleep(0.1, loop=self.loop))
+        for node in self.nodes:
+            self.assertEqual(node.store['k'].content, content)
+
+        requests, request_bytes = self.received('QuorumRequest')
+        self.assertGreater(requests, 0)
+        self.assertLess(request_bytes, len(content))
+        writes, write_bytes = self.received('WriteDataRequest')
+        # every node but the one the client wrote to gets the content once
+        self.assertEqual(writes, len(self.nodes) - 1)
+        self.assertLess(write_bytes, len(self.nodes) * (len(content) + 200))
+
+    def test_held_batch(self):
+        node = self.nodes[0]
+        data = Data('held', 3, key='k')
+        node.store['k'] = data
+        self.assertEqual(node.held_batch([DataRef.of(data)]), [data])
+        self.assertIsNone(node.held_batch([DataRef.of(Data('newer', 4, key='k'))]))
+        self.assertIsNone(node.held_batch([DataRef.of(Data('other', 1, key='other'))]))
+
+
+if __name__ == '__main__':
+    unittest.main()
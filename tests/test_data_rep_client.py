@@ -0,0 +1,98 @@
+import asyncio
+import os
+import unittest
+
+from BlobStore import BlobStore, CHUNK_SIZE
+from DataRepClient import DataRepClient, NoEntryNode
+from DataRepMessages import BLOB_CHUNK_TAG
+from Framing import Frame
+from Registry import ServerInfo
+from Transport import LoopbackTransport
+from tests.cluster import ClusterTestCase
+from tests.test_blob_store import chunk_frames
+
+
+class PickTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.nodes = [ServerInfo('10.9.0.%d' % i, 5000) for i in range(3)]
+        self.client = DataRepClient(self.nodes, self.loop, transport=LoopbackTransport(self.loop))
+
+    def tearDown(self):
+        self.client.close()
+        self.loop.close()
+
+    def test_needs_a_node(self):
+        with self.assertRaises(ValueError):
+            DataRepClient([], self.loop)
+
+    def test_takes_turns(self):
+        self.assertEqual({self.client.pick([]) for _ in range(3)}, set(self.nodes))
+
+    def test_fewest_in_flight(self):
+        self.client.in_flight[self.nodes[0]] = 2
+        self.client.in_flight[self.nodes[1]] = 1
+        self.assertEqual(self.client.pick([]), self.nodes[2])
+        self.assertEqual(self.client.pick([self.nodes[2]]), self.nodes[1])
+        self.assertIsNone(self.client.pick(self.nodes))
+
+    def test_leaves_out_nodes_which_are_down(self):
+        self.client.down_until[self.nodes[0]] = self.loop.time() + 10.0
+        self.client.down_until[self.nodes[1]] = self.loop.time() + 10.0
+        self.assertEqual(self.client.pick([]), self.nodes[2])
+        # when every node seems to be down, the ones not tried yet get another chance
+        self.assertIn(self.client.pick([self.nodes[2]]), self.nodes[:2])
+
+
+class RequestTest(ClusterTestCase):
+    network = '10.9.1.%d'
+
+    def setUp(self):
+        self.start(size=3)
+
+    def test_tries_the_next_node(self):
+        gone = ServerInfo('10.9.2.1', 5000)
+        client = DataRepClient([gone] + self.servers[:1], self.loop, transport=self.transport)
+        for i in range(3):
+            self.assertTrue(self.wait(client.write('v%d' % i, key='k')))
+        self.assertIn(gone, client.down_until)
+        self.assertEqual(self.wait(client.read('k')).content, 'v2')
+        client.close()
+
+    def test_no_entry_node(self):
+        client = DataRepClient([ServerInfo('10.9.2.%d' % i, 5000) for i in range(2)], self.loop,
+                               transport=self.transport)
+        with self.assertRaises(NoEntryNode):
+            self.wait(client.write('lost', key='k'))
+        client.close()
+
+    def test_pipelined_on_one_connection(self):
+        client = DataRepClient(self.servers[:1], self.loop, max_in_flight=4, transport=self.transport)
+        writes = [client.write('v%d' % i, key='k%d' % i) for i in range(20)]
+        self.assertTrue(all(self.wait(asyncio.gather(*writes, loop=self.loop))))
+        self.assertEqual(len(client.pool.connections), 1)
+        self.assertEqual(client.in_flight[self.servers[0]], 0)
+        client.close()
+
+    def test_versions_increase(self):
+        self.wait(self.client.write('first', key='k'))
+        first = self.client.last_version
+        self.wait(self.client.write('second', key='k'))
+        self.assertGreater(self.client.last_version, first)
+        self.assertEqual(self.wait(self.client.read('k')).content, 'second')
+
+    def test_receiver_goes_with_its_connection(self):
+        self.wait(self.client.write('first', key='k'))
+        conn = self.client.pool.connections[self.servers[0]]
+        store = BlobStore()
+        frames = chunk_frames(store, store.put(os.urandom(2 * CHUNK_SIZE)))
+        # the connection closes half way through the blob
+        self.client.handle_frame(conn, Frame(BLOB_CHUNK_TAG, frames[0]))
+        self.assertIn(conn, self.client.receivers)
+        conn.close()
+        self.assertEqual(self.client.receivers, {})
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
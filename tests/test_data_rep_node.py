@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+
+from DataRepMessages import Data, DataRef
+from DataRepServer import WriteRound
+from tests.cluster import ClusterTestCase
+
+
+class DataRepNodeTest(ClusterTestCase):
+    """a tree of nine nodes, where the client writes to the first three"""
+    network = '10.6.0.%d'
+
+    def setUp(self):
+        self.start(entries=3, level_timeout=0.5, heartbeat_interval=0.2)
+
+    def test_write_then_read(self):
+        self.assertTrue(self.wait(self.client.write('hello', key='greeting')))
+        data = self.wait(self.client.read('greeting'))
+        self.assertEqual(data.content, 'hello')
+        self.assertIsNone(self.wait(self.client.read('nothing')))
+
+    def test_newer_version_wins(self):
+        self.assertTrue(self.wait(self.client.write('new', key='k', version=20)))
+        self.wait(self.client.write('old', key='k', version=10))
+        data = self.wait(self.client.read('k'))
+        self.assertEqual((data.content, data.version_number), ('new', 20))
+
+    def test_stale_reads_are_off_by_default(self):
+        self.assertTrue(self.wait(self.client.write('new', key='k')))
+        self.assertTrue(any(len(node.fresh_until) > 0 for node in self.nodes))
+        self.assertFalse(any(node.stale_reads for node in self.nodes))
+
+    def test_concurrent_writes_are_all_accepted(self):
+        # gather starts the writes in any order, so they get their versions up front
+        writes = [self.client.write('value %d' % i, key='key %d' % (i % 4), version=i + 1) for i in range(40)]
+        accepted = self.wait(asyncio.gather(*writes, loop=self.loop))
+        self.assertTrue(all(accepted))
+        for i in range(36, 40):
+            self.assertEqual(self.wait(self.client.read('key %d' % (i % 4))).content, 'value %d' % i)
+
+    def test_read_is_held_back_by_a_voted_write(self):
+        node = self.nodes[4]
+        write_round = WriteRound(1, [DataRef('k', 5, b'')], node.network_structure, self.loop.time())
+        node.rounds[1] = write_round
+        self.assertFalse(node.hold_read(None, None, 'k'))
+        write_round.voted = True
+        self.assertTrue(node.hold_read(None, None, 'k'))
+        self.assertFalse(node.hold_read(None, None, 'other'))
+        self.assertEqual(node.held_reads, {1: [(None, None)]})
+        # once the write has reached the node, its data is as new as what it voted for
+        node.store['k'] = Data('new', 5, key='k')
+        self.assertFalse(node.hold_read(None, None, 'k'))
+        del node.rounds[1]
+        node.held_reads.clear()
+
+    def test_commits_with_a_node_down(self):
+        self.kill(len(self.nodes) - 1)
+        # lets the heartbeats notice the node is gone
+        self.wait(asyncio.sleep(1.0, loop=self.loop))
+        self.assertTrue(self.wait(self.client.write('still', key='k')))
+        self.assertEqual(self.wait(self.client.read('k')).content, 'still')
+
+    def test_stats_count_the_writes(self):
+        for i in range(3):
+            self.assertTrue(self.wait(self.client.write('counted %d' % i, key='k%d' % i)))
+        entries = [self.wait(self.client.stats(server)) for server in self.client.nodes]
+        # every write reached one of the entry nodes, and was committed in a round of its own
+        self.assertEqual(sum(stats['messages_in'].get('ClientDataMessage', 0) for stats in entries), 3)
+        self.assertEqual(sum(stats['seconds'].get('commit', {}).get('count', 0) for stats in entries), 3)
+        self.assertEqual(sum(stats['messages_out'].get('ClientDataResponse', 0) for stats in entries), 3)
+        self.assertEqual([stats['node'] for stats in entries], [str(server) for server in self.client.nodes])
+        self.assertEqual(entries[0]['rounds'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
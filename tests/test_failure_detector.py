@@ -0,0 +1,54 @@
+import unittest
+
+from FailureDetector import FailureDetector
+
+
+class FailureDetectorTest(unittest.TestCase):
+    def setUp(self):
+        self.detector = FailureDetector(interval=0.5, threshold=8.0)
+
+    def test_unknown_peer_is_not_suspected(self):
+        self.assertEqual(self.detector.phi('a', 100.0), 0.0)
+        self.assertFalse(self.detector.suspected('a', 100.0))
+
+    def test_regular_peer_is_not_suspected(self):
+        for i in range(20):
+            self.detector.heard('a', i * 0.5)
+        self.assertFalse(self.detector.suspected('a', 10.0))
+
+    def test_silent_peer_is_suspected(self):
+        for i in range(20):
+            self.detector.heard('a', i * 0.5)
+        self.assertTrue(self.detector.suspected('a', 20.0))
+
+    def test_peer_which_never_answers_is_suspected(self):
+        self.detector.watch('a', 0.0)
+        self.assertIsNone(self.detector.last_heard('a'))
+        self.assertFalse(self.detector.suspected('a', 0.5))
+        self.assertTrue(self.detector.suspected('a', 10.0))
+
+    def test_watching_again_does_not_reset_the_silence(self):
+        self.detector.watch('a', 0.0)
+        self.detector.watch('a', 9.0)
+        self.assertTrue(self.detector.suspected('a', 10.0))
+
+    def test_first_answer_clears_the_suspicion(self):
+        self.detector.watch('a', 0.0)
+        self.detector.heard('a', 10.0)
+        self.assertEqual(self.detector.last_heard('a'), 10.0)
+        self.assertFalse(self.detector.suspected('a', 10.5))
+
+    def test_phi_grows_with_silence(self):
+        for i in range(20):
+            self.detector.heard('a', i * 0.5)
+        phis = [self.detector.phi('a', 9.5 + t) for t in [0.5, 1.0, 1.5, 2.0]]
+        self.assertEqual(phis, sorted(phis))
+
+    def test_forget(self):
+        self.detector.watch('a', 0.0)
+        self.detector.forget('a')
+        self.assertFalse(self.detector.suspected('a', 10.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
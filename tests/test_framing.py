@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+
+from Framing import FramedConnection, Frame, FRAME_HEADER, FLAG_REQUEST, FLAG_RESPONSE, read_frame, payload_size
+
+
+class ReadFrameTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.reader = asyncio.StreamReader(loop=self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def read(self) -> Frame:
+        return self.loop.run_until_complete(read_frame(self.reader))
+
+    def test_round_trip(self):
+        self.reader.feed_data(Frame(7, b'payload', FLAG_REQUEST, 42).encode())
+        frame = self.read()
+        self.assertEqual((frame.tag, frame.payload, frame.flags, frame.correlation_id), (7, b'payload', FLAG_REQUEST, 42))
+
+    def test_frames_follow_each_other_on_one_stream(self):
+        encoded = Frame(1, b'first').encode() + Frame(2, b'').encode() + Frame(3, b'third').encode()
+        # the stream may be cut anywhere, even inside a header
+        for i in range(0, len(encoded), 3):
+            self.reader.feed_data(encoded[i:i + 3])
+        self.assertEqual([(f.tag, f.payload) for f in [self.read(), self.read(), self.read()]],
+                         [(1, b'first'), (2, b''), (3, b'third')])
+
+    def test_truncated_frame_ends_the_stream(self):
+        self.reader.feed_data(Frame(1, b'payload').encode()[:FRAME_HEADER.size + 3])
+        self.reader.feed_eof()
+        self.assertIsNone(self.read())
+
+    def test_payload_size(self):
+        self.assertEqual(payload_size(b'abc'), 3)
+        self.assertEqual(payload_size(memoryview(b'abcd')), 4)
+        self.assertEqual(payload_size(object()), 0)
+
+
+class FramedConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.requests = []  # type: list
+        self.server_conns = []
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.accept, '127.0.0.1', 0, loop=self.loop))
+        port = self.server.sockets[0].getsockname()[1]
+        reader, writer = self.loop.run_until_complete(asyncio.open_connection('127.0.0.1', port, loop=self.loop))
+        self.conn = FramedConnection(reader, writer, self.loop, lambda conn, frame: None)
+
+    def tearDown(self):
+        self.conn.close()
+        for conn in self.server_conns:
+            conn.close()
+        self.server.close()
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.loop.close()
+
+    def accept(self, reader, writer):
+        self.server_conns.append(FramedConnection(reader, writer, self.loop,
+                                                  lambda conn, frame: self.requests.append((conn, frame))))
+
+    def wait(self, coro):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, 1.0, loop=self.loop))
+
+    @asyncio.coroutine
+    def answer_in_reverse(self, count: int):
+        while len(self.requests) < count:
+            yield from asyncio.sleep(0.001, loop=self.loop)
+        for conn, frame in reversed(self.requests):
+            conn.reply(frame, frame.tag, frame.payload.upper())
+
+    def test_responses_are_matched_to_their_requests(self):
+        requests = [self.conn.request(1, word) for word in [b'one', b'two', b'three']]
+        responses, _ = self.wait(asyncio.gather(asyncio.gather(*requests, loop=self.loop), self.answer_in_reverse(3),
+                                               loop=self.loop))
+        self.assertEqual([r.payload for r in responses], [b'ONE', b'TWO', b'THREE'])
+        self.assertTrue(all(r.flags == FLAG_RESPONSE for r in responses))
+        self.assertEqual(self.conn.pending, {})
+
+    def test_request_times_out(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            self.wait(self.conn.request(1, b'unanswered', timeout=0.01))
+        self.assertEqual(self.conn.pending, {})
+
+    def test_close_fails_pending_requests(self):
+        request = asyncio.async(self.conn.request(1, b'unanswered'), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.conn.close()
+        with self.assertRaises(ConnectionError):
+            self.wait(request)
+
+    def test_close_callbacks_run_once_when_the_other_end_closes(self):
+        closed = []
+        self.conn.add_close_callback(closed.append)
+        while len(self.server_conns) == 0:
+            self.loop.run_until_complete(asyncio.sleep(0.001, loop=self.loop))
+        self.server_conns[0].close()
+        self.wait(self.conn.reader_task)
+        self.conn.close()
+        self.assertEqual(closed, [self.conn])
+
+
+if __name__ == '__main__':
+    unittest.main()
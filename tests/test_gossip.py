@@ -0,0 +1,67 @@
+import random
+import unittest
+
+from Gossip import Membership
+from GossipBenchmark import simulate
+from Registry import ServerInfo
+
+
+def servers(count: int):
+    return [ServerInfo('10.2.%d.%d' % (i // 256, i % 256), 5000) for i in range(count)]
+
+
+class MembershipTest(unittest.TestCase):
+    def setUp(self):
+        self.infos = servers(20)
+        self.membership = Membership(self.infos[0], self.infos[1:5], rng=random.Random(1))
+
+    def test_merge_returns_the_news(self):
+        news = self.membership.merge([(self.infos[1], 0), (self.infos[10], 0), (self.infos[2], 1)])
+        self.assertEqual(news, [self.infos[10], self.infos[2]])
+        self.assertEqual(len(self.membership), 6)
+
+    def test_older_incarnation_is_ignored(self):
+        self.membership.merge([(self.infos[2], 3)])
+        self.assertEqual(self.membership.merge([(self.infos[2], 2)]), [])
+        self.assertEqual(self.membership.incarnations[self.infos[2]], 3)
+
+    def test_rumors_stop_after_the_retransmit_limit(self):
+        rounds = 0
+        while len(self.membership.next_delta()) > 0:
+            rounds += 1
+        self.assertEqual(rounds, self.membership.retransmit_limit())
+
+    def test_delta_is_capped_and_freshest_first(self):
+        membership = Membership(self.infos[0], self.infos[1:], max_delta=5)
+        membership.next_delta()
+        membership.merge([(ServerInfo('10.3.0.1', 5000), 0)])
+        delta = membership.next_delta()
+        self.assertEqual(len(delta), 5)
+        self.assertIn((ServerInfo('10.3.0.1', 5000), 0), delta)
+
+    def test_rejoin_bumps_the_incarnation(self):
+        self.membership.rejoin()
+        self.assertIn((self.infos[0], 1), self.membership.next_delta())
+
+    def test_targets_exclude_us(self):
+        for i in range(20):
+            targets = self.membership.targets()
+            self.assertEqual(len(set(targets)), 3)
+            self.assertNotIn(self.infos[0], targets)
+
+    def test_sample_of_a_large_table(self):
+        membership = Membership(self.infos[0], servers(1000), rng=random.Random(2))
+        sample = membership.sample(5, {self.infos[0]})
+        self.assertEqual(len(set(sample)), 5)
+
+
+class SpreadTest(unittest.TestCase):
+    def test_everyone_learns_everyone(self):
+        # simulate only returns once every member knows all members
+        rounds, messages, _ = simulate(100, 3, seed=7)
+        self.assertLess(rounds, 40)
+        self.assertLess(messages, 100 * 3 * rounds + 100 * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import asyncio
+import unittest
+
+from tests.cluster import ClusterTestCase
+
+
+class GroupCommitTest(ClusterTestCase):
+    network = '10.10.0.%d'
+
+    def write_all(self, count: int) -> list:
+        writes = [self.client.write('v%d' % i, key='k%d' % i) for i in range(count)]
+        return self.wait(asyncio.gather(*writes, loop=self.loop))
+
+    def rounds_committed(self) -> int:
+        return self.nodes[0].metrics.histograms['commit'].count
+
+    def test_one_round_for_a_batch(self):
+        self.start(batch_window=0.05)
+        self.assertTrue(all(self.write_all(10)))
+        self.assertEqual(self.rounds_committed(), 1)
+        # the other replicas are written after the client has been answered
+        self.wait(asyncio.sleep(0.05, loop=self.loop))
+        for i in range(10):
+            self.assertEqual(self.nodes[8].store['k%d' % i].content, 'v%d' % i)
+
+    def test_batches_are_bounded(self):
+        self.start(batch_window=0.05, max_batch_size=4)
+        self.assertTrue(all(self.write_all(10)))
+        self.assertEqual(self.rounds_committed(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
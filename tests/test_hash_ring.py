@@ -0,0 +1,87 @@
+import unittest
+
+from HashRing import HashRing, group_name
+from Registry import ServerInfo
+
+
+def groups_of(count: int, size: int = 3):
+    return [[ServerInfo('10.0.%d.%d' % (g, i), 5000) for i in range(size)] for g in range(count)]
+
+
+class HashRingTest(unittest.TestCase):
+    def setUp(self):
+        self.groups = groups_of(9)
+        self.keys = ['key %d' % i for i in range(5000)]
+
+    def test_empty_ring_has_no_owner(self):
+        with self.assertRaises(ValueError):
+            HashRing().partition_of('key')
+
+    def test_every_ring_of_the_same_groups_agrees(self):
+        one = HashRing.of(self.groups)
+        other = HashRing.of(list(reversed(self.groups)))
+        self.assertEqual([one.partition_of(key) for key in self.keys], [other.partition_of(key) for key in self.keys])
+
+    def test_group_of_a_key(self):
+        ring = HashRing.of(self.groups)
+        name = ring.partition_of('key')
+        self.assertEqual(group_name(ring.group_of('key')), name)
+        self.assertEqual(ring.members[name], frozenset(ring.group_of('key')))
+        self.assertEqual(len(ring), 9)
+        self.assertIn(name, ring)
+
+    def test_adding_a_group_only_moves_keys_to_it(self):
+        ring = HashRing.of(self.groups[:8])
+        before = [ring.partition_of(key) for key in self.keys]
+        ring.add(self.groups[8])
+        after = [ring.partition_of(key) for key in self.keys]
+        new = group_name(self.groups[8])
+        moved = [new_owner for old, new_owner in zip(before, after) if old != new_owner]
+        self.assertTrue(all(owner == new for owner in moved))
+        # about 1/9 of the keys move
+        self.assertLess(abs(len(moved) / len(self.keys) - 1 / 9), 0.05)
+
+    def test_removing_a_group_gives_its_keys_back(self):
+        ring = HashRing.of(self.groups[:8])
+        before = [ring.partition_of(key) for key in self.keys]
+        ring.add(self.groups[8])
+        ring.remove(group_name(self.groups[8]))
+        self.assertEqual([ring.partition_of(key) for key in self.keys], before)
+        self.assertEqual(len(ring.points), 8 * ring.vnodes)
+        self.assertNotIn(group_name(self.groups[8]), ring)
+
+    def test_sources_of_an_added_group(self):
+        old = HashRing.of(self.groups[:8])
+        new = HashRing.of(self.groups)
+        name = group_name(self.groups[8])
+        sources = new.sources_of(name, old)
+        moved_from = {old.partition_of(key) for key in self.keys if new.partition_of(key) == name}
+        self.assertEqual(set(sources), moved_from)
+        # the groups which were there before only lose keys
+        for kept in self.groups[:8]:
+            self.assertEqual(new.sources_of(group_name(kept), old), [])
+
+    def test_sources_of_a_removed_group(self):
+        old = HashRing.of(self.groups)
+        new = HashRing.of(self.groups[:8])
+        gone = group_name(self.groups[8])
+        for group in self.groups[:8]:
+            name = group_name(group)
+            got_keys = any(old.partition_of(key) == gone and new.partition_of(key) == name for key in self.keys)
+            self.assertEqual(new.sources_of(name, old), [gone] if got_keys else [])
+
+    def test_sources_of_the_first_ring(self):
+        self.assertEqual(HashRing.of(self.groups).sources_of(group_name(self.groups[0]), None), [])
+        one = HashRing.of(self.groups[:1])
+        self.assertEqual(one.sources_of(group_name(self.groups[0]), HashRing.of(self.groups[1:2])),
+                         [group_name(self.groups[1])])
+
+    def test_keys_are_spread_over_the_groups(self):
+        ring = HashRing.of(self.groups, vnodes=256)
+        owners = [ring.partition_of(key) for key in self.keys]
+        largest = max(owners.count(name) for name in ring.groups) / len(self.keys)
+        self.assertLess(largest, 2 / 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from tests.cluster import ClusterTestCase
+
+
+class HedgingTest(ClusterTestCase):
+    """the writes go to node 0, which asks node 1 before node 2 in its own group, since neither has answered yet"""
+    network = '10.12.0.%d'
+
+    def start(self, **options):
+        super().start(heartbeat_interval=60.0, **options)
+
+    def timed_write(self) -> (bool, float):
+        started = self.loop.time()
+        accepted = self.wait(self.client.write('v', key='k'))
+        return accepted, self.loop.time() - started
+
+    def test_spare_is_asked_when_a_member_is_slow(self):
+        self.start(hedge_delay=0.05, level_timeout=5.0)
+        # frames to and from node 1 are lost, such that it never answers
+        self.transport.partition([self.servers[1]])
+        accepted, seconds = self.timed_write()
+        self.assertTrue(accepted)
+        self.assertLess(seconds, 1.0)
+
+    def test_spare_is_asked_right_away_when_a_member_is_down(self):
+        self.start(hedge_delay=5.0, level_timeout=10.0)
+        self.kill(1)
+        accepted, seconds = self.timed_write()
+        self.assertTrue(accepted)
+        self.assertLess(seconds, 1.0)
+
+    def test_fails_once_no_majority_is_left(self):
+        self.start(hedge_delay=0.05, level_timeout=0.2)
+        # the other two groups of the top level are cut off, and node 0 can not make up a majority without them
+        self.transport.partition(self.servers[3:])
+        accepted, seconds = self.timed_write()
+        self.assertFalse(accepted)
+        # the top level gives up after two level timeouts
+        self.assertLess(seconds, 1.0)
+        self.assertEqual(len(self.nodes[0].rounds), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
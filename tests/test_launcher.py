@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+
+from DataRepClient import DataRepClient
+from Launcher import Launcher
+from Registry import ServerInfo
+
+
+class LauncherTest(unittest.TestCase):
+    def config(self, base_port: int) -> dict:
+        return {
+            'kind': 'datarep',
+            'addresses': [('127.0.0.1', base_port + i) for i in range(9)],
+            'fanout': 3,
+            'options': {'send_delay': 0},
+            'frontend_offset': 1000,
+        }
+
+    def test_shares_are_neighbours(self):
+        launcher = Launcher(self.config(24100), 4)
+        self.assertEqual(sum(launcher.shares, []), list(range(9)))
+        for share in launcher.shares:
+            self.assertEqual(share, list(range(share[0], share[-1] + 1)))
+
+    def test_public_address(self):
+        self.assertEqual(Launcher(self.config(24100), 2).public_address(3), ('127.0.0.1', 24103))
+        self.assertEqual(Launcher(self.config(24100), 2, frontends=1).public_address(3), ('127.0.0.1', 25103))
+
+    def test_writes_through_frontends(self):
+        launcher = Launcher(self.config(24200), 3, frontends=2)
+        launcher.start()
+        loop = asyncio.new_event_loop()
+        client = DataRepClient([ServerInfo(*launcher.public_address(i)) for i in range(3)], loop, timeout=10.0)
+        try:
+            self.assertTrue(loop.run_until_complete(client.write('spread', key='k')))
+            self.assertEqual(loop.run_until_complete(client.read('k')).content, 'spread')
+            self.assertIsInstance(loop.run_until_complete(client.stats(client.nodes[0])), dict)
+        finally:
+            client.close()
+            loop.run_until_complete(asyncio.sleep(0.01, loop=loop))
+            loop.close()
+            launcher.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
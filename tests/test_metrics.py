@@ -0,0 +1,74 @@
+import asyncio
+import random
+import unittest
+
+from Metrics import Histogram, Metrics, bucket_of, bucket_value
+
+
+class BucketTest(unittest.TestCase):
+    def test_buckets_are_ordered_and_close(self):
+        previous = -1
+        for value in list(range(2000)) + [random.Random(1).randrange(1 << 40) for i in range(2000)]:
+            bucket = bucket_of(value)
+            self.assertEqual(bucket_of(bucket_value(bucket)), bucket)
+            self.assertLessEqual(abs(bucket_value(bucket) - value), max(1, value / 32))
+        for value in range(0, 1 << 20, 97):
+            self.assertGreaterEqual(bucket_of(value), previous)
+            previous = bucket_of(value)
+
+
+class HistogramTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(2)
+        self.values = [rng.uniform(0.001, 0.1) for i in range(10000)]
+        self.histogram = Histogram()
+        for value in self.values:
+            self.histogram.record(value)
+
+    def test_percentiles_are_close(self):
+        ordered = sorted(self.values)
+        for p in [0.5, 0.9, 0.99]:
+            exact = ordered[int(len(ordered) * p) - 1]
+            self.assertAlmostEqual(self.histogram.percentile(p), exact, delta=exact * 0.05)
+
+    def test_summary(self):
+        summary = self.histogram.to_dict()
+        self.assertEqual(summary['count'], 10000)
+        self.assertEqual(summary['min'], min(self.values))
+        self.assertEqual(summary['max'], max(self.values))
+        self.assertAlmostEqual(summary['mean'], sum(self.values) / len(self.values))
+
+    def test_merge(self):
+        one, other = Histogram(), Histogram()
+        for i, value in enumerate(self.values):
+            (one if i % 2 == 0 else other).record(value)
+        one.merge(other)
+        merged, whole = one.to_dict(), self.histogram.to_dict()
+        self.assertAlmostEqual(merged.pop('mean'), whole.pop('mean'))
+        self.assertEqual(merged, whole)
+
+    def test_empty(self):
+        self.assertEqual(Histogram().to_dict()['p99'], 0.0)
+        self.assertEqual(Histogram().to_dict()['min'], 0.0)
+
+
+class MetricsTest(unittest.TestCase):
+    def test_counts_messages_and_loop_lag(self):
+        loop = asyncio.new_event_loop()
+        metrics = Metrics(loop, lag_interval=0.01)
+        metrics.received('QuorumRequest', 100, 0.001)
+        metrics.received('QuorumRequest', 50)
+        metrics.sent('QuorumResponse', 20, 0.002)
+        loop.run_until_complete(asyncio.sleep(0.05, loop=loop))
+        metrics.close()
+        loop.close()
+        stats = metrics.to_dict()
+        self.assertEqual(stats['messages_in'], {'QuorumRequest': 2})
+        self.assertEqual(stats['bytes_in'], {'QuorumRequest': 150})
+        self.assertEqual(stats['messages_out'], {'QuorumResponse': 1})
+        self.assertEqual(stats['seconds']['decode']['count'], 1)
+        self.assertGreater(stats['seconds']['loop_lag']['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import asyncio
+import math
+import unittest
+
+import QuorumBenchmark
+
+
+class QuorumBenchmarkTest(unittest.TestCase):
+    def test_percentile(self):
+        self.assertTrue(math.isnan(QuorumBenchmark.percentile([], 0.5)))
+        latencies = [float(i) for i in range(100, 0, -1)]
+        self.assertEqual(QuorumBenchmark.percentile(latencies, 0.0), 1.0)
+        self.assertEqual(QuorumBenchmark.percentile(latencies, 0.5), 51.0)
+        self.assertEqual(QuorumBenchmark.percentile(latencies, 0.99), 100.0)
+        self.assertEqual(QuorumBenchmark.percentile(latencies, 1.0), 100.0)
+
+    def test_run(self):
+        loop = asyncio.new_event_loop()
+        try:
+            for partitioned in (False, True):
+                result = QuorumBenchmark.run(9, 3, 50, 0, 0, 0.005, 10.0, loop, base_port=24400,
+                                             partitioned=partitioned, keys=8)
+                self.assertEqual((result['committed'], result['lost']), (50, 0))
+                self.assertEqual(result['depth'], 2)
+                self.assertLessEqual(result['latency_p50_ms'], result['latency_p99_ms'])
+                self.assertIn('commit', result['node_seconds'])
+        finally:
+            loop.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+
+from HashRing import HashRing, group_name
+from Registry import ServerInfo
+from tests.cluster import ClusterTestCase
+
+
+class RebalancingTest(ClusterTestCase):
+    """three groups of three nodes, where the keys are spread over the groups in the ring"""
+    network = '10.13.0.%d'
+
+    def groups(self):
+        """the bottom level groups of the tree, which start builds on the same addresses"""
+        servers = [ServerInfo(self.network % i, 5000) for i in range(9)]
+        return [servers[i:i + 3] for i in range(0, 9, 3)]
+
+    def write_keys(self, count: int = 60) -> list:
+        keys = ['key %d' % i for i in range(count)]
+        writes = [self.client.write('value of %s' % key, key=key) for key in keys]
+        self.assertTrue(all(self.wait(asyncio.gather(*writes, loop=self.loop))))
+        return keys
+
+    def rebalance(self, ring: HashRing):
+        pulls = self.wait(asyncio.gather(*[node.update_ring(ring) for node in self.nodes], loop=self.loop))
+        self.assertTrue(all(all(pulled) for pulled in pulls))
+
+    def assert_owned(self, ring: HashRing, keys: list):
+        for key in keys:
+            for member in ring.group_of(key):
+                self.assertEqual(self.nodes[self.servers.index(member)].store[key].content, 'value of %s' % key)
+            self.assertEqual(self.wait(self.client.read(key)).content, 'value of %s' % key)
+
+    def test_group_joins(self):
+        # the nodes of the joining group are started with the old ring, like the rest
+        self.start(ring=HashRing.of(self.groups()[:2]))
+        keys = self.write_keys()
+        new = HashRing.of(self.groups())
+        joined = group_name(self.groups()[2])
+        moved = [key for key in keys if new.partition_of(key) == joined]
+        self.assertGreater(len(moved), 0)
+        self.rebalance(new)
+        self.assert_owned(new, keys)
+
+    def test_group_leaves(self):
+        self.start(ring=HashRing.of(self.groups()))
+        keys = self.write_keys()
+        new = HashRing.of(self.groups()[:2])
+        self.rebalance(new)
+        self.assert_owned(new, keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
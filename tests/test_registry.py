@@ -0,0 +1,34 @@
+import pickle
+import unittest
+
+from Registry import ServerInfo, server_of, known_servers, members_of
+
+
+class RegistryTest(unittest.TestCase):
+    def test_one_server_info_per_address(self):
+        self.assertIs(ServerInfo('10.1.0.1', 7000), ServerInfo('10.1.0.1', 7000))
+        self.assertIsNot(ServerInfo('10.1.0.1', 7000), ServerInfo('10.1.0.1', 7001))
+
+    def test_ids_look_up_the_server(self):
+        info = ServerInfo('10.1.0.2', 7000)
+        self.assertIs(server_of(info.node), info)
+        self.assertLess(info.node, known_servers())
+        self.assertNotEqual(ServerInfo('10.1.0.3', 7000).node, info.node)
+
+    def test_unpickling_gives_the_interned_server_info(self):
+        info = ServerInfo('10.1.0.4', 7000)
+        self.assertIs(pickle.loads(pickle.dumps(info)), info)
+
+    def test_equality_and_hash_follow_the_address(self):
+        info = ServerInfo('10.1.0.5', 7000)
+        self.assertEqual({info: 1}[ServerInfo('10.1.0.5', 7000)], 1)
+        self.assertNotEqual(info, ('10.1.0.5', 7000))
+        self.assertEqual(str(info), '10.1.0.5:7000')
+
+    def test_members_of(self):
+        a, b, c = [ServerInfo('10.1.1.%d' % i, 7000) for i in range(3)]
+        self.assertEqual(members_of([[a, b], [a, c]]), [frozenset([a, b]), frozenset([a, c])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import asyncio
+import gc
+import unittest
+
+from Framing import Frame
+from SendQueues import SendQueues, MessageDropped, CONTROL, DATA, BULK
+
+
+class SlowPool:
+    """a pool without open connections, whose sends wait until they are let through"""
+    def __init__(self, loop):
+        self.loop = loop
+        self.sent = []
+        self.gate = asyncio.Event(loop=loop)
+
+    def open_connection(self, recipient):
+        return None
+
+    @asyncio.coroutine
+    def send(self, recipient, tag: int, payload: bytes):
+        yield from self.gate.wait()
+        self.sent.append(payload)
+
+
+class OpenConnection:
+    def __init__(self):
+        self.frames = []
+
+    def buffered(self) -> int:
+        return 0
+
+    def write(self, frame: Frame):
+        self.frames.append(frame.payload)
+
+
+class SendQueuesTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.pool = SlowPool(self.loop)
+        self.queues = SendQueues(self.pool, self.loop, max_messages=3, max_bytes=100)
+
+    def tearDown(self):
+        self.queues.close()
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.loop.close()
+
+    def flush(self):
+        self.pool.gate.set()
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+
+    def test_control_overtakes_data(self):
+        self.queues.send('peer', 1, b'data 1', DATA)
+        self.queues.send('peer', 1, b'data 2', DATA)
+        self.queues.send('peer', 1, b'vote', CONTROL)
+        self.flush()
+        self.assertEqual(self.pool.sent, [b'vote', b'data 1', b'data 2'])
+
+    def test_full_queue_drops_less_important_messages_first(self):
+        bulk = self.queues.send('peer', 1, b'bulk', BULK)
+        data = [self.queues.send('peer', 1, b'data', DATA) for i in range(2)]
+        vote = self.queues.send('peer', 1, b'vote', CONTROL)
+        self.assertIsInstance(bulk.exception(), MessageDropped)
+        dropped = self.queues.send('peer', 1, b'more data', DATA)
+        self.assertIsInstance(dropped.exception(), MessageDropped)
+        self.flush()
+        self.assertTrue(all(future.done() and future.exception() is None for future in data + [vote]))
+        self.assertEqual(self.queues.stats()['dropped'], {'control': 0, 'data': 1, 'bulk': 1})
+
+    def test_byte_bound(self):
+        self.queues.send('peer', 1, b'x' * 80, DATA)
+        self.queues.send('peer', 1, b'x' * 10, DATA)
+        self.assertIsInstance(self.queues.send('peer', 1, b'x' * 20, DATA).exception(), MessageDropped)
+        self.assertEqual(self.queues.depth(), (2, 90))
+
+    def test_put_waits_for_room(self):
+        for i in range(3):
+            self.queues.send('peer', 1, b'data', DATA)
+        put = asyncio.async(self.queues.put('peer', 1, b'bulk'), loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertFalse(put.done())
+        self.flush()
+        self.loop.run_until_complete(put)
+        self.assertEqual(self.pool.sent[-1], b'bulk')
+
+    def test_open_connection_is_written_right_away(self):
+        conn = OpenConnection()
+        self.pool.open_connection = lambda recipient: conn
+        future = self.queues.send('peer', 1, b'now', DATA)
+        self.assertTrue(future.done())
+        self.assertEqual(conn.frames, [b'now'])
+
+    def test_close_fails_the_queued_messages(self):
+        futures = [self.queues.send('peer', 1, b'data', DATA) for i in range(3)]
+        self.queues.close()
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        self.assertTrue(all(isinstance(future.exception(), MessageDropped) for future in futures))
+
+    def test_close_does_not_leave_unretrieved_exceptions(self):
+        errors = []
+        self.loop.set_exception_handler(lambda loop, context: errors.append(context))
+        for i in range(3):
+            self.queues.send('peer', 1, b'data', DATA)
+        self.queues.close()
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        gc.collect()
+        self.assertEqual(errors, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+
+import Topology
+
+
+class NetworkStructuresTest(unittest.TestCase):
+    def check_invariants(self, size: int, fanout):
+        servers = list(range(size))
+        structures = Topology.network_structures(servers, fanout)
+        self.assertEqual(len(structures), size)
+        depth = len(structures[0])
+        bottoms = set()
+        for server, structure in zip(servers, structures):
+            self.assertEqual(len(structure), depth)
+            for group in structure:
+                self.assertIn(server, group)
+                if size >= 3:
+                    # a group of two needs both members, so one dead server would block every round
+                    self.assertNotEqual(len(group), 2, (size, fanout, structure))
+                    if len(group) == 1:
+                        self.assertEqual(group, [server])
+            bottoms.add(tuple(structure[-1]))
+        # the bottom groups hold every server exactly once
+        self.assertEqual(sorted(s for group in bottoms for s in group), servers)
+        # the members of a bottom group are part of the same groups above it, apart from whom they represent
+        for structure in structures:
+            for other in structure[-1]:
+                for group, others in zip(structure[:-1], structures[other][:-1]):
+                    self.assertEqual(len(group), len(others))
+
+    def test_invariants(self):
+        for fanout in [2, 3, 4, 5, None]:
+            for size in list(range(1, 40)) + [81, 100, 243, 1000]:
+                self.check_invariants(size, fanout)
+
+    def test_full_tree(self):
+        structures = Topology.network_structures(list(range(27)))
+        self.assertEqual(structures[4], [[4, 9, 18], [0, 4, 6], [3, 4, 5]])
+
+    def test_leftover_servers_join_a_neighbouring_group(self):
+        self.assertEqual(Topology.network_structures(list(range(4))), [[[i], [0, 1, 2, 3]] for i in range(4)])
+        self.assertEqual(Topology.network_structures(list(range(10)))[0], [[0, 4, 7], [0], [0, 1, 2, 3]])
+
+    def test_rejects_small_fanouts(self):
+        for fanout in [0, 1]:
+            with self.assertRaises(ValueError):
+                Topology.network_structures(list(range(9)), fanout)
+
+    def test_rejects_too_few_levels(self):
+        with self.assertRaises(ValueError):
+            Topology.network_structures(list(range(10)), 3, depth=2)
+
+
+class BestFanoutTest(unittest.TestCase):
+    def test_never_below_three(self):
+        for size in [1, 2, 3, 9, 27, 100, 1000, 10000]:
+            self.assertGreaterEqual(Topology.best_fanout(size), 3)
+
+    def test_depends_on_the_size(self):
+        self.assertGreater(len({Topology.best_fanout(size) for size in [9, 27, 100, 1000]}), 1)
+
+    def test_latency_grows_with_depth(self):
+        self.assertLess(Topology.quorum_latency(9, 3), Topology.quorum_latency(27, 3))
+
+
+class RebuildTest(unittest.TestCase):
+    def test_replacing_a_server_only_changes_its_group(self):
+        servers = list(range(27))
+        order, changed = Topology.rebuild(servers, [100], [4])
+        self.assertEqual(order[4], 100)
+        self.assertEqual(set(changed), {3, 100, 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+from Framing import Frame
+from Registry import ServerInfo
+from Transport import LoopbackTransport, constant
+
+
+class LoopbackTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.transport = LoopbackTransport(self.loop, latency=constant(0.001), seed=1)
+        self.a = ServerInfo('127.0.0.1', 9001)
+        self.b = ServerInfo('127.0.0.1', 9002)
+        self.received = []
+        self.server = self.loop.run_until_complete(
+            self.transport.serve(self.b, lambda conn, frame: self.received.append(frame.payload)))
+        self.conn = self.loop.run_until_complete(self.transport.connect(self.a, self.b, lambda conn, frame: None))
+
+    def tearDown(self):
+        self.conn.close()
+        self.server.close()
+        self.loop.close()
+
+    def send(self, payload: bytes):
+        self.conn.write(Frame(1, payload))
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+
+    def test_delivers_in_order(self):
+        for i in range(5):
+            self.conn.write(Frame(1, bytes([i])))
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertEqual(self.received, [bytes([i]) for i in range(5)])
+
+    def test_partition_cuts_off_an_open_connection(self):
+        self.send(b'before')
+        self.transport.partition([self.b])
+        self.send(b'during')
+        self.assertEqual(self.received, [b'before'])
+        self.assertEqual(self.transport.lost, 1)
+        self.transport.heal()
+        self.send(b'after')
+        self.assertEqual(self.received, [b'before', b'after'])
+
+    def test_partition_loses_the_frames_in_flight(self):
+        self.conn.write(Frame(1, b'in flight'))
+        self.transport.partition([self.a])
+        self.loop.run_until_complete(asyncio.sleep(0.01, loop=self.loop))
+        self.assertEqual(self.received, [])
+        self.assertEqual(self.transport.lost, 1)
+
+    def test_servers_in_the_same_partition_reach_each_other(self):
+        self.transport.partition([self.a, self.b])
+        self.send(b'inside')
+        self.assertEqual(self.received, [b'inside'])
+
+
+if __name__ == '__main__':
+    unittest.main()
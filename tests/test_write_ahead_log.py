@@ -0,0 +1,99 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+
+from DataRepMessages import Data
+from WriteAheadLog import WriteAheadLog
+
+
+class WriteAheadLogTest(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.directory)
+
+    def open_wal(self, **kwargs) -> WriteAheadLog:
+        wal = WriteAheadLog(self.directory, self.loop, **kwargs)
+        self.recovered = wal.recover()
+        return wal
+
+    def write(self, wal: WriteAheadLog, *versions: int):
+        for version in versions:
+            self.loop.run_until_complete(wal.append([Data('v%d' % version, version, key='k%d' % (version % 3))]))
+
+    def test_recovers_the_newest_data_of_every_key(self):
+        wal = self.open_wal()
+        self.write(wal, 1, 2, 3, 4)
+        wal.close()
+
+        self.open_wal().close()
+        self.assertEqual({key: data.version_number for key, data in self.recovered.items()},
+                         {'k0': 3, 'k1': 4, 'k2': 2})
+
+    def test_cuts_off_a_torn_record(self):
+        wal = self.open_wal()
+        self.write(wal, 1, 2)
+        wal.close()
+        log_path = os.path.join(self.directory, 'log')
+        intact = os.path.getsize(log_path)
+        with open(log_path, 'ab') as f:
+            f.write(b'\x00\x00\x01\x00torn')
+
+        wal = self.open_wal()
+        self.assertEqual(os.path.getsize(log_path), intact)
+        self.write(wal, 3)
+        wal.close()
+
+        self.open_wal().close()
+        self.assertEqual(sorted(data.version_number for data in self.recovered.values()), [1, 2, 3])
+
+    def test_snapshot_keeps_the_records_appended_while_it_is_written(self):
+        wal = self.open_wal(sync_policy='always')
+        store = {}
+        for version in range(1, 6):
+            data = Data('v%d' % version, version, key='k%d' % version)
+            store[data.key] = data
+            self.loop.run_until_complete(wal.append([data]))
+        snapshot = wal.snapshot(store)
+        self.assertFalse(wal.needs_snapshot())
+        # appended before the snapshot got to copy the store
+        late = Data('late', 6, key='late')
+        store[late.key] = late
+        wal.append([late])
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
+        # appended after it
+        later = Data('later', 7, key='later')
+        self.loop.run_until_complete(wal.append([later]))
+        self.loop.run_until_complete(snapshot)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'log.old')))
+        self.assertEqual(wal.records, 1)
+        wal.close()
+
+        self.open_wal().close()
+        self.assertEqual(sorted(data.version_number for data in self.recovered.values()), [1, 2, 3, 4, 5, 6, 7])
+
+    def test_recovers_the_log_set_aside_by_an_interrupted_snapshot(self):
+        wal = self.open_wal()
+        self.write(wal, 1, 2)
+        wal.close()
+        os.replace(os.path.join(self.directory, 'log'), os.path.join(self.directory, 'log.old'))
+        wal = self.open_wal()
+        self.write(wal, 3)
+        wal.close()
+
+        self.open_wal().close()
+        self.assertEqual(sorted(data.version_number for data in self.recovered.values()), [1, 2, 3])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'log.old')))
+
+    def test_rejects_an_unknown_sync_policy(self):
+        with self.assertRaises(ValueError):
+            WriteAheadLog(self.directory, self.loop, 'sometimes')
+
+
+if __name__ == '__main__':
+    unittest.main()
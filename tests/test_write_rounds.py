@@ -0,0 +1,25 @@
+import asyncio
+import unittest
+
+from tests.cluster import ClusterTestCase
+
+
+class WriteRoundsTest(ClusterTestCase):
+    network = '10.11.0.%d'
+
+    def rounds_committed(self) -> int:
+        return self.nodes[0].metrics.histograms['commit'].count
+
+    def test_rounds_overlap(self):
+        self.start(batch_window=0.0, max_batch_size=1)
+        writes = [asyncio.async(self.client.write('v%d' % i, key='k%d' % i), loop=self.loop) for i in range(5)]
+        while len(self.nodes[0].rounds) < 2 and not all(write.done() for write in writes):
+            self.wait(asyncio.sleep(0.0001, loop=self.loop))
+        self.assertGreater(len(self.nodes[0].rounds), 1)
+        self.assertTrue(all(self.wait(asyncio.gather(*writes, loop=self.loop))))
+        self.assertEqual(self.rounds_committed(), 5)
+        self.assertEqual(len(self.nodes[0].rounds), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()